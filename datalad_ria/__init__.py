@@ -29,6 +29,202 @@ command_suite = (
 # patch datalad-core
 import datalad_ria.patches.enabled
 
+# register additional configuration items in datalad-core
+from datalad.support.extensions import register_config
+from datalad_next.constraints import (
+    EnsureChoice,
+    EnsureFloat,
+    EnsureInt,
+    EnsureRange,
+    EnsureStr,
+)
+register_config(
+    'datalad.ria.ssh-control-persist',
+    'Lifetime of idle shared SSH connections',
+    description='Duration (in the format of the SSH ``ControlPersist`` '
+    'option, e.g. ``15m``) for which a shared SSH ControlMaster process '
+    'is kept running after the last process using it has finished. '
+    'This enables subsequent git-annex and DataLad calls to reuse an '
+    'already authenticated connection. Set to ``no`` to stop a '
+    'ControlMaster as soon as it is no longer in use.',
+    type=EnsureStr(),
+    default='15m',
+    dialog='question',
+)
+register_config(
+    'datalad.ria.ssh-channels',
+    'Maximum number of parallel SSH channels per store host',
+    description='Upper bound for the number of concurrent transfers '
+    'to or from a single RIA store host. All channels share one '
+    'SSH connection. The actual number of channels is adjusted to the '
+    'measured throughput. The SSH server must permit at least this many '
+    'sessions per connection (``MaxSessions``, default 10).',
+    type=EnsureInt() & EnsureRange(min=1),
+    default=4,
+    dialog='question',
+)
+register_config(
+    'datalad.ria.progress-interval',
+    'Minimum interval between transfer progress reports (in seconds)',
+    description='Progress of RIA store transfers is reported whenever '
+    'this interval has passed, or at least 1% of the total size has '
+    'been transferred since the last report.',
+    type=EnsureFloat() & EnsureRange(min=0),
+    default=0.5,
+    dialog='question',
+)
+register_config(
+    'datalad.ria.layout-cache-ttl',
+    'Lifetime of cached RIA store layout information (in seconds)',
+    description='The layout versions of RIA stores and the datasets in '
+    'them are cached, such that they need not be read from the store '
+    'on every start of a special remote. Set to 0 to disable caching.',
+    type=EnsureFloat() & EnsureRange(min=0),
+    default=3600.0,
+    dialog='question',
+)
+register_config(
+    'datalad.ria.mirror-stats-ttl',
+    'Lifetime of cached RIA store mirror measurements (in seconds)',
+    description='Round-trip times and throughput measured for the '
+    'mirrors of a RIA store are cached, such that the fastest mirror is '
+    'known on the next start of a special remote. Older measurements are '
+    'discarded, and mirrors are measured again.',
+    type=EnsureFloat() & EnsureRange(min=0),
+    default=86400.0,
+    dialog='question',
+)
+register_config(
+    'datalad.ria.async-jobs',
+    'Maximum number of concurrent jobs in a single ORA2 special remote '
+    'process',
+    description='With the ASYNC extension of the special remote protocol, '
+    'git-annex sends the requests of all concurrent jobs (``-J``) to a '
+    'single special remote process, which shares caches and connections '
+    'among them. This setting limits the number of jobs the process '
+    'works on at the same time. Set to 0 to not use the ASYNC extension, '
+    'and have git-annex start one process per job.',
+    type=EnsureInt() & EnsureRange(min=0),
+    default=8,
+    dialog='question',
+)
+register_config(
+    'datalad.ria.http-retries',
+    'Number of immediate retries of interrupted RIA store HTTP downloads',
+    description='A download from a ``ria+http(s)://`` store that is '
+    'interrupted is resumed with a range request for the missing content, '
+    'up to this many times in a row. A download that still fails is '
+    'resumed by the next retrieval of the same key.',
+    type=EnsureInt() & EnsureRange(min=0),
+    default=3,
+    dialog='question',
+)
+register_config(
+    'datalad.ria.http-connections',
+    'Maximum number of parallel HTTP connections per RIA store origin',
+    description='Requests to a ``ria+http(s)://`` store reuse a pool of '
+    'keep-alive connections for the lifetime of a special remote process. '
+    'This is the size of the pool, i.e. the number of concurrent requests '
+    '(e.g., of ``git annex get -J<n>``) to a single server. Any further '
+    'request waits for a free connection.',
+    type=EnsureInt() & EnsureRange(min=1),
+    default=8,
+    dialog='question',
+)
+register_config(
+    'datalad.ria.http-ranges',
+    'Number of concurrent byte ranges of a RIA store download via HTTP',
+    description='Large keys are downloaded from ``ria+http(s)://`` stores '
+    'in this many byte ranges at the same time, each over its own '
+    'connection, if the server supports range requests. Set to 1 to '
+    'always download with a single request.',
+    type=EnsureInt() & EnsureRange(min=1),
+    default=4,
+    dialog='question',
+)
+register_config(
+    'datalad.ria.http-ranges-min-size',
+    'Minimum size of a RIA store download via HTTP in concurrent ranges',
+    description='Only keys of at least this size (in bytes) are '
+    'downloaded from ``ria+http(s)://`` stores in concurrent byte ranges '
+    '(see ``datalad.ria.http-ranges``).',
+    type=EnsureInt() & EnsureRange(min=0),
+    default=64 * 1024 * 1024,
+    dialog='question',
+)
+register_config(
+    'datalad.ria.key-manifest',
+    'Use of the key manifest of a dataset in a RIA store for presence checks',
+    description='The ORA2 special remote records the keys it stores in, '
+    'and removes from a dataset in a RIA store in a manifest in the store. '
+    'With ``absent``, a key missing from the manifest is reported as not '
+    'present without asking the store. With ``yes``, a key listed in the '
+    'manifest is also reported as present without asking the store. This '
+    'is only safe, if no other tool modifies the store, because git-annex '
+    'relies on a positive presence check when dropping content. With '
+    '``no``, the manifest is neither used nor maintained, and presence is '
+    'always checked in the store.',
+    type=EnsureChoice('no', 'absent', 'yes'),
+    default='no',
+    dialog='question',
+)
+register_config(
+    'datalad.ria.prefetch-list',
+    'File with the keys to prefetch from RIA stores, in order of retrieval',
+    description='If set, the ORA2 special remote retrieves the keys that '
+    'follow the one git-annex requests in this list (one key per line, '
+    'a path relative to the dataset root) in the background, while '
+    'git-annex processes the current one. Such a list can be created with '
+    '``git annex find --not --in here --format=\'${key}\\n\' <paths>``, '
+    'for the same paths as a subsequent ``git annex get``.',
+    type=EnsureStr(),
+    default=None,
+    dialog='question',
+)
+register_config(
+    'datalad.ria.prefetch-depth',
+    'Number of keys the ORA2 special remote prefetches ahead',
+    description='Maximum number of keys following the requested one in '
+    '``datalad.ria.prefetch-list`` that are retrieved in the background.',
+    type=EnsureInt() & EnsureRange(min=1),
+    default=4,
+    dialog='question',
+)
+register_config(
+    'datalad.ria.prefetch-jobs',
+    'Number of keys the ORA2 special remote prefetches concurrently',
+    description='Maximum number of keys from ``datalad.ria.prefetch-list`` '
+    'that are retrieved in parallel. With 0, this is the number of '
+    '``datalad.ria.ssh-channels``. For RIA stores accessed via SSH, the '
+    'actual number of parallel transfers is additionally adjusted to the '
+    'measured throughput.',
+    type=EnsureInt() & EnsureRange(min=0),
+    default=0,
+    dialog='question',
+)
+register_config(
+    'datalad.ria.prefetch-size',
+    'Maximum total size of keys prefetched from RIA stores (in bytes)',
+    description='Prefetched content is staged in ``.git/annex/tmp`` until '
+    'git-annex requests it. Its total size is kept below this limit, and '
+    'keys of unknown size are not prefetched. Set to 0 for no limit.',
+    type=EnsureInt() & EnsureRange(min=0),
+    default=1024 * 1024 * 1024,
+    dialog='question',
+)
+register_config(
+    'datalad.ria.stats-file',
+    'File to append ORA2 special remote statistics to',
+    description='On exit, an ORA2 special remote process logs statistics '
+    'of its operations (keys and bytes transferred, time spent connecting, '
+    'transferring, and verifying, retries, cache hit rates) as a DEBUG '
+    'message. If this is set, the same record is appended as a line of '
+    'JSON to this file, for aggregation across many processes.',
+    type=EnsureStr(),
+    default=None,
+    dialog='question',
+)
+
 from ._version import get_versions
 __version__ = get_versions()['version']
 del get_versions
@@ -0,0 +1,220 @@
+"""Support for the ASYNC extension of the external special remote protocol
+
+By default, git-annex starts one special remote process for each
+concurrent job (``annex.jobs``, ``-J``). Each of these processes pays the
+startup cost, runs ``PREPARE``, and builds its own caches and connections.
+
+With the ``ASYNC`` protocol extension, git-annex instead sends the
+requests of all jobs to a single process. Each message is prefixed with
+``J <n>``, where ``<n>`` identifies a job. A job has at most one request
+in flight, but requests of different jobs can be processed concurrently.
+Any message a special remote sends on behalf of a job (replies, but also
+requests like ``GETCONFIG``, and ``PROGRESS``) must carry the same prefix.
+
+:class:`AsyncMaster` is a drop-in replacement for ``annexremote.Master``
+that implements this extension. Requests of jobs are processed by a
+bounded pool of worker threads. The special remote implementation must be
+thread-safe.
+
+See the ASYNC appendix of the protocol documentation at
+https://git-annex.branchable.com/design/external_special_remote_protocol/
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import queue
+import sys
+import threading
+import traceback
+
+from annexremote import (
+    Master,
+    Protocol,
+    UnexpectedMessage,
+    UnsupportedRequest,
+)
+
+
+class AsyncProtocol(Protocol):
+    """``Protocol`` that negotiates the ASYNC extension
+
+    ``PREPARE`` is performed only once, even when it is sent by each job.
+    """
+    def __init__(self, remote, master):
+        super().__init__(remote)
+        self._master = master
+        self._prepare_lock = threading.Lock()
+        self._prepare_reply = None
+
+    def do_EXTENSIONS(self, param):
+        super().do_EXTENSIONS(param)
+        if 'ASYNC' in self.extensions and self._master.max_jobs:
+            self._master.async_enabled = True
+            return 'EXTENSIONS ASYNC'
+        return 'EXTENSIONS'
+
+    def do_PREPARE(self):
+        with self._prepare_lock:
+            if self._prepare_reply != 'PREPARE-SUCCESS':
+                self._prepare_reply = super().do_PREPARE()
+            return self._prepare_reply
+
+
+class AsyncMaster(Master):
+    """``annexremote.Master`` with support for the ASYNC protocol extension
+
+    Parameters
+    ----------
+    output: io.TextIOBase
+      Where to send replies and special remote messages.
+    max_jobs: int, optional
+      Maximum number of jobs that are processed concurrently. Requests of
+      additional jobs wait for a free worker. If 0, the ASYNC extension is
+      not offered to git-annex. Defaults to the configuration
+      ``datalad.ria.async-jobs``.
+    """
+    def __init__(self, output=sys.stdout, max_jobs: int | None = None):
+        super().__init__(output=output)
+        if max_jobs is None:
+            from datalad import cfg
+            max_jobs = int(cfg.obtain('datalad.ria.async-jobs'))
+        self.max_jobs = max_jobs
+        self.async_enabled = False
+        self._local = threading.local()
+        self._send_lock = threading.Lock()
+        self._jobs_lock = threading.Lock()
+        self._abort_lock = threading.Lock()
+        # jobs with a request in progress, and the queue for any replies
+        # git-annex sends to requests of these jobs
+        self._busy_jobs = {}
+
+    def LinkRemote(self, remote):
+        super().LinkRemote(remote)
+        self.protocol = AsyncProtocol(remote, self)
+
+    @property
+    def _job(self) -> str | None:
+        return getattr(self._local, 'job', None)
+
+    def Listen(self, input=sys.stdin):
+        if not (hasattr(self, "remote") and hasattr(self, "protocol")):
+            # let the base class raise the appropriate exception
+            return super().Listen(input)
+
+        self.input = input
+        self._send(self.protocol.version)
+        executor = None
+        try:
+            while True:
+                line = self.input.readline()
+                if not line:
+                    break
+                line = line.rstrip()
+                if self.async_enabled and line.startswith('J '):
+                    _, job, request = line.split(' ', 2)
+                    with self._jobs_lock:
+                        replies = self._busy_jobs.get(job)
+                        if replies is None:
+                            self._busy_jobs[job] = queue.Queue()
+                    if replies is not None:
+                        # a reply to a request of a job
+                        replies.put(request)
+                        continue
+                    if executor is None:
+                        executor = ThreadPoolExecutor(
+                            max_workers=self.max_jobs,
+                            thread_name_prefix='annex-job',
+                        )
+                    executor.submit(self._process, job, request)
+                else:
+                    self._process(None, line)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+    def _process(self, job, request):
+        self._local.job = job
+        try:
+            reply = self.protocol.command(request)
+        except UnsupportedRequest:
+            reply = 'UNSUPPORTED-REQUEST'
+        except Exception as e:
+            for line in traceback.format_exc().splitlines():
+                self.debug(line)
+            self.error(e)
+            if job is None:
+                raise SystemExit
+            # there is no way to recover a job, and other jobs cannot be
+            # stopped from a worker thread. git-annex stops the special
+            # remote after an ERROR anyway.
+            self._abort()
+        finally:
+            if job is not None:
+                # the job is no longer busy before its reply is sent,
+                # otherwise the next request of the job could be taken
+                # for a reply
+                with self._jobs_lock:
+                    self._busy_jobs.pop(job, None)
+        if reply:
+            self._send(reply)
+        self._local.job = None
+
+    def _abort(self):
+        # exit the process from a worker thread, but stop the remote first,
+        # like the main loop would (e.g., to save caches). Only the first
+        # failing job gets to do it
+        with self._abort_lock:
+            stop = getattr(self.remote, 'stop', None)
+            if stop is not None:
+                try:
+                    stop()
+                except Exception as e:
+                    self.debug(f'Failed to stop the special remote: {e}')
+            self.output.flush()
+            os._exit(1)
+
+    def _readline(self) -> str:
+        job = self._job
+        if job is None:
+            return self.input.readline()
+        with self._jobs_lock:
+            replies = self._busy_jobs[job]
+        return replies.get()
+
+    def _ask(self, request, reply_keyword, reply_count):
+        self._send(request)
+        line = self._readline().rstrip().split(" ", reply_count)
+        if line and line[0] == reply_keyword:
+            line.extend([""] * (reply_count + 1 - len(line)))
+            return line[1:]
+        else:
+            raise UnexpectedMessage(
+                "Expected {reply_keyword} and {reply_count} values. "
+                "Got {line}".format(
+                    reply_keyword=reply_keyword,
+                    reply_count=reply_count,
+                    line=line))
+
+    def _askvalues(self, request):
+        self._send(request)
+        reply = []
+        while True:
+            line = self._readline().rstrip().split(" ", 1)
+            if len(line) == 2 and line[0] == "VALUE":
+                reply.append(line[1])
+            elif len(line) == 1 and line[0] == "VALUE":
+                return reply
+            else:
+                raise UnexpectedMessage("Expected VALUE {value}")
+
+    def _send(self, *args, **kwargs):
+        job = self._job
+        if job is not None:
+            # some replies (e.g. to LISTCONFIGS) have multiple lines,
+            # each of them needs the prefix
+            msg = ' '.join(str(a) for a in args)
+            args = ('\n'.join(f'J {job} {line}' for line in msg.split('\n')),)
+        with self._send_lock:
+            super()._send(*args, **kwargs)
@@ -0,0 +1,400 @@
+"""Access to annex keys in the archive of a dataset in a RIA store
+
+Keys of a dataset in a RIA store can be packed into a single archive at
+``<dataset>/archives/archive.7z`` (see ``datalad export-archive-ora``). The
+archive contains the same directory structure as the ``annex/objects`` tree
+of the dataset. Despite its name, the archive can be a 7z or a ZIP archive.
+
+Listing the archive members for every key query is expensive. Instead, the
+member list is read once and kept in a persistent index that maps each
+member to its location and size. The index is revalidated once per process
+against a cheap signature of the archive file (size and modification
+time), and only rebuilt if the archive changed.
+
+For ZIP archives, the member list is read from the central directory at the
+end of the archive, and individual members are extracted by reading only
+their byte range. No archive tool is needed on either end. For 7z archives,
+a ``7z`` executable is required where the archive is located (locally or on
+the SSH server), and members are extracted with ``7z x``.
+
+Archive access is supported for ``file://`` and ``ssh://`` store URLs.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+import io
+import logging
+from pathlib import (
+    Path,
+    PurePosixPath,
+)
+import shlex
+import struct
+import subprocess
+import threading
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+)
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+import zipfile
+import zlib
+
+from datalad_ria.cache import JsonFileCache
+from datalad_ria.sshio import popen_ssh
+
+lgr = logging.getLogger('datalad.ria.archive')
+
+# size of reads when parsing the central directory of a ZIP archive
+_INDEX_READ_SIZE = 1024 * 1024
+# size of chunks when extracting a member
+_CHUNK_SIZE = 1024 * 1024
+
+
+class RiaArchiveError(Exception):
+    """Raised when an archive exists, but cannot be read"""
+
+
+class RiaArchive:
+    """Index-backed read access to a RIA dataset archive
+
+    Parameters
+    ----------
+    url: str
+      URL of the archive file. ``file://`` and ``ssh://`` URLs are
+      supported.
+    url_handler: RiaUrlOperations
+      Used for access to ``ssh://`` URLs.
+    cache: JsonFileCache
+      Persistent storage for the member index.
+    """
+    def __init__(self, url: str, url_handler, cache: JsonFileCache):
+        self.url = url
+        self._cache = cache
+        scheme = urlparse(url).scheme
+        if scheme == 'file':
+            self._backend = _LocalArchiveFile(url)
+        elif scheme == 'ssh':
+            self._backend = _SshArchiveFile(
+                url_handler._get_handler(url), url)
+        else:
+            self._backend = None
+        self._members = None
+        self._members_lock = threading.Lock()
+
+    @property
+    def members(self) -> Dict[str, list]:
+        """Mapping of member names to ``[size, offset, csize, method, crc]``
+
+        ``offset`` is the position of a member's (local) header in a ZIP
+        archive, and ``csize`` its compressed size. ``offset``, ``csize``,
+        ``method`` (compression), and ``crc`` are ``None`` for 7z archives.
+        """
+        # concurrent jobs wait for a single index to be loaded
+        with self._members_lock:
+            if self._members is None:
+                self._members = self._load_index()
+            return self._members
+
+    def __contains__(self, member: str) -> bool:
+        return member in self.members
+
+    def extract(
+        self,
+        member: str,
+        dst: Path,
+        progress_cb: Callable[[int], None] | None = None,
+    ) -> None:
+        """Extract a single member into the file at ``dst``
+
+        Raises
+        ------
+        KeyError
+          If the member is not in the archive.
+        RiaArchiveError
+          If the member cannot be extracted.
+        """
+        size, offset, csize, method, crc = self.members[member]
+        if offset is None:
+            chunks = self._backend.extract_7z(member)
+        else:
+            chunks = self._iter_zip_member(offset, csize, method, crc)
+        received = 0
+        with open(dst, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                received += len(chunk)
+                if progress_cb:
+                    progress_cb(received)
+        if received != size:
+            raise RiaArchiveError(
+                f'Extracted {received} bytes of {member} from {self.url}, '
+                f'expected {size}')
+
+    def _load_index(self) -> Dict[str, list]:
+        if self._backend is None:
+            lgr.debug('No client-side archive access for %s', self.url)
+            return {}
+        signature = self._backend.signature()
+        if signature is None:
+            # no archive
+            return {}
+        cached = self._cache.get(self.url)
+        if cached is not None and cached['signature'] == signature:
+            return cached['members']
+        lgr.debug('Building member index of %s', self.url)
+        try:
+            members = self._read_zip_index()
+        except zipfile.BadZipFile:
+            members = self._backend.list_7z()
+        self._cache.set(self.url, dict(signature=signature, members=members))
+        return members
+
+    def _read_zip_index(self) -> Dict[str, list]:
+        reader = io.BufferedReader(
+            _RangeReader(self._backend), buffer_size=_INDEX_READ_SIZE)
+        with zipfile.ZipFile(reader) as zf:
+            return {
+                i.filename: [
+                    i.file_size, i.header_offset, i.compress_size,
+                    i.compress_type, i.CRC]
+                for i in zf.infolist()
+                if not i.is_dir()
+            }
+
+    def _iter_zip_member(self, offset, csize, method, crc) -> Iterator[bytes]:
+        if method == zipfile.ZIP_STORED:
+            decompressor = None
+        elif method == zipfile.ZIP_DEFLATED:
+            decompressor = zlib.decompressobj(-15)
+        else:
+            raise RiaArchiveError(
+                f'Unsupported ZIP compression method {method} in {self.url}')
+        # the local header has the same fixed size as in any ZIP archive,
+        # but the lengths of its variable fields can differ from the
+        # central directory
+        header = struct.unpack(
+            zipfile.structFileHeader,
+            self._backend.read(offset, zipfile.sizeFileHeader))
+        if header[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+            raise RiaArchiveError(f'Bad local ZIP header in {self.url}')
+        data_offset = offset + zipfile.sizeFileHeader \
+            + header[zipfile._FH_FILENAME_LENGTH] \
+            + header[zipfile._FH_EXTRA_FIELD_LENGTH]
+        checksum = 0
+        for chunk in self._backend.iter_range(data_offset, csize):
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            checksum = zlib.crc32(chunk, checksum)
+            yield chunk
+        if decompressor is not None:
+            chunk = decompressor.flush()
+            checksum = zlib.crc32(chunk, checksum)
+            yield chunk
+        if checksum != crc:
+            raise RiaArchiveError(f'CRC mismatch for a member of {self.url}')
+
+
+class _RangeReader(io.RawIOBase):
+    """Seekable, read-only file object over range reads of an archive file"""
+    def __init__(self, backend):
+        self._backend = backend
+        self._size = backend.size()
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = self._size + offset
+        return self._pos
+
+    def readinto(self, b):
+        n = min(len(b), self._size - self._pos)
+        if n <= 0:
+            return 0
+        data = self._backend.read(self._pos, n)
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+def _parse_7z_listing(out: str) -> Dict[str, list]:
+    # `7z l -slt` reports one block of 'Key = Value' lines per member,
+    # after a line of dashes
+    members = {}
+    _, _, listing = out.partition('\n----------\n')
+    for block in listing.split('\n\n'):
+        props = dict(
+            line.split(' = ', 1) for line in block.splitlines()
+            if ' = ' in line
+        )
+        if 'Path' not in props or props.get('Attributes', '').startswith('D'):
+            continue
+        members[props['Path']] = [
+            int(props.get('Size') or 0), None, None, None, None]
+    return members
+
+
+def _iter_stream(stream, size=None) -> Iterator[bytes]:
+    remaining = size
+    while remaining is None or remaining > 0:
+        chunk = stream.read(
+            _CHUNK_SIZE if remaining is None else min(_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+
+
+class _LocalArchiveFile:
+    def __init__(self, url):
+        self.path = Path(url2pathname(urlparse(url).path))
+
+    def signature(self):
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return f'{st.st_size} {st.st_mtime_ns}'
+
+    def size(self):
+        return self.path.stat().st_size
+
+    def read(self, offset, size):
+        with self.path.open('rb') as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def iter_range(self, offset, size):
+        with self.path.open('rb') as f:
+            f.seek(offset)
+            yield from _iter_stream(f, size)
+
+    def list_7z(self):
+        try:
+            out = subprocess.run(
+                ['7z', 'l', '-slt', str(self.path)],
+                capture_output=True, check=True, text=True,
+            ).stdout
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise RiaArchiveError(f'Cannot list {self.path}: {e}') from e
+        return _parse_7z_listing(out)
+
+    def extract_7z(self, member):
+        with _checked_process(
+                ['7z', 'x', '-so', str(self.path), member],
+                f'extract {member} from {self.path}') as proc:
+            yield from _iter_stream(proc.stdout)
+
+
+class _SshArchiveFile:
+    def __init__(self, handler, url):
+        self._handler = handler
+        self._url = url
+
+    def _run(self, cmd_tmpl, **kwargs):
+        with self._handler.channel(self._url) as (io, path):
+            return io._run(
+                cmd_tmpl.format(path=shlex.quote(str(path)), **kwargs),
+                no_output=False,
+            )
+
+    def signature(self):
+        # a long listing has size and modification time, and is
+        # available on any server
+        out = self._run('ls -ln {path} 2>/dev/null || echo -').strip()
+        return None if out == '-' else out
+
+    def size(self):
+        return int(self._run('wc -c < {path}').strip())
+
+    def read(self, offset, size):
+        return b''.join(self.iter_range(offset, size))
+
+    def iter_range(self, offset, size):
+        yield from self._stream(
+            # `tail -c +N` is 1-based
+            'tail -c +{offset} {path} | head -c {size}',
+            offset=offset + 1, size=size)
+
+    def list_7z(self):
+        try:
+            out = self._run('7z l -slt {path}')
+        except Exception as e:
+            raise RiaArchiveError(f'Cannot list {self._url}: {e}') from e
+        return _parse_7z_listing(out)
+
+    def extract_7z(self, member):
+        yield from self._stream(
+            '7z x -so {path} {member}', member=shlex.quote(member))
+
+    def _stream(self, cmd_tmpl, **kwargs):
+        with self._handler.channel(self._url) as (io, path):
+            cmd = cmd_tmpl.format(path=shlex.quote(str(path)), **kwargs)
+            with _checked_process(
+                    cmd, f'run {cmd!r} on {self._url}', io=io) as proc:
+                yield from _iter_stream(proc.stdout)
+
+
+@contextmanager
+def _checked_process(cmd, action, io=None):
+    kwargs = dict(
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        proc = popen_ssh(io, cmd, **kwargs) if io is not None \
+            else subprocess.Popen(cmd, **kwargs)
+    except OSError as e:
+        raise RiaArchiveError(f'Failed to {action}: {e}') from e
+    try:
+        yield proc
+    except OSError as e:
+        # reading the output failed
+        _finish_process(proc)
+        raise RiaArchiveError(f'Failed to {action}: {e}') from e
+    except BaseException:
+        # the consumer failed, or stopped reading early (and the process
+        # may have failed on the closed pipe). Its exit status is of no
+        # interest then
+        _finish_process(proc)
+        raise
+    returncode, stderr = _finish_process(proc)
+    if returncode != 0:
+        raise RiaArchiveError(f'Failed to {action}: {stderr.strip()}')
+
+
+def _finish_process(proc):
+    """Close the output of a process, and wait for it to exit
+
+    Returns the exit status, and the error output.
+    """
+    proc.stdout.close()
+    stderr = proc.stderr.read().decode(errors='replace')
+    proc.stderr.close()
+    return proc.wait(), stderr
+
+
+def get_archive_member(dirhash: str, key: str) -> str:
+    """Return the name of the archive member for a key
+
+    The archive has the same structure as the ``annex/objects`` tree.
+    """
+    return str(PurePosixPath(dirhash) / key / key)
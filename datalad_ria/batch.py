@@ -0,0 +1,94 @@
+"""Coalescing of concurrent calls into batches
+
+Some operations on a RIA store cost mostly a round-trip to the store host,
+regardless of how many items they cover (e.g. deleting files via SSH).
+With the ``ASYNC`` extension, git-annex sends requests of concurrent jobs
+to a special remote at the same time. :class:`BatchedCalls` turns the
+calls of such jobs into batches, in the manner of a "group commit": the
+first call is executed right away, and all calls that arrive while it is
+in progress are executed together afterwards. A single caller never waits
+for a batch to fill up.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import (
+    Any,
+    Callable,
+    List,
+)
+
+
+class _Call:
+    def __init__(self, item):
+        self.item = item
+        self.done = False
+        self.result = None
+        self.event = threading.Event()
+
+    def finish(self, result) -> None:
+        self.result = result
+        self.done = True
+        self.event.set()
+
+
+class BatchedCalls:
+    """Execute the calls of concurrent threads in batches
+
+    Parameters
+    ----------
+    fn: callable
+      Called with a list of items, must return a list of results of the
+      same length. A result that is an exception instance is raised in
+      the thread that made the respective call. An exception raised by
+      ``fn`` is raised in all threads of the batch.
+    max_size: int, optional
+      Maximum number of items in a batch.
+    """
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], List[Any]],
+        max_size: int = 256,
+    ):
+        self._fn = fn
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._queue = []
+        self._busy = False
+
+    def __call__(self, item: Any) -> Any:
+        """Execute ``fn`` for an item, as part of a batch
+
+        Returns the result for the item, once its batch has completed.
+        """
+        call = _Call(item)
+        with self._lock:
+            self._queue.append(call)
+            lead = not self._busy
+            self._busy = True
+        if not lead:
+            call.event.wait()
+        if not call.done:
+            # this thread runs the next batch, which includes its own call
+            self._run_batch()
+        if isinstance(call.result, BaseException):
+            raise call.result
+        return call.result
+
+    def _run_batch(self) -> None:
+        with self._lock:
+            batch = self._queue[:self._max_size]
+            del self._queue[:self._max_size]
+        try:
+            results = self._fn([c.item for c in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for c, res in zip(batch, results):
+            c.finish(res)
+        with self._lock:
+            if self._queue:
+                # hand over to the longest waiting caller
+                self._queue[0].event.set()
+            else:
+                self._busy = False
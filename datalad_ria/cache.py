@@ -0,0 +1,105 @@
+"""Small persistent caches for facts about RIA stores and datasets
+
+Special remote processes are short-lived. git-annex may start a new one
+for each command, and scripts may run many commands in a row. Facts that
+are expensive to determine, but rarely change, are therefore kept in small
+JSON files that are shared by all processes.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+from pathlib import Path
+import tempfile
+import time
+from typing import Any
+
+lgr = logging.getLogger('datalad.ria.cache')
+
+
+class JsonFileCache:
+    """Key-value store persisted in a JSON file
+
+    Values must be JSON-serializable. Each entry records the time it was
+    set. Entries older than ``ttl`` seconds are reported as absent.
+
+    The file is re-read on every access, and replaced atomically on every
+    change, such that concurrent processes never see a partially written
+    file. Concurrent updates of different entries may overwrite each
+    other, which is acceptable for a cache. Any failure to read or write
+    the file is logged and otherwise ignored. A cache must never be the
+    reason for an operation to fail.
+
+    Parameters
+    ----------
+    path: Path
+      Location of the cache file. Leading directories are created as
+      needed.
+    ttl: float, optional
+      Maximum age of an entry in seconds. By default, entries never
+      expire.
+    """
+    def __init__(self, path: Path, ttl: float | None = None):
+        self.path = Path(path)
+        self.ttl = ttl
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the value of a (not expired) entry, or ``default``"""
+        entry = self._load().get(key)
+        if entry is None:
+            return default
+        if self.ttl is not None and time.time() - entry['t'] > self.ttl:
+            return default
+        return entry['v']
+
+    def set(self, key: str, value: Any) -> None:
+        data = self._load()
+        data[key] = dict(t=time.time(), v=value)
+        self._dump(data)
+
+    def remove(self, key: str) -> None:
+        data = self._load()
+        if data.pop(key, None) is not None:
+            self._dump(data)
+
+    def _load(self) -> dict:
+        try:
+            with self.path.open('r') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                return data
+            lgr.debug('Ignoring invalid cache content in %s', self.path)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            lgr.debug('Cannot read cache %s: %s', self.path, e)
+        return {}
+
+    def _dump(self, data: dict) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(
+                dir=self.path.parent, prefix=f'.{self.path.name}.')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as e:
+            lgr.debug('Cannot write cache %s: %s', self.path, e)
+
+
+def get_file_signature(path: Path) -> list | None:
+    """Return a cheap signature of a file's state, for cache validation
+
+    ``None`` is returned for a file that does not exist.
+    """
+    try:
+        st = Path(path).stat()
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size, st.st_ino]
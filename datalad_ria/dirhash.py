@@ -0,0 +1,61 @@
+"""Hash directories of annex keys, computed locally
+
+git-annex places annex objects in two levels of hash directories that are
+derived from the MD5 sum of the key. A special remote can ask git-annex for
+them (``DIRHASH``, ``DIRHASH-LOWER``), but that is a protocol round-trip for
+every key. These functions compute the same directories (with a trailing
+``/``) in-process, and memoize the results for recently used keys.
+
+Both follow ``Annex/DirHashes.hs`` of git-annex: the mixed-case variant
+(used in the object tree of non-bare repositories, and RIA object tree
+version 2) and the lower-case variant (used in bare repositories, and RIA
+object tree version 1).
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from hashlib import md5
+
+# number of keys for which hash directories are memoized
+_CACHE_SIZE = 65536
+
+# git-annex avoids creating real words with letters that appear less
+# frequently
+_MIXED_CHARS = '0123456789zqjxkmvwgpfZQJXKMVWGPF'
+
+
+def _nonchunk_key(key: str) -> str:
+    # hash directories of a chunk are those of the whole key, i.e. of a
+    # key without chunk size (S) and chunk number (C) fields
+    fields, sep, name = key.partition('--')
+    if '-S' not in fields and '-C' not in fields:
+        return key
+    backend, *rest = fields.split('-')
+    return '-'.join(
+        [backend] + [f for f in rest if f[:1] not in ('S', 'C')]
+    ) + sep + name
+
+
+def _md5(key: str) -> bytes:
+    return md5(_nonchunk_key(key).encode('utf-8')).digest()
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def annex_dirhash(key: str) -> str:
+    """Return the mixed-case hash directories of a key, like ``X9/6J/``"""
+    digest = _md5(key)
+    # first 32-bit little-endian word of the MD5 sum
+    w = int.from_bytes(digest[:4], 'little')
+    cs = [_MIXED_CHARS[(w >> (6 * x)) & 31] for x in range(8)]
+    # swap pairs of characters, only the first 4 are used
+    d = cs[1] + cs[0] + cs[3] + cs[2]
+    return f'{d[:2]}/{d[2:]}/'
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def annex_dirhash_lower(key: str) -> str:
+    """Return the lower-case hash directories of a key, like ``297/61b/``"""
+    h = _md5(key).hex()
+    return f'{h[:3]}/{h[3:6]}/'
+
@@ -0,0 +1,381 @@
+"""Layout of RIA stores and the datasets in them
+
+A RIA store declares its layout in a ``ria-layout-version`` file at the
+store root. Each dataset in a store declares the layout of its annex object
+tree in a ``ria-layout-version`` file in the dataset directory. The
+content of these files is a version identifier, optionally followed by
+``|``-separated flags (e.g. ``1|l``).
+
+The layout of the object tree determines the "dirhash" variant used to
+build the path of an annex key in a dataset:
+
+- ``1``: lower-case dirhash (e.g. ``297/61b/``)
+- ``2``: "mixed" case dirhash (e.g. ``X9/6J/``), also used for datasets
+  without a version file
+
+Datasets in older stores can contain keys in both variants, regardless of
+their declared version. :class:`ObjectTreeLayouts` learns which variants
+a dataset actually uses.
+"""
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+import shlex
+import tempfile
+import threading
+from typing import (
+    Dict,
+    List,
+    Tuple,
+)
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+from datalad_next.annexremotes import RemoteError
+from datalad_next.url_operations import UrlOperationsResourceUnknown
+
+from datalad_ria.cache import JsonFileCache
+
+lgr = logging.getLogger('datalad.ria.layout')
+
+# store layout versions we know about
+known_store_versions = ('1',)
+# object tree layout versions we know about, and the
+# uncurl template property for the dirhash variant they use
+object_tree_dirhash = {
+    '1': 'annex_dirhash_lower',
+    '2': 'annex_dirhash',
+}
+# the layout assumed for a dataset without a version file
+default_object_tree_version = '2'
+# the dirhash variant of a directory in an object tree, by name length
+_dirhash_by_length = {
+    2: 'annex_dirhash',
+    3: 'annex_dirhash_lower',
+}
+
+_VERSION_FILE = 'ria-layout-version'
+# placeholder for a missing version file in the output of a remote command
+_MISSING = '?'
+
+
+def parse_layout_version(content: str | None) -> Tuple[str | None, list]:
+    """Split the content of a layout version file into version and flags
+
+    ``None`` for a missing file yields ``(None, [])``.
+    """
+    if content is None:
+        return None, []
+    version, *flags = content.strip().split('|')
+    return version, flags
+
+
+def read_layout_versions(
+    store_url: str,
+    dsid: str,
+    url_handler=None,
+) -> Dict[str, str | None]:
+    """Read the store and the dataset layout version files
+
+    Both files are read with a single request where the access method
+    permits it (``file://`` and ``ssh://``). Over HTTP(S) two downloads
+    are needed.
+
+    Parameters
+    ----------
+    store_url: str
+      Store base URL, without the ``ria+`` prefix.
+    dsid: str
+      Dataset ID.
+    url_handler: UrlOperations, optional
+      Used for store URLs other than ``file://`` and ``ssh://``.
+
+    Returns
+    -------
+    dict
+      With keys ``store`` and ``dataset``, and the content of the
+      respective version file as value, or ``None`` if the file does
+      not exist.
+
+    Raises
+    ------
+    OSError, RuntimeError, UrlOperationsRemoteError
+      When a version file exists, but cannot be read, or the store cannot
+      be accessed at all. ``RuntimeError`` covers a failed SSH command
+      (``CommandError``).
+    """
+    rel_paths = (
+        _VERSION_FILE,
+        f'{dsid[:3]}/{dsid[3:]}/{_VERSION_FILE}',
+    )
+    parsed = urlparse(store_url)
+    if parsed.scheme == 'file':
+        base = Path(url2pathname(parsed.path))
+        contents = []
+        for p in rel_paths:
+            try:
+                contents.append((base / p).read_text())
+            except FileNotFoundError:
+                contents.append(None)
+    elif parsed.scheme == 'ssh':
+        contents = _read_files_via_ssh(parsed, rel_paths)
+    else:
+        if url_handler is None:
+            from datalad_next.url_operations.any import AnyUrlOperations
+            url_handler = AnyUrlOperations()
+        contents = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpfile = Path(tmpdir) / _VERSION_FILE
+            for p in rel_paths:
+                try:
+                    url_handler.download(f'{store_url}/{p}', tmpfile)
+                    contents.append(tmpfile.read_text())
+                except UrlOperationsResourceUnknown:
+                    contents.append(None)
+    return dict(zip(('store', 'dataset'), contents))
+
+
+def _read_files_via_ssh(parsed, rel_paths) -> list:
+    from datalad import ssh_manager
+
+    base = parsed.path
+    # NUL-separated contents, with a placeholder for any missing file.
+    # Any other failure to read a file fails the command
+    cmd = '; printf "\\0"; '.join(
+        'if [ -e {path} ]; then cat {path} || exit 1; '
+        'else printf {missing}; fi'.format(
+            path=shlex.quote(f'{base}/{p}'), missing=_MISSING)
+        for p in rel_paths
+    )
+    conn = ssh_manager.get_connection(
+        parsed._replace(path='', params='', query='', fragment='').geturl())
+    out, _ = conn(cmd)
+    return [None if c == _MISSING else c for c in out.split('\0')]
+
+
+def get_dirhash_property(versions: Dict[str, str | None]) -> str:
+    """Return the uncurl template property for the dirhash of a layout
+
+    This is ``annex_dirhash`` or ``annex_dirhash_lower``.
+
+    Raises
+    ------
+    RemoteError
+      For an unknown store or dataset layout version.
+    """
+    store_version, _ = parse_layout_version(versions['store'])
+    if store_version is not None \
+            and store_version not in known_store_versions:
+        raise RemoteError(
+            f'RIA store layout version unknown: {store_version}. '
+            f'Supported versions: {known_store_versions}')
+    ds_version, _ = parse_layout_version(versions['dataset'])
+    if ds_version is None:
+        ds_version = default_object_tree_version
+    dirhash = object_tree_dirhash.get(ds_version)
+    if dirhash is None:
+        raise RemoteError(
+            f'RIA dataset layout version unknown: {ds_version}. '
+            f'Supported versions: {tuple(object_tree_dirhash)}')
+    return dirhash
+
+
+def get_object_url_template(
+    store_url: str,
+    dsid: str,
+    versions: Dict[str, str | None],
+) -> str:
+    """Return an uncurl URL template matching the layout versions
+
+    Raises
+    ------
+    RemoteError
+      For an unknown store or dataset layout version.
+    """
+    dirhash = get_dirhash_property(versions)
+    return (
+        # we fill in base url and dsid directly here (not via
+        # uncurl templating), because it is simpler
+        f'{get_dataset_url(store_url, dsid)}/annex/objects/'
+        f'{{{dirhash}}}{{annex_key}}/{{annex_key}}'
+    )
+
+
+def get_dataset_url(store_url: str, dsid: str) -> str:
+    """Return the URL of a dataset's directory in a store"""
+    return f'{store_url}/{dsid[:3]}/{dsid[3:]}'
+
+
+def get_layout_cache() -> JsonFileCache:
+    """Return the user-level cache of store layout versions
+
+    Entries expire after ``datalad.ria.layout-cache-ttl`` seconds.
+    """
+    from datalad import cfg
+    return JsonFileCache(
+        Path(cfg.obtain('datalad.locations.cache')) / 'ria' / 'layout.json',
+        ttl=float(cfg.obtain('datalad.ria.layout-cache-ttl')),
+    )
+
+
+def get_layout_versions(
+    store_url: str,
+    dsid: str,
+    url_handler=None,
+) -> Dict[str, str | None]:
+    """Like :func:`read_layout_versions`, but cached
+
+    Only a version file that does not exist means the default layout.
+    Any other failure to read the version files (e.g., an unreachable
+    store) is raised, as with :func:`read_layout_versions`. Versions are
+    not cached while the dataset has no version file. It may not have
+    been created in the store yet, and could be created with any layout.
+    """
+    cache = get_layout_cache()
+    cache_key = f'{store_url}/{dsid}'
+    versions = cache.get(cache_key)
+    if versions is not None:
+        return versions
+    versions = read_layout_versions(store_url, dsid, url_handler)
+    if versions['dataset'] is not None:
+        cache.set(cache_key, versions)
+    return versions
+
+
+def read_object_tree_layouts(
+    dataset_url: str,
+    url_handler=None,
+) -> List[str] | None:
+    """Determine the dirhash variants present in a dataset's object tree
+
+    The variants are told apart by the names of the top-level directories
+    of the object tree. Only ``file://`` and ``ssh://`` URLs support
+    directory listings.
+
+    Returns
+    -------
+    list or None
+      Uncurl template properties of the variants found (empty for an
+      empty or absent object tree), or ``None`` if the object tree cannot
+      be listed.
+    """
+    parsed = urlparse(dataset_url)
+    if parsed.scheme == 'file':
+        path = Path(url2pathname(parsed.path)) / 'annex' / 'objects'
+        try:
+            names = [p.name for p in path.iterdir()]
+        except FileNotFoundError:
+            names = []
+    elif parsed.scheme == 'ssh' and url_handler is not None:
+        with url_handler._get_handler(dataset_url).channel(
+                dataset_url) as (io, path):
+            names = io._run(
+                'ls -1 {} 2>/dev/null || true'.format(
+                    shlex.quote(str(path / 'annex' / 'objects'))),
+                no_output=False,
+            ).split()
+    else:
+        return None
+    return sorted(set(
+        _dirhash_by_length[len(n)] for n in names
+        if len(n) in _dirhash_by_length
+    ))
+
+
+class ObjectTreeLayouts:
+    """Dirhash variants to try for the keys of a dataset, learned over time
+
+    On first use, the object tree of the dataset is listed to find the
+    variants it contains (see :func:`read_object_tree_layouts`). Only
+    those are tried, the variant that had the last hit first. If the
+    object tree is empty, only the declared variant is tried. If it
+    cannot be listed, all variants are tried.
+
+    What was learned is kept in the layout cache, such that subsequent
+    processes need not list the object tree again.
+
+    Parameters
+    ----------
+    dataset_url: str
+      URL of the dataset directory in the store.
+    declared: str
+      Dirhash variant of the declared layout version (see
+      :func:`get_dirhash_property`). Keys are stored in this variant.
+    url_handler: RiaUrlOperations
+      Used for listing the object tree via SSH.
+    cache: JsonFileCache, optional
+      Defaults to :func:`get_layout_cache`.
+    """
+    def __init__(
+        self,
+        dataset_url: str,
+        declared: str,
+        url_handler,
+        cache: JsonFileCache | None = None,
+    ):
+        self.dataset_url = dataset_url
+        self.declared = declared
+        self._url_handler = url_handler
+        self._cache = cache if cache is not None else get_layout_cache()
+        self._cache_key = f'{dataset_url} objects'
+        self._lock = threading.Lock()
+        self._present = None
+        self._preferred = None
+        self._changed = False
+
+    def candidates(self) -> List[str]:
+        """Return the dirhash variants to try for a key, best first"""
+        with self._lock:
+            if self._present is None:
+                self._load()
+            present = self._present or [self.declared]
+            preferred = self._preferred \
+                if self._preferred in present else present[0]
+            return [preferred] + [p for p in present if p != preferred]
+
+    def hit(self, dirhash: str) -> None:
+        """Record that a key was found with a dirhash variant"""
+        with self._lock:
+            if self._preferred != dirhash:
+                self._preferred = dirhash
+                self._changed = True
+
+    def stored(self) -> None:
+        """Record that a key was stored with the declared variant"""
+        with self._lock:
+            if self._present is not None \
+                    and self.declared not in self._present:
+                self._present = sorted(self._present + [self.declared])
+                self._changed = True
+
+    def save(self) -> None:
+        """Persist what was learned, if there was anything new"""
+        with self._lock:
+            if not self._changed or not self._present:
+                return
+            self._changed = False
+            entry = dict(present=self._present, preferred=self._preferred)
+        self._cache.set(self._cache_key, entry)
+
+    def _load(self):
+        entry = self._cache.get(self._cache_key)
+        if entry is not None:
+            self._present = entry['present']
+            self._preferred = entry['preferred']
+            return
+        try:
+            present = read_object_tree_layouts(
+                self.dataset_url, self._url_handler)
+        except Exception as e:
+            lgr.debug('Cannot list object tree of %s: %s',
+                      self.dataset_url, e)
+            present = None
+        if present is None:
+            present = sorted(set(object_tree_dirhash.values()))
+        self._present = present
+        self._preferred = self.declared
+        # an empty object tree is not remembered, content could be
+        # added in any variant by other clients
+        self._changed = bool(present)
@@ -0,0 +1,237 @@
+"""Copy-free transfers between a dataset and a RIA store on the same machine
+
+For ``ria+file://`` stores, content is transferred between two local
+files. If both are on the same filesystem, the bytes need not be copied at
+all:
+
+- On filesystems with copy-on-write support (e.g. btrfs, XFS), a
+  reflink (``FICLONE``) creates an independent file that shares the data
+  blocks of its source until either of them is modified.
+- A hardlink makes the same file appear at both locations. This is only
+  safe for files that are never modified in place, i.e. annex objects
+  that are read-only, and only if the dataset does not use
+  ``annex.thin``, which would expose the shared file in the work tree.
+  Hardlinks are only made for retrievals from a store. An upload must
+  not tie the store's copy to a dataset's annex object, which git-annex
+  may unlock, or change the permissions of.
+
+Either way, the target is created next to its final location, and moved
+into place when complete.
+
+If the content must be copied, :func:`copy_file` lets the kernel do it
+with ``copy_file_range()`` (which NFS 4.2 servers and some filesystems
+perform without any data passing through the client), or ``sendfile()``,
+and only falls back on reading and writing the content in userspace if
+neither is supported.
+"""
+
+from __future__ import annotations
+
+import errno
+import logging
+import os
+from pathlib import Path
+import stat
+import sys
+import tempfile
+from typing import Callable
+
+from datalad_next.utils.consts import COPY_BUFSIZE
+
+lgr = logging.getLogger('datalad.ria.localcopy')
+
+# _IOW(0x94, 9, int) from linux/fs.h
+FICLONE = 0x40049409
+
+# number of bytes copied by the kernel between progress reports
+_KERNEL_COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+# errors that indicate that a link, reflink, or kernel-side copy is not
+# possible here, rather than a problem with the files
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.EPERM,
+    errno.EMLINK,
+    errno.EBADF,
+}
+
+
+def reflink_file(src: Path, dst: Path) -> bool:
+    """Create ``dst`` as a reflink of ``src``
+
+    Returns ``False``, if reflinks are not supported for these files.
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    import fcntl
+
+    tmp = _get_tmp_path(dst)
+    try:
+        with open(src, 'rb') as src_fp, open(tmp, 'xb') as dst_fp:
+            fcntl.ioctl(dst_fp.fileno(), FICLONE, src_fp.fileno())
+        os.replace(tmp, dst)
+    except OSError as e:
+        _unlink(tmp)
+        if e.errno in _UNSUPPORTED_ERRNOS:
+            return False
+        raise
+    return True
+
+
+def is_hardlink_safe(src: Path, thin: bool = False) -> bool:
+    """Whether ``src`` can be shared via a hardlink
+
+    ``src`` must be read-only, such that neither side of the link modifies
+    it, and it must be owned by the current user, such that git-annex can
+    manage its permissions. With ``thin`` (``annex.thin`` is enabled), no
+    hardlink is safe.
+    """
+    if thin:
+        return False
+    st = src.stat()
+    if st.st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH):
+        return False
+    return not hasattr(os, 'getuid') or st.st_uid == os.getuid()
+
+
+def hardlink_file(src: Path, dst: Path) -> bool:
+    """Create ``dst`` as a hardlink of ``src``
+
+    Returns ``False``, if a hardlink is not possible for these files. The
+    caller must ensure that it is safe (see :func:`is_hardlink_safe`).
+    """
+    tmp = _get_tmp_path(dst)
+    try:
+        os.link(src, tmp)
+        os.replace(tmp, dst)
+    except OSError as e:
+        _unlink(tmp)
+        if e.errno in _UNSUPPORTED_ERRNOS:
+            return False
+        raise
+    return True
+
+
+def link_file(
+    src: Path,
+    dst: Path,
+    thin: bool = False,
+    hardlink: bool = True,
+) -> str | None:
+    """Create ``dst`` without copying the content of ``src``, if possible
+
+    With ``hardlink=False``, only a reflink is tried. Returns the method
+    used (``'reflink'`` or ``'hardlink'``), or ``None`` if the content must
+    be copied.
+    """
+    if reflink_file(src, dst):
+        return 'reflink'
+    if hardlink and is_hardlink_safe(src, thin=thin) \
+            and hardlink_file(src, dst):
+        return 'hardlink'
+    return None
+
+
+def copy_file(
+    src: Path,
+    dst: Path,
+    progress_cb: Callable[[int], None] | None = None,
+) -> int:
+    """Copy the content of ``src`` to ``dst``, in the kernel if possible
+
+    ``progress_cb`` is called with the number of bytes copied so far.
+    Returns the total number of bytes copied.
+    """
+    with open(src, 'rb') as src_fp, open(dst, 'wb') as dst_fp:
+        infd, outfd = src_fp.fileno(), dst_fp.fileno()
+        size = os.fstat(infd).st_size
+        copied = 0
+        for copy in (_copy_file_range, _sendfile, _copy_buffered):
+            try:
+                return copy(infd, outfd, copied, size, progress_cb)
+            except _CopyUnsupported as e:
+                # continue where the previous method stopped
+                copied = e.copied
+                lgr.debug('%s not possible for %s: %s',
+                          copy.__name__, dst, e.__cause__)
+
+
+class _CopyUnsupported(Exception):
+    def __init__(self, copied):
+        self.copied = copied
+
+
+def _kernel_copy(fn, offset, size, progress_cb):
+    while True:
+        try:
+            n = fn(offset)
+        except OSError as e:
+            if e.errno in _UNSUPPORTED_ERRNOS:
+                raise _CopyUnsupported(offset) from e
+            raise
+        if not n:
+            if offset < size:
+                # some filesystems report no content instead of an error
+                raise _CopyUnsupported(offset) from OSError(
+                    errno.EOPNOTSUPP, 'premature end of copy')
+            return offset
+        offset += n
+        if progress_cb:
+            progress_cb(offset)
+
+
+def _copy_file_range(infd, outfd, offset, size, progress_cb):
+    if not hasattr(os, 'copy_file_range'):
+        raise _CopyUnsupported(offset) from OSError(
+            errno.ENOSYS, 'copy_file_range() not available')
+    return _kernel_copy(
+        lambda pos: os.copy_file_range(
+            infd, outfd, _KERNEL_COPY_CHUNK_SIZE, pos, pos),
+        offset, size, progress_cb)
+
+
+def _sendfile(infd, outfd, offset, size, progress_cb):
+    if not sys.platform.startswith('linux'):
+        # only Linux supports regular files as target
+        raise _CopyUnsupported(offset) from OSError(
+            errno.ENOSYS, 'sendfile() to files not available')
+    # sendfile() writes at the position of the target
+    os.lseek(outfd, offset, os.SEEK_SET)
+    return _kernel_copy(
+        lambda pos: os.sendfile(outfd, infd, pos, _KERNEL_COPY_CHUNK_SIZE),
+        offset, size, progress_cb)
+
+
+def _copy_buffered(infd, outfd, offset, size, progress_cb):
+    os.lseek(infd, offset, os.SEEK_SET)
+    os.lseek(outfd, offset, os.SEEK_SET)
+    while True:
+        chunk = os.read(infd, COPY_BUFSIZE)
+        if not chunk:
+            return offset
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(outfd, view):]
+        offset += len(chunk)
+        if progress_cb:
+            progress_cb(offset)
+
+
+def _get_tmp_path(dst: Path) -> Path:
+    # only reserve a name, the file is created by the caller
+    fd, tmp = tempfile.mkstemp(
+        prefix=f'.{dst.name}.', suffix='.tmp', dir=dst.parent)
+    os.close(fd)
+    os.unlink(tmp)
+    return Path(tmp)
+
+
+def _unlink(path: Path) -> None:
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,242 @@
+"""Per-dataset manifest of the annex keys in a RIA store
+
+A RIA store has no index of the keys in the object tree of a dataset.
+Whether a key is present can only be determined by probing for its file,
+one request per key. The manifest is an append-only log in the dataset's
+``annex/`` directory (``ria-keys.log``), with one line per key that was
+stored (``+<key>``) or removed (``-<key>``). A client can download it once,
+and answer presence queries for any number of keys locally. This also
+works for stores accessed via HTTP, where the object tree cannot be
+listed.
+
+The first line of a manifest is a header ``#ria-keys complete <size>``.
+A manifest is created from a listing of the object tree, when the first
+key is stored or removed by a client that maintains manifests. Afterwards,
+the log only grows, until its size exceeds twice the ``<size>`` of its
+last compaction (plus some slack). It is then rewritten with only the keys
+that are present. All modifications are serialized via ``flock(2)`` on a
+``ria-keys.lock`` file next to the log. Stores accessed via SSH need the
+``flock`` command on the server for a manifest to be created or
+compacted. Without it, an existing manifest is only appended to.
+
+Keys are added to the manifest after they were stored, and removed from
+it before they are deleted. An interruption can therefore leave a key out
+of the manifest, although it is present, but never the other way around.
+However, maintaining the manifest is best-effort. A key whose removal
+could not be recorded is still deleted. A client that does not maintain
+the manifest (e.g., the ``ora`` special remote of DataLad core, or any
+direct manipulation of a store) can make any key's record stale, too.
+Without an ``annex/`` directory in the dataset, nothing is recorded.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from pathlib import Path
+import shlex
+import tempfile
+import threading
+from typing import (
+    Iterable,
+    Set,
+    Tuple,
+)
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+from datalad_next.url_operations import UrlOperationsResourceUnknown
+
+lgr = logging.getLogger('datalad.ria.manifest')
+
+MANIFEST_NAME = 'ria-keys.log'
+_LOCK_NAME = 'ria-keys.lock'
+_HEADER = '#ria-keys complete'
+# bytes a manifest may grow beyond twice its compacted size, before it is
+# compacted again
+_COMPACT_SLACK = 65536
+
+# the same logic as `_update_local()`, for a POSIX shell on a store host.
+# {lines} are the quoted lines to append.
+_UPDATE_SCRIPT = """\
+cd {annex_dir} 2>/dev/null || exit 0
+exec 9>>{lock}
+if command -v flock >/dev/null 2>&1; then flock -x 9 || exit 1; locked=1; fi
+write_manifest() {{
+  n=$(wc -c < {log}.keys)
+  {{ echo "{header} $n"; cat {log}.keys; }} > {log}.tmp \\
+    && mv -f {log}.tmp {log}
+  rm -f {log}.keys
+}}
+if [ ! -e {log} ]; then
+  [ -n "$locked" ] || exit 0
+  find objects -type f ! -name '.*' 2>/dev/null | sed 's#.*/#+#' \\
+    | sort -u > {log}.keys
+  write_manifest
+fi
+printf '%s\\n' {lines} >> {log}
+[ -n "$locked" ] || exit 0
+n=$(head -n 1 {log} | cut -d' ' -f3)
+if [ "$(wc -c < {log})" -gt $((2 * ${{n:-0}} + {slack})) ]; then
+  awk '/^\\+/ {{ k[substr($0, 2)] = 1 }} /^-/ {{ delete k[substr($0, 2)] }}
+       END {{ for (x in k) print "+" x }}' {log} | sort > {log}.keys
+  write_manifest
+fi
+"""
+
+
+def parse_manifest(text: str) -> Tuple[Set[str], bool]:
+    """Return the keys recorded in a manifest, and whether it is complete
+
+    A manifest is complete, if it starts with a valid header, i.e. it was
+    created from a listing of the object tree.
+    """
+    lines = text.splitlines()
+    complete = bool(lines) and lines[0].startswith(_HEADER)
+    keys = set()
+    for line in lines:
+        if line.startswith('+'):
+            keys.add(line[1:])
+        elif line.startswith('-'):
+            keys.discard(line[1:])
+    return keys, complete
+
+
+class KeyManifest:
+    """Keys in a dataset of a RIA store, according to its manifest
+
+    The manifest is downloaded on first use, and kept in memory. Updates
+    by this instance are applied to both, the in-memory copy and the
+    manifest in the store. Updates are only supported for ``file://`` and
+    ``ssh://`` URLs, and silently skipped for any other.
+
+    Parameters
+    ----------
+    dataset_url: str
+      URL of the dataset directory in the store.
+    url_handler: RiaUrlOperations
+      Handler for downloading the manifest, and for access to the store
+      host via SSH.
+    """
+    def __init__(self, dataset_url: str, url_handler):
+        self.dataset_url = dataset_url
+        self.url = f'{dataset_url}/annex/{MANIFEST_NAME}'
+        self._url_handler = url_handler
+        self._keys = None
+        self._complete = False
+        self._lock = threading.Lock()
+
+    def contains(self, key: str) -> bool | None:
+        """Whether the manifest lists a key
+
+        Returns ``None``, if there is no complete manifest.
+        """
+        with self._lock:
+            if self._keys is None:
+                self._keys, self._complete = self._load()
+            if not self._complete:
+                return None
+            return key in self._keys
+
+    def add(self, *keys: str) -> None:
+        """Record keys that were stored"""
+        self._update(*(f'+{key}' for key in keys))
+        with self._lock:
+            if self._keys is not None:
+                self._keys.update(keys)
+
+    def remove(self, *keys: str) -> None:
+        """Record keys that are about to be deleted"""
+        with self._lock:
+            if self._keys is not None:
+                self._keys.difference_update(keys)
+        self._update(*(f'-{key}' for key in keys))
+
+    def _load(self) -> Tuple[Set[str], bool]:
+        parsed = urlparse(self.url)
+        try:
+            if parsed.scheme == 'file':
+                text = Path(url2pathname(parsed.path)).read_text()
+            else:
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    tmpfile = Path(tmpdir) / MANIFEST_NAME
+                    self._url_handler.download(self.url, tmpfile)
+                    text = tmpfile.read_text()
+        except (FileNotFoundError, UrlOperationsResourceUnknown):
+            return set(), False
+        keys, complete = parse_manifest(text)
+        lgr.debug('Read manifest %s with %i keys (complete=%s)',
+                  self.url, len(keys), complete)
+        return keys, complete
+
+    def _update(self, *lines: str) -> None:
+        parsed = urlparse(self.dataset_url)
+        if parsed.scheme == 'file':
+            _update_local(
+                Path(url2pathname(parsed.path)) / 'annex', lines)
+        elif parsed.scheme == 'ssh':
+            with self._url_handler._get_handler(self.dataset_url).channel(
+                    self.dataset_url) as (io, path):
+                # in a subshell, to keep the persistent shell alive
+                io._run('(\n{})'.format(_UPDATE_SCRIPT.format(
+                    annex_dir=shlex.quote(str(path / 'annex')),
+                    lock=_LOCK_NAME,
+                    log=MANIFEST_NAME,
+                    header=_HEADER,
+                    slack=_COMPACT_SLACK,
+                    lines=' '.join(shlex.quote(line) for line in lines),
+                )), check=True)
+
+
+def _update_local(annex_dir: Path, lines: Iterable[str]) -> None:
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    if not annex_dir.is_dir():
+        # nothing stored, nothing to record
+        return
+    log = annex_dir / MANIFEST_NAME
+    with (annex_dir / _LOCK_NAME).open('a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        elif not log.exists():
+            # cannot be created safely
+            return
+        if not log.exists():
+            _write_manifest(log, _list_object_tree(annex_dir / 'objects'))
+        with log.open('a') as f:
+            f.writelines(f'{line}\n' for line in lines)
+            size = f.tell()
+        if fcntl is not None \
+                and size > 2 * _get_compacted_size(log) + _COMPACT_SLACK:
+            keys, _ = parse_manifest(log.read_text())
+            _write_manifest(log, keys)
+
+
+def _list_object_tree(objects_dir: Path) -> Set[str]:
+    # annex keys are the names of the files in an object tree, anything
+    # starting with a dot is a temporary file of an upload
+    return set(
+        name
+        for _, _, names in os.walk(objects_dir)
+        for name in names
+        if not name.startswith('.')
+    )
+
+
+def _write_manifest(log: Path, keys: Iterable[str]) -> None:
+    body = ''.join(f'+{key}\n' for key in sorted(keys))
+    tmp = log.with_name(f'{log.name}.tmp')
+    tmp.write_text(f'{_HEADER} {len(body.encode())}\n{body}')
+    os.replace(tmp, log)
+    lgr.debug('Wrote manifest %s', log)
+
+
+def _get_compacted_size(log: Path) -> int:
+    with log.open() as f:
+        header = f.readline()
+    try:
+        return int(header[len(_HEADER):])
+    except ValueError:
+        return 0
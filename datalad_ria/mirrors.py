@@ -0,0 +1,172 @@
+"""Selection among mirrors of a RIA store
+
+A RIA store can be replicated to several sites, and be accessible via
+different URLs (e.g. ``ria+ssh://`` at one site, ``ria+http://`` at
+another). For each mirror, :class:`MirrorSelector` keeps estimates of the
+round-trip time (RTT) and the throughput, learned from the operations
+performed on it. Retrievals are routed to the mirror with the lowest
+expected duration, given the size of the object.
+
+A mirror that fails is considered unhealthy for a backoff period that
+grows with the number of consecutive failures, and is only tried after
+all healthy mirrors. Any successful operation makes a mirror healthy
+again.
+
+Estimates are kept in a user-level cache, such that they need not be
+learned anew by every (short-lived) special remote process.
+"""
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+import re
+import threading
+import time
+from typing import List
+
+from datalad_ria.cache import JsonFileCache
+
+lgr = logging.getLogger('datalad.ria.mirrors')
+
+# weight of a new measurement in the moving averages
+_EWMA_ALPHA = 0.3
+# transfers smaller than this are considered RTT measurements only
+_MIN_THROUGHPUT_SAMPLE = 256 * 1024
+# backoff after the first failure of a mirror, doubled for any further one
+_BACKOFF = 30.0
+_MAX_BACKOFF = 600.0
+
+_key_size_regex = re.compile(r'^[^-]+-s(\d+)')
+
+
+def get_key_size(key: str) -> int | None:
+    """Return the size of an annex key's content, if it is part of the key"""
+    match = _key_size_regex.match(key)
+    return int(match.group(1)) if match else None
+
+
+class MirrorSelector:
+    """Order mirrors by expected transfer duration and health
+
+    Parameters
+    ----------
+    mirrors: list
+      Identifiers of the mirrors (e.g. store URLs), in the configured order
+      of preference. Among mirrors without measurements, this order is
+      kept.
+    cache: JsonFileCache, optional
+      Persistent storage of the estimates, keyed by mirror. Estimates are
+      loaded on initialization, and written by :meth:`save`.
+    """
+    def __init__(self, mirrors: List[str], cache: JsonFileCache | None = None):
+        self.mirrors = list(mirrors)
+        self._cache = cache
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._changed = set()
+        for m in self.mirrors:
+            stats = dict(
+                rtt=None, throughput=None, failures=0, down_until=0.0)
+            if cache is not None:
+                stats.update(cache.get(m) or {})
+            self._stats[m] = stats
+
+    def unmeasured(self) -> List[str]:
+        """Return the mirrors for which no RTT is known"""
+        with self._lock:
+            return [m for m in self.mirrors if self._stats[m]['rtt'] is None]
+
+    def ordered(self, size: int | None = None) -> List[str]:
+        """Return all mirrors, best first
+
+        Healthy mirrors come first, ordered by the expected duration of a
+        transfer of ``size`` bytes (or by RTT, if no size is given).
+        Unhealthy mirrors follow, ordered by the end of their backoff
+        period.
+        """
+        if len(self.mirrors) < 2:
+            return list(self.mirrors)
+        now = time.time()
+        with self._lock:
+            # mirrors without a throughput estimate are assumed to be as
+            # slow as the slowest known one
+            default_throughput = min(
+                (s['throughput'] for s in self._stats.values()
+                 if s['throughput']),
+                default=None,
+            )
+
+            def sortkey(item):
+                idx, m = item
+                s = self._stats[m]
+                if s['down_until'] > now:
+                    return (1, s['down_until'], idx)
+                if s['rtt'] is None:
+                    # no measurement, keep configured order before
+                    # mirrors that are known to be slow
+                    return (0, 0.0, idx)
+                cost = s['rtt']
+                throughput = s['throughput'] or default_throughput
+                if size and throughput:
+                    cost += size / throughput
+                return (0, cost, idx)
+
+            return [m for _, m in sorted(enumerate(self.mirrors), key=sortkey)]
+
+    def record(self, mirror: str, duration: float, nbytes: int = 0) -> None:
+        """Record a successful operation on a mirror
+
+        Operations that transferred less than 256 KiB are taken as a
+        measurement of the RTT, larger ones as a measurement of the
+        throughput.
+        """
+        with self._lock:
+            s = self._stats[mirror]
+            s['failures'] = 0
+            s['down_until'] = 0.0
+            if nbytes < _MIN_THROUGHPUT_SAMPLE or s['rtt'] is None:
+                s['rtt'] = _ewma(s['rtt'], duration)
+            else:
+                throughput = nbytes / max(duration - s['rtt'], 1e-6)
+                s['throughput'] = _ewma(s['throughput'], throughput)
+            self._changed.add(mirror)
+
+    def record_failure(self, mirror: str) -> None:
+        """Record a failed operation, and put a mirror into backoff"""
+        with self._lock:
+            s = self._stats[mirror]
+            s['failures'] += 1
+            backoff = min(
+                _BACKOFF * 2 ** (s['failures'] - 1), _MAX_BACKOFF)
+            s['down_until'] = time.time() + backoff
+            self._changed.add(mirror)
+        lgr.debug('Mirror %s failed, not preferred for %.0fs',
+                  mirror, backoff)
+
+    def save(self) -> None:
+        """Persist the estimates of all mirrors with new measurements"""
+        if self._cache is None:
+            return
+        with self._lock:
+            changed = [(m, dict(self._stats[m])) for m in self._changed]
+            self._changed = set()
+        for m, stats in changed:
+            self._cache.set(m, stats)
+
+
+def _ewma(old: float | None, new: float) -> float:
+    return new if old is None else (1 - _EWMA_ALPHA) * old \
+        + _EWMA_ALPHA * new
+
+
+def get_mirror_stats_cache() -> JsonFileCache:
+    """Return the user-level cache of mirror estimates
+
+    Entries expire after ``datalad.ria.mirror-stats-ttl`` seconds.
+    """
+    from datalad import cfg
+    return JsonFileCache(
+        Path(cfg.obtain('datalad.locations.cache')) / 'ria' / 'mirrors.json',
+        ttl=float(cfg.obtain('datalad.ria.mirror-stats-ttl')),
+    )
@@ -1,3 +1,13 @@
+from functools import (
+    lru_cache,
+    partial,
+)
+import logging
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
 import uuid
 
 from datalad_next.annexremotes import (
@@ -7,6 +17,58 @@ from datalad_next.annexremotes import (
 from datalad_next.annexremotes.uncurl import (
     UncurlRemote,
 )
+from datalad_next.url_operations import (
+    UrlOperationsRemoteError,
+    UrlOperationsResourceUnknown,
+)
+
+from datalad_ria.archive import (
+    RiaArchive,
+    RiaArchiveError,
+    get_archive_member,
+)
+from datalad_ria.batch import BatchedCalls
+from datalad_ria.cache import (
+    JsonFileCache,
+    get_file_signature,
+)
+from datalad_ria.dirhash import (
+    annex_dirhash,
+    annex_dirhash_lower,
+)
+from datalad_ria.layout import (
+    get_dataset_url,
+    get_dirhash_property,
+    get_layout_versions,
+    get_object_url_template,
+    object_tree_dirhash,
+    ObjectTreeLayouts,
+)
+from datalad_ria.manifest import KeyManifest
+from datalad_ria.mirrors import (
+    MirrorSelector,
+    get_key_size,
+    get_mirror_stats_cache,
+)
+from datalad_ria.pool import ContentPool
+from datalad_ria.prefetch import Prefetcher
+from datalad_ria.progress import (
+    ThrottledProgress,
+    progress_callback,
+)
+from datalad_ria.stats import (
+    emit_stats,
+    stats,
+)
+from datalad_ria.url_operations import RiaUrlOperations
+from datalad_ria.verify import get_key_digest
+
+lgr = logging.getLogger('datalad.ria.ora_remote')
+
+# number of keys for which rendered URLs are memoized
+_KEY_URL_CACHE_SIZE = 65536
+# maximum number of keys removed with a single remote command
+_REMOVE_BATCH_SIZE = 256
 
 
 class Ora2Remote(UncurlRemote):
@@ -31,7 +93,179 @@ class Ora2Remote(UncurlRemote):
       If enabled, all special remote operations fall back onto the
       legacy ``ORA`` special remote implementation. This mode is
       only provided for backward-compatibility.
+
+    Mirrors
+    -------
+
+    A store that is replicated to several sites can be declared with
+    ``mirrors=<url> ...`` (a whitespace-separated list of ``ria+<scheme>://``
+    URLs) in addition to ``url=``. All mirrors must have the same layout as
+    the store at ``url=``. Content is retrieved from the mirror with
+    the lowest expected transfer duration, based on measured round-trip
+    times and throughput (see :mod:`datalad_ria.mirrors`). If a mirror
+    fails or does not have a key, the next best one is tried. Content is
+    only ever stored in, and removed from, the store at ``url=``, and
+    archives are only read from there.
+
+    Transport
+    ---------
+
+    Store URLs are turned into URLs of annex keys via an UNCURL URL
+    template. For ``ria+ssh://`` stores, all operations are performed via
+    persistent remote shells on a shared SSH connection (see
+    :mod:`datalad_ria.url_operations`), instead of opening a new
+    connection for each operation. For ``ria+file://`` stores on the same
+    filesystem as the dataset, content is reflinked, or (when retrieving
+    read-only annex objects) hardlinked, instead of copied
+    (see :mod:`datalad_ria.localcopy`). Interrupted retrievals from
+    ``ria+http(s)://`` stores are resumed with range requests, immediately
+    (up to ``datalad.ria.http-retries`` times) or by the next retrieval of
+    the key. Requests to ``ria+http(s)://`` stores go through a pool of
+    keep-alive connections per server (of ``datalad.ria.http-connections``
+    connections), that is kept for the lifetime of the process. Large
+    keys are downloaded from them in several byte ranges concurrently
+    (``datalad.ria.http-ranges``).
+
+    Verification
+    ------------
+
+    For keys with a checksum (e.g. ``MD5E``, ``SHA256E``), the checksum of
+    content retrieved from ``ria+ssh://`` and ``ria+http(s)://`` stores is
+    computed while the content is written (see :mod:`datalad_ria.verify`).
+    This includes downloads in concurrent byte ranges, where only content
+    that arrives ahead of the first incomplete range is read back once.
+    Corrupt content is removed right away, and the key is retrieved from
+    the next mirror, if there is one. The special remote protocol has no
+    means to tell git-annex that content is verified already. To save
+    git-annex reading all retrieved content once more, set
+    ``remote.<name>.annex-verify=false``. Content from ``ria+file://``
+    stores is not verified by the special remote, because that would
+    require reading it again, too.
+
+    Key manifest
+    ------------
+
+    For datasets in the standard layout, the keys stored in, and removed
+    from a ``ria+file://`` or ``ria+ssh://`` store are recorded in a
+    manifest in the store (``annex/ria-keys.log``, see
+    :mod:`datalad_ria.manifest`). It is downloaded once per process, and
+    can answer presence checks without a request per key, also for
+    ``ria+http(s)://`` stores. This is controlled by
+    ``datalad.ria.key-manifest``: ``absent`` trusts the manifest for
+    keys it does not list, ``yes`` also for keys it lists. The latter is
+    only safe, if the store is modified by no other tool. With ``no`` (the
+    default), the manifest is neither used nor maintained. The manifest is
+    not consulted for stores with mirrors. A failure to update it is
+    logged, but does not fail the storage or removal of a key.
+
+    Archives
+    --------
+
+    Keys that are not found among the loose objects of a dataset in the
+    store are looked up in the dataset's archive
+    (``archives/archive.7z``), if there is one. The member list of an
+    archive is kept in a persistent index in
+    ``.git/datalad/ria/ora2-archives.json``, and only the needed member is
+    extracted (see :mod:`datalad_ria.archive`). Archive access is
+    supported for ``ria+file://`` and ``ria+ssh://`` stores.
+
+    Caching
+    -------
+
+    The dataset ID determined on startup is cached in
+    ``.git/datalad/ria/ora2-prepare.json``, keyed by the dataset location
+    and the RIA URL of the special remote. A cache entry is used as long
+    as the local Git configuration file is unchanged, and the store
+    reports the layout versions the entry was made with. It is discarded
+    whenever git-annex (re-)initializes the special remote, e.g. via
+    ``git annex enableremote``, which is also needed to pick up a changed
+    ``archive-id=``.
+
+    The layout versions of the store and the dataset in it determine the
+    URL template for annex keys. They are read from the store and cached
+    in the user's cache directory for ``datalad.ria.layout-cache-ttl``
+    seconds (see :mod:`datalad_ria.layout`).
+
+    Datasets in older stores can contain keys in both the mixed-case and
+    the lower-case dirhash variant of the object tree. The variants a
+    dataset actually uses are learned from a listing of its object tree,
+    and also kept in the user's cache directory. Only those variants are
+    tried, the one with the most recent hit first (see
+    :class:`datalad_ria.layout.ObjectTreeLayouts`).
+
+    The URLs of annex keys are rendered from the URL template with hash
+    directories computed in-process (see :mod:`datalad_ria.dirhash`),
+    and memoized for recently used keys.
+
+    Concurrency
+    -----------
+
+    This special remote supports the ``ASYNC`` extension of the special
+    remote protocol (see :mod:`datalad_ria.annex_async`). With concurrent
+    jobs (``git annex get -J<n>``), git-annex starts only a single special
+    remote process, and all jobs share the above caches, the connections
+    to the store, and the archive index. The number of jobs that are
+    processed at the same time is limited by ``datalad.ria.async-jobs``.
+    Removals of concurrent jobs (``git annex drop --from <remote> -J<n>``)
+    are coalesced: while one batch of keys is removed, further removals are
+    collected, and removed together afterwards, with a single remote command
+    for ``ria+ssh://`` stores. Each removal is only reported as done, once
+    its batch has completed.
+
+    Prefetching
+    -----------
+
+    git-annex requests keys one at a time. If ``datalad.ria.prefetch-list``
+    names a file with the keys that are about to be retrieved, in the order
+    git-annex requests them, the keys that follow a requested one
+    (``datalad.ria.prefetch-depth``) are retrieved in the background,
+    while git-annex finalizes the current one (see
+    :mod:`datalad_ria.prefetch`). For example::
+
+      git annex find --not --in here --format='${key}\\n' data/ > keys
+      git -c datalad.ria.prefetch-list=keys annex get data/
+
+    Prefetched content is verified like any other, and staged in
+    ``.git/annex/tmp`` (up to ``datalad.ria.prefetch-size`` bytes) until it
+    is requested. Prefetching is not supported with ``match=``.
+    Keys are retrieved in parallel, without ``-J``, up to
+    ``datalad.ria.prefetch-jobs`` (by default ``datalad.ria.ssh-channels``)
+    at a time. For ``ria+ssh://`` stores, the number of parallel transfers
+    adapts to their throughput.
+
+    Deduplication
+    -------------
+
+    If a ``ria+file://`` or ``ria+ssh://`` store has a ``.pool``
+    directory, content of keys of checksum backends is shared by all
+    datasets in the store (see :mod:`datalad_ria.pool`). Storing a key
+    that any dataset stored before is a hardlink of the pooled file,
+    without an upload. Removing a key prunes it from the pool, once no
+    other dataset links it.
+
+    Statistics
+    ----------
+
+    Counts of keys and bytes stored, retrieved, and removed, the time
+    spent transferring, connecting (opening remote shells for
+    ``ria+ssh://`` stores), and verifying content, retries, failed
+    requests, and cache hit rates are accumulated for the lifetime of the
+    process (see :mod:`datalad_ria.stats`). On exit, they are logged as a
+    single DEBUG record, and appended as a line of JSON to the file
+    ``datalad.ria.stats-file``, if configured.
     """
+    # operations for different keys can run concurrently, all helpers
+    # are thread-safe
+    supports_async = True
+
+    def __init__(self, annex):
+        super().__init__(annex)
+        self.configs.update(
+            mirrors='(whitespace-separated list of) URLs of mirrors of the '
+            'RIA store to retrieve content from',
+        )
+        self._mirrors = None
+
     def initremote(self):
         # we cannot simply run UncurlRemote.prepare(), because it needs
         # `.remotename` and this is not yet available until the remote is
@@ -44,6 +278,13 @@ class Ora2Remote(UncurlRemote):
         if not ria_url.startswith('ria+'):
             # Adopt git-annex's style of messaging
             raise RemoteError('ria+<scheme>://... URL expected for url=')
+        mirrors = (self.annex.getconfig('mirrors') or '').split()
+        if not all(m.startswith('ria+') for m in mirrors):
+            raise RemoteError('ria+<scheme>://... URLs expected for mirrors=')
+
+        # any cached facts may no longer match the (new) configuration
+        # of the remote
+        self._get_prepare_cache().remove(self._get_prepare_cache_key(ria_url))
 
         # TODO run _get_ria_dsid() to confirm the validity of the ID
         # setup
@@ -58,37 +299,580 @@ class Ora2Remote(UncurlRemote):
         # we are not doing any checks here (for now).
 
     def prepare(self):
-        # UUID to use for this dataset in the store
-        dsid = self._get_ria_dsid()
-
         # check for a remote-specific uncurl config
         # self.get_remote_gitcfg() would also consider a remote-type
         # general default, which is undesirable here
         tmpl_var = f'remote.{self.remotename}.uncurl-url'
         url_tmpl = self.repo.config.get(tmpl_var, None)
+        # pull the recorded ria URL from git-annex
+        ria_url = self.annex.getconfig('url')
+        assert ria_url.startswith('ria+')
+        base_url = ria_url[4:]
+        dsid, versions = self._get_prepared(ria_url)
+        self._dataset_url = get_dataset_url(base_url, dsid)
+        self._dirhash = get_dirhash_property(versions)
         if url_tmpl is None:
-            # pull the recorded ria URL from git-annex
-            ria_url = self.annex.getconfig('url')
-            assert ria_url.startswith('ria+')
-            # TODO check the layout settings of the actual store
-            # to match this template
-            base_url = ria_url[4:]
-            url_tmpl = (
-                # we fill in base url and dsid directly here (not via
-                # uncurl templating), because it is simpler
-                f'{base_url}/{dsid[:3]}/{dsid[3:]}/annex/objects/'
-                # RIA v? uses the "mixed" dirhash
-                '{annex_dirhash}{annex_key}/{annex_key}'
-            )
+            url_tmpl = get_object_url_template(base_url, dsid, versions)
         # we set the URL template in the config for the base class
-        # routines to find
-        self.repo.config.set(tmpl_var, url_tmpl, scope='override')
+        # routines to find.
+        # an override does not need a forced reload (it would rerun
+        # `git config` for all config sources). A regular reload only
+        # re-reads sources that have changed, and applies the override.
+        self.repo.config.set(tmpl_var, url_tmpl, scope='override',
+                             reload=False)
+        self.repo.config.reload()
         # the rest is UNCURL "business as usual"
         super().prepare()
+        # except for the URL handler: ssh:// URLs are handled via
+        # persistent connections, all others like in UNCURL
+        self.url_handler = RiaUrlOperations(cfg=self.repo.cfg)
+        self._archive = None
+        self._archive_lock = threading.Lock()
+        # the store itself is the first mirror, any others share its layout
+        self._mirror_tmpls = {ria_url: self.url_tmpl}
+        self._mirror_probe_urls = {
+            ria_url: f'{self._dataset_url}/ria-layout-version'}
+        for mirror in (self.annex.getconfig('mirrors') or '').split():
+            self._mirror_tmpls[mirror] = get_object_url_template(
+                mirror[4:], dsid, versions)
+            self._mirror_probe_urls[mirror] = \
+                f'{get_dataset_url(mirror[4:], dsid)}/ria-layout-version'
+        self._mirrors = MirrorSelector(
+            list(self._mirror_tmpls),
+            get_mirror_stats_cache() if len(self._mirror_tmpls) > 1 else None,
+        )
+        self._mirrors_probed = False
+        self._mirrors_lock = threading.Lock()
+        self._primary = ria_url
+        # legacy datasets can have keys in either dirhash variant, a
+        # template with the declared one is rewritten for the other
+        self._layout_tmpls = {
+            dirhash: {
+                m: tmpl.replace(f'{{{self._dirhash}}}', f'{{{dirhash}}}')
+                for m, tmpl in self._mirror_tmpls.items()
+            }
+            for dirhash in object_tree_dirhash.values()
+        }
+        self._layouts = ObjectTreeLayouts(
+            self._dataset_url, self._dirhash, self.url_handler) \
+            if f'{{{self._dirhash}}}' in self.url_tmpl else None
+        self._removals = BatchedCalls(
+            self._remove_batch, max_size=_REMOVE_BATCH_SIZE)
+        self._manifest_trust = self.repo.cfg.obtain(
+            'datalad.ria.key-manifest')
+        # the manifest is only maintained for the standard layout, and
+        # when it is used
+        self._manifest = KeyManifest(self._dataset_url, self.url_handler) \
+            if self._layouts is not None and self._manifest_trust != 'no' \
+            else None
+        # a store-wide content pool needs hardlinks in the store
+        self._pool = ContentPool(base_url, self.url_handler) \
+            if self._layouts is not None \
+            and base_url.startswith(('file:', 'ssh:')) else None
+        # bounded memo of rendered key URLs, per instance, because the
+        # templates are instance-specific
+        self._render_key_urls_cached = lru_cache(
+            maxsize=_KEY_URL_CACHE_SIZE)(self._render_key_urls)
+        self._prefetcher = self._get_prefetcher()
+
+    def checkpresent(self, key):
+        stats.count('checked')
+        listed = self._get_manifest_listing(key)
+        if listed is None:
+            listed = self._check_mirrors(
+                key, self.url_handler.stat, ('find', 'at'))
+        return listed or self._in_archive(key)
+
+    def transfer_retrieve(self, key, filename):
+        with stats.timer('transfer'):
+            self._retrieve(key, filename)
+        stats.count('retrieved')
+        stats.count('retrieved-bytes', os.path.getsize(filename))
+
+    def _retrieve(self, key, filename):
+        if self._prefetcher is not None:
+            if self._prefetcher.take(key, Path(filename)):
+                stats.count('prefetch-hits')
+                progress = ThrottledProgress(
+                    self.annex.progress, label=f'prefetched {key}')
+                progress.update(os.path.getsize(filename))
+                progress.finish()
+                return
+            stats.count('prefetch-misses')
+        progress = ThrottledProgress(
+            self.annex.progress, get_key_size(key),
+            label=f'download of {key}')
+        with progress_callback(progress.update):
+            found = self._check_mirrors(
+                key,
+                partial(self._download_verified,
+                        to_path=Path(filename),
+                        digest=get_key_digest(key)),
+                ('download', 'from'),
+                transfer=True)
+        if found:
+            progress.finish()
+            return
+        # not among the loose objects, try the archive
+        member = self._get_archive_member(key)
+        if member is None:
+            raise RemoteError(f'{key!r} not found in store')
+        stats.count('archive-extractions')
+        progress = ThrottledProgress(
+            self.annex.progress, label=f'extraction of {key}')
+        try:
+            self._get_archive().extract(
+                member, Path(filename), progress.update)
+        except RiaArchiveError as e:
+            raise RemoteError(str(e)) from e
+        progress.finish()
+
+    def transfer_store(self, key, filename):
+        progress = ThrottledProgress(
+            self.annex.progress, get_key_size(key),
+            label=f'upload of {key}')
+        if self._store_from_pool(key):
+            progress.update(os.path.getsize(filename))
+        else:
+            with progress_callback(progress.update), \
+                    stats.timer('transfer'):
+                super().transfer_store(key, filename)
+            stats.count('stored-bytes', os.path.getsize(filename))
+            self._add_to_pool(key)
+        progress.finish()
+        stats.count('stored')
+        if self._layouts is not None:
+            self._layouts.stored()
+        if self._manifest is not None:
+            try:
+                self._manifest.add(key)
+            except Exception as e:
+                # the key is stored, a manifest that does not list it
+                # is merely incomplete
+                stats.count('key-manifest-failures')
+                self.message(
+                    f'Cannot add {key!r} to the key manifest: {e}',
+                    type='debug')
+
+    def remove(self, key):
+        # removals of concurrent (ASYNC) jobs are coalesced into batches
+        if not self._removals(key):
+            self.message(
+                f'{key} not found at the remote, skipping', type='debug')
+            return
+        stats.count('removed')
+
+    def stop(self):
+        # called by the special remote main loop on exit
+        if getattr(self, '_prefetcher', None) is not None:
+            self._prefetcher.close()
+        self._emit_stats()
+        if self.url_handler is not None:
+            self.url_handler.close()
+        if self._mirrors is not None:
+            self._mirrors.save()
+        if getattr(self, '_layouts', None) is not None:
+            self._layouts.save()
 
     #
     # helpers
     #
+    def _check_mirrors(self, key, handler, action: tuple, transfer=False,
+                       quiet=False):
+        """Like `_check_retrieve()`, but try all mirrors and dirhash variants
+
+        Mirrors are tried best first. In each mirror, all dirhash variants
+        used in the store are tried, the most recently successful one
+        first.
+
+        Returns False, if the key is not found on any mirror. Raises
+        `RemoteError`, if no mirror could be queried. With ``transfer``,
+        the duration of the operation is recorded as a throughput
+        measurement. With ``quiet``, failures are only logged, and not
+        reported to git-annex.
+        """
+        if len(self._mirror_tmpls) > 1:
+            self._probe_mirrors()
+        dirhashes = self._get_dirhash_candidates()
+        found_nothing = False
+        for mirror in self._mirrors.ordered(get_key_size(key)):
+            for dirhash in dirhashes:
+                url = self._get_key_urls(key, dirhash)[mirror]
+                start = time.monotonic()
+                try:
+                    res = handler(url)
+                except UrlOperationsResourceUnknown:
+                    # the mirror works, but does not have the key (yet)
+                    self._mirrors.record(mirror, time.monotonic() - start)
+                    found_nothing = True
+                    continue
+                except Exception as e:
+                    # any other failure (e.g., an unreachable host) means
+                    # the mirror is down for now
+                    self._mirrors.record_failure(mirror)
+                    stats.count('failed-requests')
+                    msg = f'Failed to {action[0]} key {key!r} ' \
+                          f'{action[1]} {url!r}: {e}'
+                    if quiet:
+                        lgr.debug(msg)
+                    else:
+                        self.message(msg, type='debug')
+                    # no need to try other variants on this mirror
+                    break
+                self._mirrors.record(
+                    mirror,
+                    time.monotonic() - start,
+                    res.get('content-length', 0) if transfer else 0,
+                )
+                if self._layouts is not None:
+                    self._layouts.hit(dirhash)
+                return True
+        if found_nothing:
+            return False
+        raise RemoteError(
+            f'Failed to {action[0]} {key!r} {action[1]} any of '
+            f'{list(self._mirror_tmpls)!r}')
+
+    def _remove_batch(self, keys):
+        """Remove keys from the store at ``url=``
+
+        Returns, per key, whether it was found, or a `RemoteError`.
+        """
+        if self._manifest is not None:
+            # before the keys are gone, a manifest should never list a key
+            # that is not present
+            try:
+                self._manifest.remove(*keys)
+            except Exception as e:
+                # the manifest is merely an optimization, it must not keep
+                # keys from being removed. the batch of removals can be on
+                # behalf of any job, do not talk to git-annex
+                stats.count('key-manifest-failures')
+                lgr.debug('Cannot remove keys from the key manifest: %s', e)
+        # a key could be in any dirhash variant used in the store
+        dirhashes = self._get_dirhash_candidates()
+        key_urls = {
+            key: [self._get_key_urls(key, d)[self._primary]
+                  for d in dirhashes]
+            for key in keys
+        }
+        urls = [url for urls in key_urls.values() for url in urls]
+        deleted = dict(zip(urls, self.url_handler.delete_many(urls)))
+        results = []
+        for key in keys:
+            found = False
+            error = None
+            for url in key_urls[key]:
+                res = deleted[url]
+                if isinstance(res, UrlOperationsResourceUnknown):
+                    continue
+                if isinstance(res, Exception):
+                    error = RemoteError(f'Cannot remove {key!r} at {url!r}')
+                    error.__cause__ = res
+                    break
+                found = True
+            results.append(error or found)
+        self._prune_pool([k for k, r in zip(keys, results) if r is True])
+        return results
+
+    def _store_from_pool(self, key):
+        """Link a key from the content pool into the dataset, if possible
+
+        Returns whether the key is stored.
+        """
+        try:
+            if self._pool is None or not self._pool.is_poolable(key) \
+                    or not self._pool.enabled:
+                return False
+            linked = self._pool.link(
+                key, self._get_key_urls(key)[self._primary])
+        except Exception as e:
+            self.message(
+                f'Cannot link {key!r} from the content pool: {e}',
+                type='debug')
+            return False
+        stats.count('pool-hits' if linked else 'pool-misses')
+        return linked
+
+    def _add_to_pool(self, key):
+        if self._pool is None or not self._pool.is_poolable(key):
+            return
+        try:
+            if self._pool.enabled:
+                self._pool.add(key, self._get_key_urls(key)[self._primary])
+        except Exception as e:
+            # the key is stored, it just cannot be shared
+            self.message(
+                f'Cannot add {key!r} to the content pool: {e}',
+                type='debug')
+
+    def _prune_pool(self, keys):
+        # drop removed keys from the content pool, unless other datasets
+        # still have them
+        if self._pool is None:
+            return
+        keys = [k for k in keys if self._pool.is_poolable(k)]
+        try:
+            if keys and self._pool.enabled:
+                self._pool.prune(keys)
+        except Exception as e:
+            # a leftover in the pool is not an error, it can be reused.
+            # the batch of removals can be on behalf of any job, do not
+            # talk to git-annex
+            lgr.debug('Cannot prune the content pool: %s', e)
+
+    def _get_manifest_listing(self, key):
+        """Whether the key manifest lists a key, if that can be trusted
+
+        Returns ``None``, if the store must be asked. The manifest only
+        describes the store at ``url=``, and is not consulted if there are
+        mirrors.
+        """
+        if self._manifest is None or len(self._mirror_tmpls) > 1:
+            return None
+        try:
+            listed = self._manifest.contains(key)
+        except Exception as e:
+            self.message(f'Cannot read the key manifest: {e}', type='debug')
+            listed = None
+        if listed is None or (listed and self._manifest_trust != 'yes'):
+            stats.count('key-manifest-misses')
+            return None
+        stats.count('key-manifest-hits')
+        return listed
+
+    def _get_prefetcher(self):
+        """Return a `Prefetcher` for a configured list of keys, or None"""
+        keys_file = self.repo.cfg.get('datalad.ria.prefetch-list')
+        if not keys_file or self.match:
+            # with `match=`, key URLs need a GETURLS request, and prefetch
+            # threads must not talk to git-annex
+            return None
+        # relative to the root of the worktree
+        keys_file = self.repo.dot_git.parent / Path(keys_file).expanduser()
+        try:
+            keys = keys_file.read_text().split()
+        except OSError as e:
+            self.message(f'Cannot read prefetch list {keys_file}: {e}',
+                         type='debug')
+            return None
+        # next to the temporary files of git-annex, to move content into
+        # place without a copy
+        tmp_dir = self.repo.dot_git / 'annex' / 'tmp'
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        objects_dir = self.repo.dot_git / 'annex' / 'objects'
+        max_bytes = int(self.repo.cfg.obtain('datalad.ria.prefetch-size'))
+        # by default, as many as a store host may get channels. for ssh://
+        # stores, the channel pool adapts the actual number to the
+        # throughput
+        workers = int(self.repo.cfg.obtain('datalad.ria.prefetch-jobs')) \
+            or int(self.repo.cfg.obtain('datalad.ria.ssh-channels'))
+        return Prefetcher(
+            keys,
+            self._prefetch,
+            Path(tempfile.mkdtemp(prefix='ria-prefetch-', dir=tmp_dir)),
+            depth=int(self.repo.cfg.obtain('datalad.ria.prefetch-depth')),
+            max_bytes=max_bytes or None,
+            skip=lambda key: (
+                objects_dir / annex_dirhash(key) / key / key).exists(),
+            workers=workers,
+        )
+
+    def _prefetch(self, key, path):
+        # runs in a thread of the prefetcher
+        with stats.timer('prefetch'):
+            found = self._check_mirrors(
+                key,
+                partial(self._download_verified,
+                        to_path=path,
+                        digest=get_key_digest(key)),
+                ('prefetch', 'from'),
+                transfer=True,
+                quiet=True)
+        if not found:
+            raise RemoteError(f'{key!r} not found in store')
+
+    def _download_verified(self, url, to_path, digest):
+        # a download, with the checksum of the content computed on the fly,
+        # unless it would need a read of the downloaded file
+        if digest is None or url.startswith('file://'):
+            return self.url_handler.download(url, to_path)
+        algorithm, expected = digest
+        res = self.url_handler.download(url, to_path, hash=[algorithm])
+        if res.get(algorithm) != expected:
+            stats.count('verify-failures')
+            # nothing to resume from
+            to_path.unlink(missing_ok=True)
+            raise UrlOperationsRemoteError(
+                url,
+                message=f'{algorithm} checksum mismatch, '
+                        f'got {res.get(algorithm)}, expected {expected}')
+        return res
+
+    def _get_dirhash_candidates(self):
+        if self._layouts is None:
+            # a custom URL template, no alternatives
+            return [self._dirhash]
+        return self._layouts.candidates()
+
+    def get_key_urls(self, key):
+        # the URL in the store at `url=`
+        return [self._get_key_urls(key)[self._primary]]
+
+    def extract_tmpl_props(self, tmpl, *, urls=None, key=None):
+        # like in UNCURL, but hash directories are computed locally,
+        # rather than requested from git-annex one key at a time.
+        # URL match groups take precedence, like in UNCURL
+        props = super().extract_tmpl_props(tmpl='', urls=urls, key=key)
+        if key:
+            if 'annex_dirhash' in tmpl:
+                props.setdefault('annex_dirhash', annex_dirhash(key))
+            if 'annex_dirhash_lower' in tmpl:
+                props.setdefault(
+                    'annex_dirhash_lower', annex_dirhash_lower(key))
+        return props
+
+    def _get_key_urls(self, key, dirhash=None):
+        """Return a mapping of all mirrors to the URL of a key in them
+
+        By default, URLs use the dirhash variant of the declared layout.
+        """
+        if dirhash is None:
+            dirhash = self._dirhash
+        if self.match:
+            # URLs on record for a key can contribute template properties,
+            # the result cannot be memoized
+            return self._render_key_urls(
+                key, dirhash, tuple(self.annex.geturls(key, prefix='')))
+        return self._render_key_urls_cached(key, dirhash)
+
+    def _render_key_urls(self, key, dirhash, recorded_urls=None):
+        tmpls = self._layout_tmpls[dirhash]
+        # all templates have the same properties
+        props = self.extract_tmpl_props(
+            tmpl=' '.join(tmpls.values()),
+            urls=recorded_urls,
+            key=key,
+        )
+        return {
+            mirror: tmpl.format(**props)
+            for mirror, tmpl in tmpls.items()
+        }
+
+    def _probe_mirrors(self):
+        # measure the RTT of mirrors without a (cached) estimate once, to
+        # have all of them considered for retrieval
+        with self._mirrors_lock:
+            if self._mirrors_probed:
+                return
+            self._mirrors_probed = True
+            for mirror in self._mirrors.unmeasured():
+                start = time.monotonic()
+                try:
+                    self.url_handler.stat(self._mirror_probe_urls[mirror])
+                except UrlOperationsResourceUnknown:
+                    pass
+                except Exception as e:
+                    lgr.debug('Failed to probe mirror %s: %s', mirror, e)
+                    self._mirrors.record_failure(mirror)
+                    continue
+                self._mirrors.record(mirror, time.monotonic() - start)
+
+    def _get_prepared(self, ria_url):
+        """Return the dataset ID, cached across startups if possible, and
+        the layout versions of the store and the dataset in it"""
+        base_url = ria_url[4:]
+        cache = self._get_prepare_cache()
+        cache_key = self._get_prepare_cache_key(ria_url)
+        # the committed dataset ID is immutable, but it could be
+        # overridden in the local config
+        signature = get_file_signature(self.repo.dot_git / 'config')
+        prepared = cache.get(cache_key)
+        if prepared is not None and prepared['signature'] == signature:
+            # match the layout of the actual store
+            versions = self._get_layout_versions(base_url, prepared['dsid'])
+            if prepared.get('versions') == versions:
+                stats.count('prepare-cache-hits')
+                return prepared['dsid'], versions
+        stats.count('prepare-cache-misses')
+        dsid = self._get_ria_dsid()
+        versions = self._get_layout_versions(base_url, dsid)
+        cache.set(cache_key, dict(
+            dsid=dsid, versions=versions, signature=signature))
+        return dsid, versions
+
+    def _get_layout_versions(self, base_url, dsid):
+        try:
+            return get_layout_versions(base_url, dsid)
+        except (OSError, RuntimeError, UrlOperationsRemoteError) as e:
+            # RuntimeError covers a failed SSH command (CommandError).
+            # only a missing version file means the default layout, the
+            # layout of a store that cannot be read is unknown
+            raise RemoteError(
+                f'Cannot read the layout versions of {base_url}: {e}'
+            ) from e
+
+    def _emit_stats(self):
+        if getattr(self, '_render_key_urls_cached', None) is None:
+            # never prepared, nothing happened
+            return
+        info = self._render_key_urls_cached.cache_info()
+        stats.count('key-url-cache-hits', info.hits)
+        stats.count('key-url-cache-misses', info.misses)
+        record = stats.as_dict()
+        record.update(
+            time=round(time.time(), 3),
+            pid=os.getpid(),
+            remote=self.remotename,
+            store=self._primary,
+        )
+        emit_stats(record, self.repo.cfg.get('datalad.ria.stats-file'))
+
+    def _get_archive(self):
+        with self._archive_lock:
+            if self._archive is None:
+                self._archive = RiaArchive(
+                    f'{self._dataset_url}/archives/archive.7z',
+                    self.url_handler,
+                    JsonFileCache(
+                        self.repo.dot_git / 'datalad' / 'ria'
+                        / 'ora2-archives.json'),
+                )
+            return self._archive
+
+    def _get_archive_member(self, key):
+        """Return the name of the archive member of a key, or None"""
+        # the archive is not reflected in a listing of the object tree,
+        # but trying all dirhash variants costs no requests
+        dirhashes = [self._dirhash] + [
+            d for d in object_tree_dirhash.values() if d != self._dirhash]
+        try:
+            archive = self._get_archive()
+            for dirhash in dirhashes:
+                member = get_archive_member(
+                    annex_dirhash_lower(key)
+                    if dirhash == 'annex_dirhash_lower'
+                    else annex_dirhash(key),
+                    key,
+                )
+                if member in archive:
+                    return member
+        except RiaArchiveError as e:
+            raise RemoteError(str(e)) from e
+        return None
+
+    def _in_archive(self, key):
+        return self._get_archive_member(key) is not None
+
+    def _get_prepare_cache(self):
+        return JsonFileCache(
+            self.repo.dot_git / 'datalad' / 'ria' / 'ora2-prepare.json')
+
+    def _get_prepare_cache_key(self, ria_url):
+        # no request to git-annex, that would cost as much as the cache
+        # saves. The location guards against a copied .git directory
+        return f'{self.repo.dot_git.parent} {ria_url}'
+
     def _get_ria_dsid(self):
         # check if the remote has a particular dataset ID configured
         # via git-annex
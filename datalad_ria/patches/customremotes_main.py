@@ -0,0 +1,33 @@
+"""Serve special remotes that support the ASYNC protocol extension
+
+The original special remote main loop of DataLad (used by the
+``super_main()`` entrypoint of all DataLad special remotes) always uses
+``annexremote.Master``, and git-annex starts one special remote process per
+concurrent job.
+
+This patch uses :class:`datalad_ria.annex_async.AsyncMaster` instead for
+special remote classes with a true ``supports_async`` attribute. Such
+a remote serves all jobs of a git-annex process in a single process, with
+shared caches and connections. All other special remotes are unaffected.
+"""
+
+from datalad_next.patches import apply_patch
+
+
+def _main(args, cls):
+    """Unprotected portion"""
+    assert(cls is not None)
+    if getattr(cls, 'supports_async', False):
+        from datalad_ria.annex_async import AsyncMaster as Master
+    else:
+        from annexremote import Master
+    master = Master()
+    remote = cls(master)
+    master.LinkRemote(remote)
+    master.Listen()
+    # cleanup
+    if hasattr(remote, 'stop'):
+        remote.stop()
+
+
+apply_patch('datalad.customremotes.main', None, '_main', _main)
@@ -2,4 +2,9 @@ from . import (
     ssh_exec,
     sshremoteio,
     sshconnector,
+    sshmultiplex,
+    sshoptions,
+    sshremoteio_transfer,
+    sshremoteio_memo,
+    customremotes_main,
 )
@@ -0,0 +1,204 @@
+"""Share SSH ControlMaster processes across processes with managed lifetime
+
+The original code ties the lifetime of a multiplexed SSH connection to the
+process that opened it. Each Python process registers
+``ssh_manager.close()`` to run at exit, and this call stops any
+ControlMaster process it started. Every ``git-annex-remote-ora2`` process
+(and every ``datalad`` call) therefore pays key exchange and
+authentication anew, and a ControlMaster could even be stopped while
+another process is still using it.
+
+This patch adds reference counting to ``MultiplexSSHConnection``. All
+connections already use a per-user socket directory
+(``datalad.locations.sockets``). Next to each control socket, a
+``<socket>.refs`` directory now holds one entry per process that uses the
+connection. ``open()`` registers the calling process, and ``close()``
+releases it. A ControlMaster is only stopped once no other live process
+holds a reference. Entries of processes that have died are pruned.
+``MultiplexSSHManager.close()`` releases the references of all connections
+of a process, including those to a ControlMaster that was already running
+when the process started (the original code does not close those at all).
+
+When the last reference is released, the ControlMaster is left running
+and expires on its own after the ``ControlPersist`` duration configured
+via ``datalad.ria.ssh-control-persist`` (default: ``15m``, matching the
+core default). Consecutive ``git-annex`` and ``datalad`` calls against the
+same store can thereby reuse a single authenticated transport. Setting
+the configuration to ``no`` stops the ControlMaster (``ssh -O exit``) as
+soon as the last reference is released, regardless of which process
+started it.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from pathlib import Path
+
+from datalad import cfg
+from datalad.support.exceptions import CommandError
+from datalad.support.sshconnector import (
+    MultiplexSSHConnection,
+    MultiplexSSHManager,
+)
+from datalad.utils import ensure_list
+from datalad_next.runners import StdOutErrCapture
+
+from datalad_next.patches import apply_patch
+
+# use same logger as -core
+lgr = logging.getLogger('datalad.support.sshconnector')
+
+
+# keep the originals around, we only wrap them
+_orig_MultiplexSSHConnection_open = MultiplexSSHConnection.open
+_orig_MultiplexSSHManager_close = MultiplexSSHManager.close
+
+
+def _get_refs_dir(ctrl_path: Path) -> Path:
+    return ctrl_path.with_suffix('.refs')
+
+
+def _pid_is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # exists, but belongs to somebody else
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def _register_ref(ctrl_path: Path, pid: int) -> None:
+    refs_dir = _get_refs_dir(ctrl_path)
+    refs_dir.mkdir(exist_ok=True)
+    (refs_dir / str(pid)).touch()
+
+
+def _release_ref(ctrl_path: Path, pid: int) -> list[int]:
+    """Remove the reference of ``pid`` and report the remaining holders
+
+    References of processes that are no longer alive are removed too.
+    """
+    refs_dir = _get_refs_dir(ctrl_path)
+    (refs_dir / str(pid)).unlink(missing_ok=True)
+    holders = []
+    if not refs_dir.exists():
+        return holders
+    for ref in refs_dir.iterdir():
+        try:
+            ref_pid = int(ref.name)
+        except ValueError:
+            # not ours, ignore
+            continue
+        if _pid_is_alive(ref_pid):
+            holders.append(ref_pid)
+        else:
+            lgr.log(5, "Pruning stale SSH connection reference %s", ref)
+            ref.unlink(missing_ok=True)
+    if not holders:
+        try:
+            refs_dir.rmdir()
+        except OSError:
+            # somebody else registered in the meantime, fine
+            pass
+    return holders
+
+
+def _get_control_persist() -> str | None:
+    """Return the configured ControlPersist value, or None if disabled"""
+    persist = str(cfg.obtain('datalad.ria.ssh-control-persist')).strip()
+    if persist.lower() in ('', '0', 'no', 'false', 'off'):
+        return None
+    return persist
+
+
+def MultiplexSSHConnection_open(self):
+    persist = _get_control_persist()
+    if persist is not None:
+        # apply the configured lifetime for any ControlMaster we start
+        self._ssh_open_args = [
+            f'ControlPersist={persist}'
+            if a.startswith('ControlPersist=') else a
+            for a in self._ssh_open_args
+        ]
+    res = _orig_MultiplexSSHConnection_open(self)
+    if not getattr(self, '_ria_ref_registered', False):
+        # self._lock[1] is the inter-process lock for this control path
+        with self._lock[1]:
+            _register_ref(self.ctrl_path, os.getpid())
+        self._ria_ref_registered = True
+    return res
+
+
+def MultiplexSSHConnection_close(self):
+    with self._lock[1]:
+        holders = _release_ref(self.ctrl_path, os.getpid())
+    self._ria_ref_registered = False
+    if holders:
+        lgr.debug(
+            "Not closing %s, still in use by %i other process(es)",
+            self, len(holders))
+        return
+    if _get_control_persist() is not None:
+        lgr.debug(
+            "Not closing %s, leaving it to expire after ControlPersist "
+            "timeout", self)
+        return
+    if not self.ctrl_path.exists():
+        return
+    # the last user stops the ControlMaster, even if it was started by
+    # another process
+    cmd = self._assemble_multiplex_ssh_cmd(["-O", "exit"])
+    lgr.debug("Closing %s by calling %s", self, cmd)
+    try:
+        self.runner.run(cmd, protocol=StdOutErrCapture)
+    except CommandError as e:
+        lgr.debug("Failed to run close command")
+        if self.ctrl_path.exists():
+            lgr.debug("Removing existing control path %s", self.ctrl_path)
+            self.ctrl_path.unlink()
+        if e.code != 255:
+            # not a "normal" SSH error
+            raise e
+
+
+def MultiplexSSHManager_close(self, allow_fail=True, ctrl_path=None):
+    # the original skips connections that existed before this manager was
+    # initialized, or whose socket is gone, but this process may hold a
+    # reference to them nevertheless
+    ctrl_paths = [Path(p) for p in ensure_list(ctrl_path)]
+    for c in list((self._connections or {}).values()):
+        if not getattr(c, '_ria_ref_registered', False) \
+                or (ctrl_paths and c.ctrl_path not in ctrl_paths):
+            continue
+        if c.ctrl_path not in (self._prev_connections or []) \
+                and c.ctrl_path.exists():
+            # the original closes it
+            continue
+        if allow_fail:
+            c.close()
+        else:
+            try:
+                c.close()
+            except Exception as e:
+                lgr.debug("Failed to close a connection: %s", e)
+    _orig_MultiplexSSHManager_close(
+        self, allow_fail=allow_fail, ctrl_path=ctrl_path)
+
+
+apply_patch(
+    'datalad.support.sshconnector', 'MultiplexSSHConnection', 'open',
+    MultiplexSSHConnection_open,
+)
+apply_patch(
+    'datalad.support.sshconnector', 'MultiplexSSHConnection', 'close',
+    MultiplexSSHConnection_close,
+)
+apply_patch(
+    'datalad.support.sshconnector', 'MultiplexSSHManager', 'close',
+    MultiplexSSHManager_close,
+)
@@ -0,0 +1,75 @@
+"""Apply per-store SSH options to all SSH calls
+
+The original code offers no way to tune the SSH transport for a particular
+host. The default cipher negotiation can severely limit throughput on fast
+links.
+
+This patch extends ``BaseSSHConnection.__init__()`` to append any SSH
+options configured for the connection's host (see
+:mod:`datalad_ria.ssh_tuning`) to ``BaseSSHConnection._ssh_args``. These
+arguments are part of every SSH command line that is derived from a
+connection: remote command execution via ``_exec_ssh()``, ``scp`` calls in
+``BaseSSHConnection.get()/put()``, the ``SSHRemoteIO`` shell, and the
+start of a ControlMaster process. The latter is the one that matters for
+multiplexed connections, because all sessions share its transport.
+
+Because a running ControlMaster keeps the options it was started with,
+this patch also wraps ``get_connection_hash()``, which names the control
+socket of a multiplexed connection. Configured options become part of the
+hash, and a ControlMaster that was started with different (or no) options
+is not reused. Without configured options, the hash is unchanged.
+"""
+
+from hashlib import md5
+import logging
+
+from datalad.support.sshconnector import (
+    BaseSSHConnection,
+    get_connection_hash,
+)
+
+from datalad_next.patches import apply_patch
+
+# use same logger as -core
+lgr = logging.getLogger('datalad.support.sshconnector')
+
+
+# keep the original around, we only wrap it
+_orig_BaseSSHConnection__init__ = BaseSSHConnection.__init__
+_orig_get_connection_hash = get_connection_hash
+
+
+def BaseSSHConnection__init__(self, sshri, *args, **kwargs):
+    _orig_BaseSSHConnection__init__(self, sshri, *args, **kwargs)
+    # THIS IS THE PATCH
+    # local import, to keep `python -m datalad_ria.ssh_tuning` clean
+    from datalad_ria.ssh_tuning import (
+        get_ssh_options,
+        ssh_options_to_args,
+    )
+    opts = get_ssh_options(self.sshri.hostname)
+    if opts:
+        lgr.debug('Using SSH options %r for %s', opts, self.sshri)
+        self._ssh_args.extend(ssh_options_to_args(opts))
+
+
+def _get_connection_hash(hostname, *args, **kwargs):
+    conhash = _orig_get_connection_hash(hostname, *args, **kwargs)
+    from datalad_ria.ssh_tuning import get_ssh_options
+    opts = get_ssh_options(hostname)
+    if not opts:
+        return conhash
+    # same length as the original, to stay within socket path limits
+    return md5(  # nosec
+        '{}{}'.format(conhash, ' '.join(opts)).encode('utf-8')
+    ).hexdigest()[:8]
+
+
+apply_patch(
+    'datalad.support.sshconnector', 'BaseSSHConnection', '__init__',
+    BaseSSHConnection__init__,
+)
+apply_patch(
+    'datalad.support.sshconnector', None, 'get_connection_hash',
+    _get_connection_hash,
+)
@@ -0,0 +1,88 @@
+"""Memoize read-only queries of store metadata in `SSHRemoteIO`
+
+The original code re-reads store metadata, such as the ``ria-layout-version``
+files at the store and dataset level, the store ``config``, and dataset
+alias symlinks, over SSH whenever an operation needs them. This includes
+every start of a special remote within the same process.
+
+This patch routes ``SSHRemoteIO.read_file()`` and ``SSHRemoteIO.exists()``
+through the process-wide :data:`datalad_ria.sshio.query_memo`, keyed by
+host, query type, and path. ``ORARemote.verify_store()`` declares the store
+base path to the memo, and only metadata paths of such a store are
+memoized. Queries for annex objects, or a dataset's git ``config``, are not
+affected.
+
+All methods that modify a remote store (``write_file()``, ``remove()``,
+``remove_dir()``, ``rename()``, ``mkdir()``, ``symlink()``, ``put()``)
+invalidate memoized results for the paths they touch, such that a client
+always sees its own writes.
+"""
+
+import logging
+
+from datalad.distributed.ora_remote import (
+    ORARemote,
+    SSHRemoteIO,
+)
+
+from datalad_next.patches import apply_patch
+
+from datalad_ria.sshio import query_memo
+
+# use same logger as -core
+lgr = logging.getLogger('datalad.customremotes.ria_remote')
+
+_orig_ORARemote_verify_store = ORARemote.verify_store
+
+
+def _host(io):
+    return io.ssh.sshri.as_str()
+
+
+def _memoized(query):
+    orig = getattr(SSHRemoteIO, query)
+
+    def _query(self, path, *args, **kwargs):
+        return query_memo.get(
+            _host(self), query, path,
+            lambda: orig(self, path, *args, **kwargs))
+
+    return _query
+
+
+def _invalidating(method, path_args):
+    orig = getattr(SSHRemoteIO, method)
+
+    def _modify(self, *args, **kwargs):
+        try:
+            return orig(self, *args, **kwargs)
+        finally:
+            # also invalidate on failure, the remote state is unknown
+            query_memo.invalidate(
+                _host(self), *(args[i] for i in path_args if i < len(args)))
+
+    return _modify
+
+
+def ORARemote_verify_store(self):
+    # declare the store, such that its metadata is memoized
+    if isinstance(self.io, SSHRemoteIO):
+        query_memo.add_store(_host(self.io), self.store_base_path)
+    return _orig_ORARemote_verify_store(self)
+
+
+for target, patch in (
+        ('read_file', _memoized('read_file')),
+        ('exists', _memoized('exists')),
+        ('write_file', _invalidating('write_file', (0,))),
+        ('remove', _invalidating('remove', (0,))),
+        ('remove_dir', _invalidating('remove_dir', (0,))),
+        ('rename', _invalidating('rename', (0, 1))),
+        ('mkdir', _invalidating('mkdir', (0,))),
+        ('symlink', _invalidating('symlink', (1,))),
+        ('put', _invalidating('put', (1,))),
+):
+    apply_patch('datalad.distributed.ora_remote', 'SSHRemoteIO', target, patch)
+
+apply_patch('datalad.distributed.ora_remote', 'ORARemote', 'verify_store',
+            ORARemote_verify_store)
@@ -0,0 +1,148 @@
+"""Report real byte-level progress for `SSHRemoteIO` transfers
+
+The original code has two problems with progress reporting.
+
+1. ``SSHRemoteIO.put()`` uses ``scp``, and never calls the progress
+   callback. git-annex cannot show progress for uploads, and its stall
+   detection has nothing to go by.
+
+2. ``SSHRemoteIO.get()`` calls the progress callback for every chunk
+   read, which floods git-annex with ``PROGRESS`` messages for large
+   files. For keys without size information it falls back on ``scp``,
+   and reports no progress at all.
+
+This patch replaces ``scp`` with streaming the file content through a
+dedicated session of the (shared) SSH connection (``cat`` on the remote
+end) in both directions, and reports the transferred bytes via
+:class:`datalad_ria.progress.ThrottledProgress`. The throughput of each
+transfer is logged at DEBUG level to the ``datalad.ria.progress`` logger.
+
+Because a download has its own session, it ends when the remote file
+does, and ``SSHRemoteIO.get()`` raises an error when it received fewer
+(or more) bytes than the size of the key, instead of waiting forever on
+the persistent shell for bytes that never come. It also accepts an
+optional ``data_cb`` that is called with every chunk of content received
+(e.g., to compute a checksum while the content is written). A missing
+file is reported without an extra round trip, by raising
+:class:`datalad_ria.sshio.RemoteFileNotFoundError`.
+"""
+
+import logging
+from os.path import basename
+from pathlib import Path
+import subprocess
+
+from datalad.distributed.ora_remote import (
+    RemoteError,
+    RIARemoteError,
+    sh_quote,
+)
+
+from datalad_next.patches import apply_patch
+
+from datalad_ria.progress import ThrottledProgress
+from datalad_ria.sshio import (
+    RemoteFileNotFoundError,
+    popen_ssh,
+)
+
+# use same logger as -core
+lgr = logging.getLogger('datalad.customremotes.ria_remote')
+
+# exit status of a download command, when the file does not exist
+_MISSING_EXIT = 44
+
+
+def SSHRemoteIO_put(self, src, dst, progress_cb):
+    src = Path(src)
+    progress = ThrottledProgress(
+        progress_cb,
+        src.stat().st_size,
+        label=f'upload of {src.name}',
+    )
+    proc = popen_ssh(
+        self,
+        'cat > {}'.format(sh_quote(str(dst))),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        with src.open('rb') as src_fp:
+            while True:
+                chunk = src_fp.read(self.buffer_size)
+                if not chunk:
+                    break
+                proc.stdin.write(chunk)
+                progress.update(progress.nbytes + len(chunk))
+        proc.stdin.close()
+    except BrokenPipeError:
+        # remote end went away, error is reported below
+        pass
+    stderr = proc.stderr.read().decode(errors='replace')
+    if proc.wait() != 0:
+        raise RIARemoteError(
+            f"Failed to upload {src} to {dst}: {stderr.strip()}")
+    progress.finish()
+
+
+# The method 'SSHRemoteIO_get' is a patched version of
+# 'datalad/distributed/ora-remote.py:SSHRemoteIO.get'
+# from datalad@58b8e06317fe1a03290aed80526bff1e2d5b7797
+def SSHRemoteIO_get(self, src, dst, progress_cb, data_cb=None):
+    key = basename(str(src))
+    try:
+        size = self._get_download_size_from_key(key)
+    except RemoteError as e:
+        raise RemoteError(f"src: {src}") from e
+
+    # PATCH: throttled progress reporting
+    progress = ThrottledProgress(
+        progress_cb, size, label=f'download of {key}')
+
+    # PATCH: stream through a dedicated session instead of the persistent
+    # shell (or scp for keys without size information). It ends with EOF,
+    # even if the file is shorter than the key's size, and reports progress.
+    # A missing file is told by the exit status, instead of checking for it
+    # in another round trip beforehand
+    quoted_src = sh_quote(str(src))
+    proc = popen_ssh(
+        self,
+        f'if [ -e {quoted_src} ]; then cat {quoted_src}; '
+        f'else exit {_MISSING_EXIT}; fi',
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    bytes_received = 0
+    with open(dst, 'wb') as target_file:
+        while True:
+            c = proc.stdout.read1(self.buffer_size)
+            if not c:
+                break
+            bytes_received += len(c)
+            target_file.write(c)
+            if data_cb:
+                data_cb(c)
+            progress.update(bytes_received)
+    stderr = proc.stderr.read().decode(errors='replace')
+    returncode = proc.wait()
+    if returncode == _MISSING_EXIT:
+        # nothing was written
+        Path(dst).unlink()
+        raise RemoteFileNotFoundError(
+            f"annex object {src} does not exist.")
+    if returncode != 0:
+        raise RIARemoteError(
+            f"Failed to download {src}: {stderr.strip()}")
+    if size is not None and bytes_received != size:
+        raise RIARemoteError(
+            f"Received {bytes_received} bytes of {src}, expected {size}")
+    progress.finish()
+
+
+for target, patch in (
+        ('put', SSHRemoteIO_put),
+        ('get', SSHRemoteIO_get),
+):
+    apply_patch('datalad.distributed.ora_remote', 'SSHRemoteIO', target, patch)
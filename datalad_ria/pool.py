@@ -0,0 +1,186 @@
+"""Store-wide pool of annex key content, shared by all datasets
+
+Datasets in a RIA store often contain the same files (e.g., templates,
+atlases), and each dataset's object tree holds its own copy. A store can
+have a content-addressed pool of keys in ``<store>/.pool``, with one file
+per key at ``.pool/<dirhash>/<key>`` (using the lower-case hash
+directories). The files in the object trees of datasets are hardlinks of
+the pool's files. Storing a key that is in the pool already is then a
+metadata-only operation: it is linked into the dataset's object tree,
+without any data transfer.
+
+A pool is enabled by creating the (empty) directory ``.pool`` in the root
+of a store. It is only used for keys of checksum backends (e.g.,
+``MD5E``, ``SHA256E``), because only their name identifies their content,
+and only for ``file://`` and ``ssh://`` stores. All of a store must be on
+a single file system.
+
+A pool's file is removed, once it is no longer linked into any dataset.
+Links outside of the store keep it too (e.g., a retrieval into a dataset
+on the same file system can be a hardlink of the store's file). A
+hardlink is independent of the pool's file, and the removal of a pool
+file never affects the content in a dataset. Concurrent storage of a key
+in another dataset can at worst miss the pool, and upload the content.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from pathlib import Path
+import shlex
+import threading
+from typing import Iterable
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+from datalad_ria.dirhash import annex_dirhash_lower
+from datalad_ria.verify import get_key_digest
+
+lgr = logging.getLogger('datalad.ria.pool')
+
+POOL_DIR = '.pool'
+
+_DETECT_SCRIPT = """\
+if [ -d {pool} ]; then printf 'Y\\n'; else printf 'N\\n'; fi
+"""
+
+# link a pool file {src} to {dst}, report Y on success, N if not possible
+_LINK_SCRIPT = """\
+if [ -f {src} ] && mkdir -p {dst_dir} 2>/dev/null \\
+    && {{ ln {src} {dst} 2>/dev/null || [ -f {dst} ]; }}; then
+  printf 'Y\\n'
+else
+  printf 'N\\n'
+fi
+"""
+
+# add a dataset's file {src} to the pool as {dst}, if not there yet
+_ADD_SCRIPT = """\
+mkdir -p {dst_dir} 2>/dev/null && ln {src} {dst} 2>/dev/null
+true
+"""
+
+# remove pool files that have no other link
+_PRUNE_SCRIPT = """\
+find {paths} -prune -type f -links 1 -exec rm -f {{}} + 2>/dev/null
+true
+"""
+
+
+class ContentPool:
+    """Pool of key content in a RIA store
+
+    Parameters
+    ----------
+    store_url: str
+      URL of the store (``file://`` or ``ssh://``).
+    url_handler: RiaUrlOperations
+      Handler for access to the store host via SSH.
+    """
+    def __init__(self, store_url: str, url_handler):
+        self.url = f'{store_url}/{POOL_DIR}'
+        self._scheme = urlparse(store_url).scheme
+        self._url_handler = url_handler
+        self._exists = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_poolable(key: str) -> bool:
+        """Whether the name of a key identifies its content"""
+        return get_key_digest(key) is not None
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the store has a pool, determined on first access"""
+        with self._lock:
+            if self._exists is None:
+                self._exists = self._detect()
+                lgr.debug('Content pool %s exists: %s',
+                          self.url, self._exists)
+            return self._exists
+
+    def get_key_url(self, key: str) -> str:
+        """Return the URL of a key's file in the pool"""
+        return f'{self.url}/{annex_dirhash_lower(key)}{key}'
+
+    def link(self, key: str, object_url: str) -> bool:
+        """Link a key's file in the pool to a URL in a dataset
+
+        Returns whether the key's content is now at ``object_url``, i.e.
+        False if the key is not in the pool, or it could not be linked.
+        """
+        src = self.get_key_url(key)
+        if self._scheme == 'file':
+            src_path = _url2path(src)
+            if not src_path.is_file():
+                return False
+            return _link(src_path, _url2path(object_url))
+        out = self._run(object_url, _LINK_SCRIPT.format(
+            src=shlex.quote(_url2posix(src)),
+            dst=shlex.quote(_url2posix(object_url)),
+            dst_dir=shlex.quote(_url2posix(object_url, parent=True)),
+        ))
+        return out.strip() == 'Y'
+
+    def add(self, key: str, object_url: str) -> None:
+        """Add a key's file in a dataset to the pool, if not there yet"""
+        dst = self.get_key_url(key)
+        if self._scheme == 'file':
+            _link(_url2path(object_url), _url2path(dst))
+            return
+        self._run(dst, _ADD_SCRIPT.format(
+            src=shlex.quote(_url2posix(object_url)),
+            dst=shlex.quote(_url2posix(dst)),
+            dst_dir=shlex.quote(_url2posix(dst, parent=True)),
+        ))
+
+    def prune(self, keys: Iterable[str]) -> None:
+        """Remove the pool's files of keys that are no longer linked"""
+        urls = [self.get_key_url(k) for k in keys]
+        if not urls:
+            return
+        if self._scheme == 'file':
+            for url in urls:
+                path = _url2path(url)
+                try:
+                    if path.stat().st_nlink == 1:
+                        path.unlink()
+                except FileNotFoundError:
+                    pass
+            return
+        self._run(self.url, _PRUNE_SCRIPT.format(
+            paths=' '.join(shlex.quote(_url2posix(u)) for u in urls)))
+
+    def _detect(self) -> bool:
+        if self._scheme == 'file':
+            return _url2path(self.url).is_dir()
+        out = self._run(self.url, _DETECT_SCRIPT.format(
+            pool=shlex.quote(_url2posix(self.url))))
+        return out.strip() == 'Y'
+
+    def _run(self, url: str, script: str) -> str:
+        with self._url_handler._get_handler(url).channel(url) as (io, _):
+            # in a subshell, to keep the persistent shell alive
+            return io._run('(\n{})'.format(script), no_output=False)
+
+
+def _url2path(url: str) -> Path:
+    return Path(url2pathname(urlparse(url).path))
+
+
+def _url2posix(url: str, parent: bool = False) -> str:
+    path = urlparse(url).path
+    return path.rsplit('/', 1)[0] if parent else path
+
+
+def _link(src: Path, dst: Path) -> bool:
+    try:
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        os.link(src, dst)
+    except FileExistsError:
+        return True
+    except OSError as e:
+        lgr.debug('Cannot link %s to %s: %s', src, dst, e)
+        return False
+    return True
@@ -0,0 +1,177 @@
+"""Speculative retrieval of the keys that git-annex requests next
+
+git-annex requests keys from a special remote one at a time. After each
+retrieval, it moves the content into place and verifies it, before it
+requests the next key, and the connection to the store idles meanwhile.
+If the keys that are about to be retrieved are known in advance (e.g.,
+from ``git annex find --not --in here --format='${key}\\n' <paths>``, in
+the order of the paths), a :class:`Prefetcher` retrieves the keys that
+follow the one currently requested in the background, into a staging
+directory. When git-annex requests a key that was prefetched, it is
+merely moved into place.
+
+Up to ``workers`` keys are retrieved concurrently. For ``ria+ssh://``
+stores, the transfers additionally wait for a channel of the host's
+:class:`~datalad_ria.sshio.SSHChannelPool`, such that their actual number
+follows its adaptive concurrency limit.
+
+The staging directory is bounded by a number of keys, and optionally a
+total size. Keys that are skipped by git-annex (e.g., because they are
+present already), are discarded once the requests have moved on by that
+number of keys.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+)
+import logging
+import os
+from pathlib import Path
+import shutil
+import threading
+from typing import (
+    Callable,
+    Iterable,
+)
+
+from datalad_ria.mirrors import get_key_size
+
+lgr = logging.getLogger('datalad.ria.prefetch')
+
+class Prefetcher:
+    """Retrieve keys ahead of their request, in a given order
+
+    Parameters
+    ----------
+    keys: iterable
+      Keys in the order in which they are expected to be requested.
+    fetch: callable
+      Called with a key and a path, must retrieve the key's content to
+      the path, or raise an exception. It is called in a background
+      thread.
+    staging_dir: Path
+      Directory for prefetched content. It should be on the same file
+      system as the targets of :meth:`take`. It is removed by
+      :meth:`close`.
+    depth: int, optional
+      Maximum number of keys following the currently requested one that
+      are prefetched.
+    max_bytes: int, optional
+      Maximum total size of the prefetched keys. Keys of unknown size are
+      not prefetched, if this is given.
+    skip: callable, optional
+      Called with a key, returns whether it need not be prefetched (e.g.,
+      because it is present locally already).
+    workers: int, optional
+      Maximum number of keys that are retrieved concurrently.
+    """
+    def __init__(
+        self,
+        keys: Iterable[str],
+        fetch: Callable[[str, Path], None],
+        staging_dir: Path,
+        *,
+        depth: int = 4,
+        max_bytes: int | None = None,
+        skip: Callable[[str], bool] | None = None,
+        workers: int = 1,
+    ):
+        self._keys = list(keys)
+        self._index = {}
+        for i, key in enumerate(self._keys):
+            self._index.setdefault(key, i)
+        self._fetch = fetch
+        self._dir = Path(staging_dir)
+        self._depth = depth
+        self._max_bytes = max_bytes
+        self._skip = skip
+        self._lock = threading.Lock()
+        # key: (future, size)
+        self._staged = {}
+        # keys requested so far, with concurrent jobs they can be
+        # requested before they could be prefetched
+        self._requested = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='ria-prefetch')
+        self._closed = False
+
+    def take(self, key: str, to_path: Path) -> bool:
+        """Move the prefetched content of a key to a path
+
+        Waits for a prefetch of the key in progress. The keys following
+        it are scheduled for prefetching. Returns whether the content was
+        prefetched. If not, it must be retrieved by other means.
+        """
+        with self._lock:
+            self._requested.add(key)
+            entry = self._staged.pop(key, None)
+            self._schedule(key)
+        if entry is None:
+            return False
+        try:
+            staged = entry[0].result()
+        except Exception as e:
+            lgr.debug('Prefetch of %s failed: %s', key, e)
+            return False
+        os.replace(staged, to_path)
+        return True
+
+    def close(self) -> None:
+        """Cancel pending prefetches, and remove the staging directory
+
+        Prefetches in progress are waited for.
+        """
+        with self._lock:
+            self._closed = True
+            for future, _ in self._staged.values():
+                future.cancel()
+            self._staged = {}
+        self._executor.shutdown(wait=True)
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _schedule(self, key: str) -> None:
+        # must be called with the lock held
+        idx = self._index.get(key)
+        if idx is None or self._closed:
+            return
+        # keys well before the requested one are not expected anymore.
+        # concurrent jobs can request keys slightly out of order
+        for k in [k for k in self._staged
+                  if self._index[k] < idx - self._depth]:
+            self._discard(k)
+        nbytes = sum(size or 0 for _, size in self._staged.values())
+        for k in self._keys[idx + 1:idx + 1 + self._depth]:
+            if k in self._staged or k in self._requested:
+                continue
+            if self._skip is not None and self._skip(k):
+                continue
+            size = get_key_size(k)
+            if self._max_bytes is not None:
+                if size is None:
+                    continue
+                if nbytes + size > self._max_bytes:
+                    break
+            nbytes += size or 0
+            self._staged[k] = (self._executor.submit(self._run, k), size)
+
+    def _run(self, key: str) -> Path:
+        path = self._dir / key
+        try:
+            self._fetch(key, path)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        return path
+
+    def _discard(self, key: str) -> None:
+        future, _ = self._staged.pop(key)
+        if not future.cancel():
+            future.add_done_callback(_remove_staged)
+
+
+def _remove_staged(future: Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().unlink(missing_ok=True)
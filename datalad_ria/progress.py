@@ -0,0 +1,115 @@
+"""Throttled transfer progress reporting"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+import logging
+import threading
+import time
+from typing import Callable
+
+lgr = logging.getLogger('datalad.ria.progress')
+
+_local = threading.local()
+
+
+class ThrottledProgress:
+    """Forward byte counts of a transfer to a callback, at a limited rate
+
+    A git-annex special remote reports transfer progress with a ``PROGRESS``
+    message. Sending one for every chunk of data is wasteful, but
+    git-annex needs regular updates for a meaningful display and its stall
+    detection. An update is forwarded when a configured time interval has
+    passed since the last one, or when at least 1% of the expected size
+    has been transferred since the last one. The final byte count is
+    always reported.
+
+    Parameters
+    ----------
+    callback: callable or None
+      Called with the total number of bytes transferred so far.
+    expected_size: int, optional
+      Total size of the transfer, if known.
+    interval: float, optional
+      Minimum number of seconds between updates. Defaults to the
+      configuration ``datalad.ria.progress-interval``.
+    label: str, optional
+      Used in the log message reporting the throughput of a finished
+      transfer.
+    """
+    def __init__(
+        self,
+        callback: Callable[[int], None] | None,
+        expected_size: int | None = None,
+        *,
+        interval: float | None = None,
+        label: str = 'transfer',
+    ):
+        if interval is None:
+            from datalad import cfg
+            interval = float(cfg.obtain('datalad.ria.progress-interval'))
+        self._callback = callback
+        self._interval = interval
+        self._step = expected_size // 100 if expected_size else None
+        self._label = label
+        self._start = time.monotonic()
+        self._last_time = self._start
+        self._last_bytes = 0
+        self.nbytes = 0
+
+    def update(self, nbytes: int) -> None:
+        """Record the total number of bytes transferred so far"""
+        self.nbytes = nbytes
+        now = time.monotonic()
+        if now - self._last_time < self._interval and (
+                not self._step or nbytes - self._last_bytes < self._step):
+            return
+        self._report(nbytes, now)
+
+    def finish(self) -> None:
+        """Report the final byte count, and log the throughput"""
+        now = time.monotonic()
+        if self.nbytes != self._last_bytes:
+            self._report(self.nbytes, now)
+        lgr.debug(
+            'Finished %s: %i bytes in %.3fs (%.1f MB/s)',
+            self._label, self.nbytes, self.duration,
+            self.throughput / 1e6)
+
+    @property
+    def duration(self) -> float:
+        """Seconds since the start of the transfer"""
+        return time.monotonic() - self._start
+
+    @property
+    def throughput(self) -> float:
+        """Average throughput in bytes per second"""
+        return self.nbytes / max(self.duration, 1e-6)
+
+    def _report(self, nbytes: int, now: float) -> None:
+        self._last_time = now
+        self._last_bytes = nbytes
+        if self._callback is not None:
+            self._callback(nbytes)
+
+
+@contextmanager
+def progress_callback(callback: Callable[[int], None] | None):
+    """Route transfer progress in the current thread to a callback
+
+    The ``UrlOperations`` API has no way to pass a progress callback to a
+    handler. Handlers that support it call the callback returned by
+    :func:`get_progress_callback` with the total number of bytes
+    transferred so far.
+    """
+    prev = getattr(_local, 'callback', None)
+    _local.callback = callback
+    try:
+        yield
+    finally:
+        _local.callback = prev
+
+
+def get_progress_callback() -> Callable[[int], None] | None:
+    """Return the progress callback of the current thread, if any"""
+    return getattr(_local, 'callback', None)
@@ -0,0 +1,232 @@
+"""Per-store SSH transport options, and a benchmark to choose them
+
+SSH options for a particular RIA store host can be declared with the
+configuration item ``datalad.ria.<host>.ssh-options``, where ``<host>`` is
+the host name as given in a ``ria+ssh://`` URL. The value is a
+whitespace-separated list of ``Option=Value`` items in the format of
+``ssh -o``, for example::
+
+    git config --global \\
+        datalad.ria.store.example.org.ssh-options \\
+        "Ciphers=aes128-gcm@openssh.com Compression=no"
+
+Options declared via ``datalad.ria.ssh-options`` apply to all hosts
+without a dedicated declaration.
+
+Suitable options can be determined with a small benchmark that tries a
+number of cipher/MAC/compression combinations against a host, and
+recommends the one with the highest throughput::
+
+    python -m datalad_ria.ssh_tuning ria+ssh://store.example.org/path
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import shlex
+import subprocess
+import time
+from typing import (
+    Dict,
+    List,
+)
+from urllib.parse import urlparse
+
+lgr = logging.getLogger('datalad.ria.ssh_tuning')
+
+
+DEFAULT_BENCHMARK_CANDIDATES = (
+    # the SSH client defaults are the baseline
+    (),
+    ('Ciphers=aes128-gcm@openssh.com',),
+    ('Ciphers=aes256-gcm@openssh.com',),
+    ('Ciphers=chacha20-poly1305@openssh.com',),
+    ('Ciphers=aes128-ctr', 'MACs=umac-64-etm@openssh.com'),
+    ('Ciphers=aes128-gcm@openssh.com', 'IPQoS=throughput'),
+    ('Ciphers=aes128-gcm@openssh.com', 'Compression=yes'),
+)
+"""Option sets tried by :func:`benchmark_ssh_options` by default"""
+
+
+def get_ssh_options(hostname: str, cfg=None) -> List[str]:
+    """Return the configured SSH options for a host
+
+    Parameters
+    ----------
+    hostname: str
+      Host name of an SSH-accessible RIA store.
+    cfg: ConfigManager, optional
+      Configuration to query. Defaults to the global ``datalad.cfg``.
+
+    Returns
+    -------
+    list
+      ``Option=Value`` items, ready to be passed to ``ssh -o``. Empty,
+      if nothing is configured.
+    """
+    if cfg is None:
+        from datalad import cfg
+    opts = cfg.get(
+        f'datalad.ria.{hostname}.ssh-options',
+        cfg.get('datalad.ria.ssh-options', None),
+    )
+    return shlex.split(opts) if opts else []
+
+
+def ssh_options_to_args(options) -> List[str]:
+    """Turn a sequence of ``Option=Value`` items into SSH arguments"""
+    args = []
+    for opt in options:
+        args.extend(['-o', opt])
+    return args
+
+
+def benchmark_ssh_options(
+    url: str,
+    *,
+    candidates=DEFAULT_BENCHMARK_CANDIDATES,
+    size: int = 100 * 1024 * 1024,
+    source: str = '/dev/urandom',
+    identity_file: str | None = None,
+) -> List[Dict]:
+    """Measure SSH transfer throughput for a set of option candidates
+
+    For each candidate a dedicated, non-multiplexed connection is opened
+    (a shared ControlMaster would have its transport settings fixed
+    already), ``size`` bytes are read from ``source`` on the remote end,
+    and sent to the client. The connection setup time is measured
+    separately, and excluded from the throughput.
+
+    Parameters
+    ----------
+    url: str
+      ``ssh://`` or ``ria+ssh://`` URL identifying the host to test.
+    candidates: iterable
+      Each candidate is a sequence of ``Option=Value`` items.
+    size: int
+      Number of bytes to transfer per candidate.
+    source: str
+      Path on the remote host to read data from. Using a source of
+      incompressible data (the default) is important for a fair comparison
+      of candidates enabling compression.
+    identity_file: str, optional
+      Passed on as ``ssh -i``. Defaults to ``datalad.ssh.identityfile``.
+
+    Returns
+    -------
+    list
+      One dict per candidate with keys ``options``, ``setup`` (seconds),
+      ``throughput`` (bytes per second), and ``error`` (None, or a message
+      why a candidate could not be tested, e.g. an unsupported cipher).
+      Sorted by descending throughput, failed candidates last.
+    """
+    if url.startswith('ria+'):
+        url = url[4:]
+    parsed = urlparse(url)
+    if parsed.scheme != 'ssh' or not parsed.hostname:
+        raise ValueError(f'ssh:// URL expected, got {url!r}')
+    if identity_file is None:
+        from datalad import cfg
+        identity_file = cfg.get('datalad.ssh.identityfile')
+
+    base_cmd = [
+        'ssh',
+        # we must not use a shared connection, the transport would be
+        # fixed already
+        '-o', 'ControlMaster=no',
+        '-o', 'ControlPath=none',
+        '-o', 'BatchMode=yes',
+    ]
+    if parsed.port:
+        base_cmd.extend(['-p', str(parsed.port)])
+    if identity_file:
+        base_cmd.extend(['-i', identity_file])
+    target = f'{parsed.username}@{parsed.hostname}' \
+        if parsed.username else parsed.hostname
+
+    results = []
+    for options in candidates:
+        cmd = base_cmd + ssh_options_to_args(options) + [target]
+        res = dict(options=list(options), setup=None, throughput=None,
+                   error=None)
+        try:
+            res['setup'] = _time_ssh(cmd + ['true'])
+            transfer = _time_ssh(
+                cmd + [f'head -c {int(size)} {shlex.quote(source)}'])
+        except subprocess.CalledProcessError as e:
+            res['error'] = f'ssh exited with {e.returncode}'
+            lgr.debug('SSH benchmark candidate %r failed: %s',
+                      options, res['error'])
+            results.append(res)
+            continue
+        res['throughput'] = size / max(transfer - res['setup'], 1e-6)
+        lgr.debug('SSH benchmark candidate %r: %.1f MB/s', options,
+                  res['throughput'] / 1e6)
+        results.append(res)
+    return sorted(
+        results,
+        key=lambda r: -1 if r['throughput'] is None else r['throughput'],
+        reverse=True,
+    )
+
+
+def _time_ssh(cmd: List[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def main(args=None):
+    """CLI entry point for ``python -m datalad_ria.ssh_tuning``"""
+    parser = argparse.ArgumentParser(
+        prog='python -m datalad_ria.ssh_tuning',
+        description='benchmark SSH cipher/MAC/compression settings '
+        'against a RIA store host, and recommend the fastest',
+    )
+    parser.add_argument(
+        'url', help='ssh:// or ria+ssh:// URL of the store host')
+    parser.add_argument(
+        '--size', type=int, default=100,
+        help='MB to transfer per candidate (default: %(default)s)')
+    parser.add_argument(
+        '--source', default='/dev/urandom',
+        help='remote file to read data from (default: %(default)s)')
+    args = parser.parse_args(args)
+
+    results = benchmark_ssh_options(
+        args.url,
+        size=args.size * 1024 * 1024,
+        source=args.source,
+    )
+    for r in results:
+        opts = ' '.join(r['options']) or '(ssh defaults)'
+        if r['error']:
+            print(f'{"failed":>12}  {opts}  [{r["error"]}]')
+        else:
+            print(f'{r["throughput"] / 1e6:>7.1f} MB/s  {opts}  '
+                  f'[setup {r["setup"]:.2f}s]')
+    best = results[0] if results else None
+    if not best or best['error']:
+        print('No working configuration found')
+        return 1
+    if not best['options']:
+        print('Recommendation: keep the SSH client defaults')
+        return 0
+    hostname = urlparse(
+        args.url[4:] if args.url.startswith('ria+') else args.url).hostname
+    print('Recommendation:\n  git config --global '
+          f'datalad.ria.{hostname}.ssh-options '
+          f'{shlex.quote(" ".join(best["options"]))}')
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
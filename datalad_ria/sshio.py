@@ -0,0 +1,312 @@
+"""SSH transport building blocks for RIA stores
+
+All channels are sessions of a (shared) SSH connection to a store host.
+When connection multiplexing is enabled (the default on all platforms but
+Windows), opening an additional channel does not require another key
+exchange or authentication.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+import logging
+from pathlib import PurePosixPath
+import subprocess
+import threading
+import time
+from typing import Callable
+
+from datalad.distributed.ora_remote import RIARemoteError
+
+lgr = logging.getLogger('datalad.ria.sshio')
+
+
+class RemoteFileNotFoundError(RIARemoteError):
+    """A file to be read on the remote end does not exist"""
+    pass
+
+
+def popen_ssh(io, remote_cmd: str, **kwargs) -> subprocess.Popen:
+    """Run a command in a dedicated session of an ``SSHRemoteIO`` connection
+
+    Unlike commands run via ``SSHRemoteIO._run()``, the command gets its
+    own stdin, stdout, and stderr. This is suitable for streaming
+    binary data of unknown length. ``kwargs`` are passed on to
+    ``subprocess.Popen``.
+    """
+    # the patched SSHRemoteIO.__init__ has already extended `_ssh_args` with
+    # anything needed to open a (non-multiplexed) connection
+    cmd = ['ssh'] + io.ssh._ssh_args + [io.ssh.sshri.as_str(), remote_cmd]
+    return subprocess.Popen(cmd, **kwargs)
+
+
+class AdaptiveConcurrency:
+    """Hill-climbing controller for the number of concurrent transfers
+
+    The aggregate throughput of all transfers is measured over time windows.
+    After each window, the concurrency limit is raised by one if the
+    throughput improved noticeably compared to the previous window, and
+    lowered by one if it dropped. Otherwise the limit is kept. This finds
+    the number of parallel transfers that saturates a link, without
+    overloading a server.
+    """
+    def __init__(
+        self,
+        minimum: int = 1,
+        maximum: int = 4,
+        initial: int | None = None,
+        *,
+        window: float = 2.0,
+        tolerance: float = 0.1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not 1 <= minimum <= maximum:
+            raise ValueError(
+                f'invalid concurrency bounds: {minimum}-{maximum}')
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = min(max(initial or minimum, minimum), maximum)
+        self.window = window
+        self.tolerance = tolerance
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._window_start = None
+        self._window_bytes = 0
+        self._last_throughput = None
+        # direction of the last adjustment
+        self._direction = 1
+
+    def record(self, nbytes: int) -> None:
+        """Record the number of bytes transferred since the last call"""
+        with self._lock:
+            now = self._clock()
+            if self._window_start is None:
+                self._window_start = now
+            self._window_bytes += nbytes
+            elapsed = now - self._window_start
+            if elapsed < self.window:
+                return
+            throughput = self._window_bytes / elapsed
+            self._adjust(throughput)
+            self._window_start = now
+            self._window_bytes = 0
+
+    def _adjust(self, throughput: float) -> None:
+        last = self._last_throughput
+        self._last_throughput = throughput
+        if last is None:
+            # first measurement, probe upwards
+            step = 1
+        elif throughput > last * (1 + self.tolerance):
+            # the last step paid off, continue in that direction
+            step = self._direction
+        elif throughput < last * (1 - self.tolerance):
+            # the last step made it worse, go back
+            step = -self._direction
+        else:
+            # plateau, no need to tie up more resources
+            return
+        new_limit = min(max(self.limit + step, self.minimum), self.maximum)
+        if new_limit != self.limit:
+            lgr.debug(
+                'Adjusting transfer concurrency %i -> %i (%.1f MB/s)',
+                self.limit, new_limit, throughput / 1e6)
+            self._direction = step
+            self.limit = new_limit
+
+
+class SSHChannelPool:
+    """Bounded pool of remote IO channels to a single SSH host
+
+    Channels are created lazily (via ``io_factory``), and kept open for
+    reuse until :meth:`close` is called. Channels for transfers of file
+    content are limited by ``concurrency.limit``, which follows the
+    throughput that transfers report via :meth:`record`. Any other command
+    (e.g., a ``stat``) only waits for one of ``concurrency.maximum``
+    channels.
+
+    Parameters
+    ----------
+    io_factory: callable
+      Returns a new channel, typically an ``SSHRemoteIO`` instance for
+      the host.
+    concurrency: AdaptiveConcurrency, optional
+      Controller for the number of channels used for transfers in
+      parallel. The pool never holds more channels than
+      ``concurrency.maximum``. Defaults to a controller with the maximum
+      set by the configuration ``datalad.ria.ssh-channels``.
+    """
+    def __init__(
+        self,
+        io_factory: Callable,
+        concurrency: AdaptiveConcurrency | None = None,
+    ):
+        if concurrency is None:
+            from datalad import cfg
+            concurrency = AdaptiveConcurrency(
+                maximum=int(cfg.obtain('datalad.ria.ssh-channels')),
+            )
+        self.concurrency = concurrency
+        self._io_factory = io_factory
+        self._idle = []
+        self._all = []
+        self._transfers = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def channel(self, transfer: bool = False):
+        """Context manager yielding an exclusively used channel
+
+        Parameters
+        ----------
+        transfer: bool, optional
+          Whether the channel is used to transfer file content, and must
+          wait for the concurrency limit.
+        """
+        with self._cond:
+            while (transfer
+                   and self._transfers >= self.concurrency.limit) \
+                    or (not self._idle
+                        and len(self._all) >= self.concurrency.maximum):
+                # wakes up periodically, the limit may have changed
+                self._cond.wait(timeout=self.concurrency.window)
+            io = self._idle.pop() if self._idle else None
+            if io is None:
+                # reserve a slot, channel creation can take a moment
+                self._all.append(None)
+            if transfer:
+                self._transfers += 1
+        try:
+            if io is None:
+                try:
+                    io = self._io_factory()
+                except Exception:
+                    with self._cond:
+                        self._all.remove(None)
+                    raise
+                with self._cond:
+                    self._all[self._all.index(None)] = io
+            try:
+                yield io
+            finally:
+                with self._cond:
+                    self._idle.append(io)
+        finally:
+            with self._cond:
+                if transfer:
+                    self._transfers -= 1
+                self._cond.notify_all()
+
+    def record(self, nbytes: int) -> None:
+        """Report bytes transferred via a channel, see
+        :meth:`AdaptiveConcurrency.record`"""
+        limit = self.concurrency.limit
+        self.concurrency.record(nbytes)
+        if self.concurrency.limit > limit:
+            with self._cond:
+                self._cond.notify_all()
+
+    def close(self) -> None:
+        """Close all channels"""
+        with self._cond:
+            channels = [io for io in self._all if io is not None]
+            self._all = []
+            self._idle = []
+        for io in channels:
+            try:
+                io.close()
+            except Exception as e:
+                lgr.debug('Failed to close channel %s: %s', io, e)
+
+
+class RemoteQueryMemo:
+    """Process-wide memory of read-only query results on remote stores
+
+    Store metadata, such as layout version files, store configuration, and
+    dataset alias symlinks, rarely change. Still, each operation that
+    needs them would query them again via SSH. This memo keeps such
+    results for the lifetime of a process, keyed by host, query type, and
+    path. Only paths that are store metadata of a store declared via
+    :meth:`add_store` (see :meth:`is_memoizable`) are memoized. Writes by
+    the same process must invalidate the affected paths via
+    :meth:`invalidate`.
+    """
+    def __init__(self):
+        self._memo = {}
+        # base paths of known stores, by host
+        self._stores = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def add_store(self, host: str, base_path) -> None:
+        """Declare a path on a host as the base path of a RIA store"""
+        with self._lock:
+            self._stores.setdefault(host, set()).add(
+                PurePosixPath(base_path))
+
+    def is_memoizable(self, host: str, path) -> bool:
+        """Whether a path is (rarely changing) metadata of a known store
+
+        These are the store's ``config``, the ``ria-layout-version`` files
+        of the store and of datasets in it, and dataset alias symlinks.
+        """
+        path = PurePosixPath(path)
+        with self._lock:
+            bases = list(self._stores.get(host, ()))
+        for base in bases:
+            try:
+                rel = path.relative_to(base).parts
+            except ValueError:
+                continue
+            if rel in (('config',), ('ria-layout-version',)) \
+                    or (len(rel) == 3 and rel[2] == 'ria-layout-version') \
+                    or (len(rel) == 2 and rel[0] == 'alias'):
+                return True
+        return False
+
+    def get(self, host: str, query: str, path, fn: Callable):
+        """Return the memoized result of a query, or run it via ``fn()``
+
+        Exceptions raised by ``fn`` are memoized too, and raised again on
+        subsequent calls.
+        """
+        if not self.is_memoizable(host, path):
+            return fn()
+        key = (host, query, str(path))
+        with self._lock:
+            hit = key in self._memo
+            if hit:
+                self.hits += 1
+                res = self._memo[key]
+            else:
+                self.misses += 1
+        if not hit:
+            try:
+                res = (True, fn())
+            except FileNotFoundError as e:
+                res = (False, e)
+            with self._lock:
+                self._memo[key] = res
+        success, value = res
+        if success:
+            return value
+        raise FileNotFoundError(*value.args) from value
+
+    def invalidate(self, host: str, *paths) -> None:
+        """Forget anything memoized for the given paths (or below)"""
+        prefixes = [str(p) for p in paths]
+        with self._lock:
+            for key in list(self._memo):
+                if key[0] == host and any(
+                        key[2] == p or key[2].startswith(p + '/')
+                        for p in prefixes):
+                    del self._memo[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memo.clear()
+
+
+query_memo = RemoteQueryMemo()
+"""Process-wide :class:`RemoteQueryMemo` instance used by ``SSHRemoteIO``"""
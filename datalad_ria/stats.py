@@ -0,0 +1,106 @@
+"""Per-process statistics of the operations on RIA stores
+
+A special remote process accumulates counters (e.g., keys and bytes
+transferred, retries, cache hits) and the time spent in phases of its
+operations (connecting, transferring, verifying) in the process-wide
+:data:`stats`. On exit, the ORA2 special remote emits them as a single
+record (see :func:`emit_stats`): a DEBUG log message, and optionally a line
+in a JSON Lines file (``datalad.ria.stats-file``). Records of many
+processes can be aggregated from such files, to identify slow stores and
+network links.
+
+Counters named ``<name>-hits`` and ``<name>-misses`` are reported as a hit
+rate of ``<name>`` too. Times are sums over all concurrent jobs of a
+process, and can therefore exceed the lifetime of the process.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+import json
+import logging
+from pathlib import Path
+import threading
+import time
+from typing import Dict
+
+lgr = logging.getLogger('datalad.ria.stats')
+
+
+class TransferStats:
+    """Thread-safe counters and timers"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Discard all counts and times, and restart the clock"""
+        with self._lock:
+            self._counts = {}
+            self._times = {}
+            self._start = time.monotonic()
+
+    def count(self, name: str, n: int = 1) -> None:
+        """Increase a counter"""
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def add_time(self, name: str, seconds: float) -> None:
+        """Add to the time spent in a phase"""
+        with self._lock:
+            self._times[name] = self._times.get(name, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, name: str):
+        """Context manager adding the time spent in it to a phase"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.monotonic() - start)
+
+    def as_dict(self) -> Dict:
+        """Return the duration since the last reset, counts, times, and
+        hit rates"""
+        with self._lock:
+            counts = dict(self._counts)
+            times = dict(self._times)
+            duration = time.monotonic() - self._start
+        hit_rates = {}
+        for name, hits in counts.items():
+            if not name.endswith('-hits'):
+                continue
+            name = name[:-len('-hits')]
+            total = hits + counts.get(f'{name}-misses', 0)
+            if total:
+                hit_rates[name] = round(hits / total, 4)
+        return dict(
+            duration=round(duration, 3),
+            counts=counts,
+            times={k: round(v, 3) for k, v in times.items()},
+            hit_rates=hit_rates,
+        )
+
+
+#: statistics of the current process
+stats = TransferStats()
+
+
+def emit_stats(record: Dict, path: str | None = None) -> None:
+    """Log a statistics record, and append it to a JSON Lines file
+
+    Failure to write the file is logged, but not raised.
+    """
+    line = json.dumps(record, sort_keys=True)
+    lgr.debug('Statistics: %s', line)
+    if not path:
+        return
+    try:
+        path = Path(path).expanduser()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # a single write of a line to a file opened for appending, records
+        # of concurrent processes do not interleave
+        with path.open('a') as f:
+            f.write(f'{line}\n')
+    except OSError as e:
+        lgr.debug('Cannot write statistics to %s: %s', path, e)
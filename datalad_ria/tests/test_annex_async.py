@@ -0,0 +1,158 @@
+import io
+import os
+import threading
+import time
+
+from annexremote import (
+    RemoteError,
+    SpecialRemote,
+)
+
+import datalad_ria.annex_async
+from datalad_ria.annex_async import AsyncMaster
+
+
+class _BarrierRemote(SpecialRemote):
+    def __init__(self, annex):
+        super().__init__(annex)
+        # both retrievals must be in progress at the same time
+        self.barrier = threading.Barrier(2, timeout=10)
+        self.prepared = 0
+
+    def initremote(self):
+        pass
+
+    def prepare(self):
+        self.prepared += 1
+
+    def transfer_store(self, key, filename):
+        pass
+
+    def transfer_retrieve(self, key, filename):
+        self.barrier.wait()
+        self.annex.progress(1)
+        if self.annex.getconfig('fail') == key:
+            raise RemoteError('failed')
+
+    def checkpresent(self, key):
+        return key == 'present'
+
+    def remove(self, key):
+        pass
+
+    def stop(self):
+        self.stopped = True
+
+
+def _run_master(remote_cls, **kwargs):
+    rfd, wfd = os.pipe()
+    stdin = os.fdopen(wfd, 'w')
+    output = io.StringIO()
+    master = AsyncMaster(output=output, **kwargs)
+    remote = remote_cls(master)
+    master.LinkRemote(remote)
+    thread = threading.Thread(
+        target=master.Listen, args=(os.fdopen(rfd),), daemon=True)
+    thread.start()
+    return master, remote, stdin, output, thread
+
+
+def _send(stdin, *lines):
+    for line in lines:
+        stdin.write(f'{line}\n')
+    stdin.flush()
+
+
+def _wait_for(output, line):
+    for _ in range(100):
+        if line in output.getvalue().splitlines():
+            return
+        time.sleep(0.1)
+    raise AssertionError(f'{line!r} not received')
+
+
+def test_async_master():
+    master, remote, stdin, output, thread = _run_master(
+        _BarrierRemote, max_jobs=2)
+    _send(
+        stdin,
+        'EXTENSIONS INFO ASYNC',
+        'J 1 PREPARE',
+        'J 2 PREPARE',
+    )
+    # a job gets its next request only after its previous reply
+    for job in ('1', '2'):
+        _wait_for(output, f'J {job} PREPARE-SUCCESS')
+    _send(
+        stdin,
+        # two jobs, that can only complete together
+        'J 1 TRANSFER RETRIEVE k1 f1',
+        'J 2 TRANSFER RETRIEVE k2 f2',
+    )
+    for job in ('1', '2'):
+        _wait_for(output, f'J {job} GETCONFIG fail')
+        _send(stdin, f'J {job} VALUE k2')
+    _wait_for(output, 'J 1 TRANSFER-SUCCESS RETRIEVE k1')
+    _send(stdin, 'J 1 CHECKPRESENT present')
+    stdin.close()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+
+    lines = output.getvalue().splitlines()
+    assert lines[:2] == ['VERSION 1', 'EXTENSIONS ASYNC']
+    assert master.async_enabled
+    # PREPARE ran once, but both jobs got a reply
+    assert remote.prepared == 1
+    assert lines.count('J 1 PREPARE-SUCCESS') == 1
+    assert lines.count('J 2 PREPARE-SUCCESS') == 1
+    # all messages of a job carry its prefix
+    for job in ('1', '2'):
+        assert f'J {job} PROGRESS 1' in lines
+        assert f'J {job} GETCONFIG fail' in lines
+    assert 'J 1 TRANSFER-SUCCESS RETRIEVE k1' in lines
+    assert any(line.startswith('J 2 TRANSFER-FAILURE RETRIEVE k2')
+               for line in lines)
+    # the job continued with a new request after its transfer
+    assert lines.index('J 1 CHECKPRESENT-SUCCESS present') \
+        > lines.index('J 1 TRANSFER-SUCCESS RETRIEVE k1')
+
+
+def test_async_master_disabled():
+    master, remote, stdin, output, thread = _run_master(
+        _BarrierRemote, max_jobs=0)
+    _send(stdin, 'EXTENSIONS INFO ASYNC', 'PREPARE', 'CHECKPRESENT present')
+    stdin.close()
+    thread.join(timeout=10)
+    assert not master.async_enabled
+    assert output.getvalue().splitlines() == [
+        'VERSION 1',
+        'EXTENSIONS',
+        'PREPARE-SUCCESS',
+        'CHECKPRESENT-SUCCESS present',
+    ]
+
+
+def test_async_master_protocol_error(monkeypatch):
+    exits = []
+    monkeypatch.setattr(
+        datalad_ria.annex_async.os, '_exit', lambda code: exits.append(code))
+    master, remote, stdin, output, thread = _run_master(
+        _BarrierRemote, max_jobs=2)
+    _send(
+        stdin,
+        'EXTENSIONS INFO ASYNC',
+        'J 1 PREPARE',
+        # a request with missing parameters
+        'J 1 TRANSFER RETRIEVE',
+    )
+    for _ in range(100):
+        if exits:
+            break
+        time.sleep(0.1)
+    # the remote is stopped before the process exits
+    assert exits == [1]
+    assert getattr(remote, 'stopped', False)
+    assert any(line.startswith('J 1 ERROR')
+               for line in output.getvalue().splitlines())
+    stdin.close()
+    thread.join(timeout=10)
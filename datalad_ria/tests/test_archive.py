@@ -0,0 +1,148 @@
+import json
+from pathlib import Path
+import zipfile
+
+import pytest
+
+from datalad_ria.archive import (
+    RiaArchive,
+    RiaArchiveError,
+    _checked_process,
+    _parse_7z_listing,
+    get_archive_member,
+)
+from datalad_ria.cache import JsonFileCache
+from datalad_ria.url_operations import RiaUrlOperations
+
+
+def _make_archive(path, members, compression=zipfile.ZIP_STORED):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(path, 'w', compression=compression) as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+
+
+members = {
+    'X9/6J/key1/key1': b'content1',
+    'ab/cd/key2/key2': b'x' * 100000,
+}
+
+
+@pytest.mark.parametrize(
+    'compression', [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_archive_zip(tmp_path, compression):
+    archive_path = tmp_path / 'archives' / 'archive.7z'
+    _make_archive(archive_path, members, compression)
+    cache = JsonFileCache(tmp_path / 'index.json')
+    archive = RiaArchive(archive_path.as_uri(), None, cache)
+    assert 'X9/6J/key1/key1' in archive
+    assert 'X9/6J/key3/key3' not in archive
+    for name, content in members.items():
+        progress = []
+        archive.extract(name, tmp_path / 'out', progress.append)
+        assert (tmp_path / 'out').read_bytes() == content
+        assert progress[-1] == len(content)
+    with pytest.raises(KeyError):
+        archive.extract('X9/6J/key3/key3', tmp_path / 'out')
+
+    # the index is persistent, and used by another instance
+    index = json.loads((tmp_path / 'index.json').read_text())
+    assert set(index[archive_path.as_uri()]['v']['members']) == set(members)
+    index[archive_path.as_uri()]['v']['members']['fake'] = \
+        [1, None, None, None, None]
+    (tmp_path / 'index.json').write_text(json.dumps(index))
+    assert 'fake' in RiaArchive(archive_path.as_uri(), None, cache)
+
+    # unless the archive changed
+    _make_archive(archive_path, {'new/new': b'new'}, compression)
+    archive = RiaArchive(archive_path.as_uri(), None, cache)
+    assert 'fake' not in archive
+    assert 'new/new' in archive
+
+
+def test_archive_missing(tmp_path):
+    archive = RiaArchive(
+        (tmp_path / 'archive.7z').as_uri(), None,
+        JsonFileCache(tmp_path / 'index.json'))
+    assert 'X9/6J/key1/key1' not in archive
+    assert not (tmp_path / 'index.json').exists()
+
+
+def test_archive_corrupt(tmp_path):
+    archive_path = tmp_path / 'archive.7z'
+    _make_archive(archive_path, members)
+    cache = JsonFileCache(tmp_path / 'index.json')
+    archive = RiaArchive(archive_path.as_uri(), None, cache)
+    assert 'X9/6J/key1/key1' in archive
+    # same size, different content
+    content = archive_path.read_bytes()
+    archive_path.write_bytes(content.replace(b'content1', b'content2'))
+    with pytest.raises(RiaArchiveError, match='CRC mismatch'):
+        archive.extract('X9/6J/key1/key1', tmp_path / 'out')
+
+
+def test_checked_process():
+    cmd = ['sh', '-c', 'echo out; echo broken >&2; exit 3']
+    with pytest.raises(RiaArchiveError, match='Failed to test: broken'):
+        with _checked_process(cmd, 'test') as proc:
+            assert proc.stdout.read() == b'out\n'
+    # a failure of the consumer is not replaced
+    with pytest.raises(ValueError, match='consumer'):
+        with _checked_process(cmd, 'test') as proc:
+            raise ValueError('consumer')
+
+
+def test_parse_7z_listing():
+    out = """
+7-Zip [64] 16.02
+
+Listing archive: archive.7z
+
+--
+Path = archive.7z
+Type = 7z
+Physical Size = 1234
+
+----------
+Path = X9
+Size = 0
+Attributes = D_ drwxr-xr-x
+
+Path = X9/6J/key1/key1
+Size = 8
+Attributes = A_ -rw-r--r--
+
+Path = ab/cd/key2/key2
+Size = 100000
+Attributes = A_ -rw-r--r--
+
+"""
+    assert _parse_7z_listing(out) == {
+        'X9/6J/key1/key1': [8, None, None, None, None],
+        'ab/cd/key2/key2': [100000, None, None, None, None],
+    }
+
+
+def test_get_archive_member():
+    assert get_archive_member('X9/6J/', 'key') == 'X9/6J/key/key'
+
+
+def test_archive_ssh(ria_sshserver_setup, ria_sshserver, tmp_path):
+    archive_path = Path(ria_sshserver_setup['LOCALPATH']) / 'archtest' \
+        / 'archive.7z'
+    _make_archive(archive_path, members, zipfile.ZIP_DEFLATED)
+    url = 'ssh://{SSH_LOGIN}@{HOST}:{SSH_PORT}{SSH_PATH}/archtest/' \
+          'archive.7z'.format(**ria_sshserver_setup)
+    ops = RiaUrlOperations()
+    try:
+        archive = RiaArchive(
+            url, ops, JsonFileCache(tmp_path / 'index.json'))
+        assert set(archive.members) == set(members)
+        for name, content in members.items():
+            archive.extract(name, tmp_path / 'out')
+            assert (tmp_path / 'out').read_bytes() == content
+        missing = RiaArchive(
+            url + '.missing', ops, JsonFileCache(tmp_path / 'index.json'))
+        assert not missing.members
+    finally:
+        ops.close()
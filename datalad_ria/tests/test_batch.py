@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from datalad_ria.batch import BatchedCalls
+
+
+def test_batched_calls():
+    batches = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def fn(items):
+        batches.append(list(items))
+        if len(batches) == 1:
+            # hold the first batch until all other calls are queued
+            started.set()
+            release.wait()
+        return [ValueError(i) if i == 3 else i * 2 for i in items]
+
+    calls = BatchedCalls(fn, max_size=2)
+    results = {}
+
+    def call(i):
+        try:
+            results[i] = calls(i)
+        except ValueError as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(0,))]
+    threads[0].start()
+    started.wait()
+    for i in range(1, 6):
+        t = threading.Thread(target=call, args=(i,))
+        t.start()
+        threads.append(t)
+    # wait for all calls to be queued
+    while len(calls._queue) < 5:
+        threading.Event().wait(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert batches[0] == [0]
+    # all other calls were coalesced into batches of at most two
+    assert len(batches) == 4
+    assert sorted(i for b in batches[1:] for i in b) == [1, 2, 3, 4, 5]
+    assert all(len(b) <= 2 for b in batches)
+    assert isinstance(results.pop(3), ValueError)
+    assert results == {i: i * 2 for i in (0, 1, 2, 4, 5)}
+    assert not calls._busy
+
+
+def test_batched_calls_error():
+    def fn(items):
+        raise RuntimeError('broken')
+
+    calls = BatchedCalls(fn)
+    with pytest.raises(RuntimeError):
+        calls('a')
+    # the next call is not blocked
+    with pytest.raises(RuntimeError):
+        calls('b')
@@ -0,0 +1,22 @@
+from datalad_ria.dirhash import (
+    annex_dirhash,
+    annex_dirhash_lower,
+)
+
+
+def test_dirhash():
+    # reference values from `git annex examinekey`
+    for key, mixed, lower in (
+        ('MD5E-s8--7e55db001d319a94b0b713529a756623.txt',
+         'X9/6J/', '297/61b/'),
+        ('SHA256E-s6--5891b5b522d5df086d0ff0b110fbd9d21bb4fc7163af34d08286a2e'
+         '846f6be03',
+         'zK/02/', '992/280/'),
+        # a chunk has the hash directories of the whole key
+        ('MD5E-s100--7e55db001d319a94b0b713529a756623.txt',
+         '0x/17/', '2d7/084/'),
+        ('MD5E-s100-S10-C3--7e55db001d319a94b0b713529a756623.txt',
+         '0x/17/', '2d7/084/'),
+    ):
+        assert annex_dirhash(key) == mixed
+        assert annex_dirhash_lower(key) == lower
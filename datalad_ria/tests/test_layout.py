@@ -0,0 +1,123 @@
+import pytest
+
+from datalad_next.annexremotes import RemoteError
+
+from datalad_ria.cache import JsonFileCache
+from datalad_ria.layout import (
+    ObjectTreeLayouts,
+    get_layout_versions,
+    get_object_url_template,
+    parse_layout_version,
+    read_layout_versions,
+    read_object_tree_layouts,
+)
+
+dsid = '0a1b2c3d-0000-0000-0000-000000000000'
+
+
+def test_parse_layout_version():
+    assert parse_layout_version(None) == (None, [])
+    assert parse_layout_version('1\n') == ('1', [])
+    assert parse_layout_version('1|l\n') == ('1', ['l'])
+
+
+def test_get_object_url_template():
+    base = 'file:///store'
+    tmpl = get_object_url_template(
+        base, dsid, dict(store='1|l', dataset='1'))
+    assert tmpl == (
+        f'{base}/0a1/b2c3d-0000-0000-0000-000000000000/annex/objects/'
+        '{annex_dirhash_lower}{annex_key}/{annex_key}')
+    for versions in (
+            dict(store='1', dataset='2'),
+            dict(store=None, dataset=None)):
+        assert get_object_url_template(base, dsid, versions).endswith(
+            '/annex/objects/{annex_dirhash}{annex_key}/{annex_key}')
+    with pytest.raises(RemoteError, match='store layout version unknown'):
+        get_object_url_template(base, dsid, dict(store='5', dataset='2'))
+    with pytest.raises(RemoteError, match='dataset layout version unknown'):
+        get_object_url_template(base, dsid, dict(store='1', dataset='5'))
+
+
+def test_read_layout_versions(tmp_path):
+    store_url = tmp_path.as_uri()
+    assert read_layout_versions(store_url, dsid) == dict(
+        store=None, dataset=None)
+    (tmp_path / 'ria-layout-version').write_text('1\n')
+    ds_path = tmp_path / dsid[:3] / dsid[3:]
+    ds_path.mkdir(parents=True)
+    assert read_layout_versions(store_url, dsid) == dict(
+        store='1\n', dataset=None)
+    # nothing cached without a dataset version
+    assert get_layout_versions(store_url, dsid)['dataset'] is None
+    (ds_path / 'ria-layout-version').write_text('2\n')
+    assert get_layout_versions(store_url, dsid) == dict(
+        store='1\n', dataset='2\n')
+    # cached, a change is not detected
+    (ds_path / 'ria-layout-version').write_text('1\n')
+    assert get_layout_versions(store_url, dsid)['dataset'] == '2\n'
+
+
+def test_get_layout_versions_unreadable(tmp_path):
+    # a version file that exists, but cannot be read, is no default layout
+    (tmp_path / 'ria-layout-version').mkdir()
+    with pytest.raises(OSError):
+        get_layout_versions(tmp_path.as_uri(), dsid)
+    # neither is a store that is not a directory
+    (tmp_path / 'file').write_text('')
+    with pytest.raises(OSError):
+        get_layout_versions((tmp_path / 'file').as_uri(), dsid)
+
+
+def test_read_layout_versions_ssh(ria_sshserver_setup, ria_sshserver,
+                                  tmp_path):
+    from pathlib import Path
+
+    localpath = Path(ria_sshserver_setup['LOCALPATH']) / 'layouttest'
+    ds_path = localpath / dsid[:3] / dsid[3:]
+    ds_path.mkdir(parents=True)
+    (localpath / 'ria-layout-version').write_text('1|l\n')
+    store_url = 'ssh://{SSH_LOGIN}@{HOST}:{SSH_PORT}{SSH_PATH}' \
+        '/layouttest'.format(**ria_sshserver_setup)
+    assert read_layout_versions(store_url, dsid) == dict(
+        store='1|l\n', dataset=None)
+    (ds_path / 'ria-layout-version').write_text('2\n')
+    assert read_layout_versions(store_url, dsid) == dict(
+        store='1|l\n', dataset='2\n')
+    # an unreadable version file fails the command
+    (ds_path / 'ria-layout-version').unlink()
+    (ds_path / 'ria-layout-version').mkdir()
+    with pytest.raises(RuntimeError):
+        read_layout_versions(store_url, dsid)
+
+
+def test_object_tree_layouts(tmp_path):
+    ds_path = tmp_path / dsid[:3] / dsid[3:]
+    ds_url = ds_path.as_uri()
+    obj_path = ds_path / 'annex' / 'objects'
+    assert read_object_tree_layouts(ds_url) == []
+    assert read_object_tree_layouts('https://example.com/ds') is None
+
+    cache = JsonFileCache(tmp_path / 'cache.json')
+    # nothing in the store, only the declared variant is tried
+    layouts = ObjectTreeLayouts(ds_url, 'annex_dirhash', None, cache)
+    assert layouts.candidates() == ['annex_dirhash']
+    layouts.save()
+    assert cache.get(f'{ds_url} objects') is None
+
+    # a legacy object tree with keys in the other variant
+    (obj_path / '297' / '61b').mkdir(parents=True)
+    assert read_object_tree_layouts(ds_url) == ['annex_dirhash_lower']
+    layouts = ObjectTreeLayouts(ds_url, 'annex_dirhash', None, cache)
+    assert layouts.candidates() == ['annex_dirhash_lower']
+    # storing a key adds the declared variant
+    layouts.stored()
+    assert layouts.candidates() == ['annex_dirhash', 'annex_dirhash_lower']
+    layouts.hit('annex_dirhash_lower')
+    assert layouts.candidates() == ['annex_dirhash_lower', 'annex_dirhash']
+    layouts.save()
+
+    # the next instance need not look at the object tree
+    (obj_path / '297' / '61b').rmdir()
+    layouts = ObjectTreeLayouts(ds_url, 'annex_dirhash', None, cache)
+    assert layouts.candidates() == ['annex_dirhash_lower', 'annex_dirhash']
@@ -0,0 +1,69 @@
+import errno
+import os
+
+import pytest
+
+from datalad_ria.localcopy import (
+    copy_file,
+    is_hardlink_safe,
+    link_file,
+)
+
+
+def test_link_file(tmp_path):
+    src = tmp_path / 'src'
+    src.write_text('content')
+    # a writable file is never hardlinked
+    assert not is_hardlink_safe(src)
+    method = link_file(src, tmp_path / 'dst1')
+    assert method in ('reflink', None)
+    assert (tmp_path / 'dst1').read_text() == 'content' \
+        if method else not (tmp_path / 'dst1').exists()
+
+    src.chmod(0o444)
+    assert is_hardlink_safe(src)
+    assert not is_hardlink_safe(src, thin=True)
+    dst = tmp_path / 'dst2'
+    # an existing target is replaced
+    dst.write_text('old')
+    method = link_file(src, dst)
+    assert method in ('reflink', 'hardlink')
+    assert dst.read_text() == 'content'
+    if method == 'hardlink':
+        assert dst.stat().st_ino == src.stat().st_ino
+    # a reflink at most, if hardlinks are not wanted
+    assert link_file(src, tmp_path / 'dst3', hardlink=False) in (
+        'reflink', None)
+    if (tmp_path / 'dst3').exists():
+        assert (tmp_path / 'dst3').stat().st_ino != src.stat().st_ino
+        (tmp_path / 'dst3').unlink()
+    # no leftovers
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'dst1', 'dst2', 'src'] if (tmp_path / 'dst1').exists() else [
+        'dst2', 'src']
+
+
+@pytest.mark.parametrize('unsupported', [
+    (),
+    ('copy_file_range',),
+    ('copy_file_range', 'sendfile'),
+])
+def test_copy_file(tmp_path, monkeypatch, unsupported):
+    content = os.urandom(3 * 1024 * 1024 + 5)
+    src = tmp_path / 'src'
+    src.write_bytes(content)
+    dst = tmp_path / 'dst'
+
+    def _unsupported(*args):
+        raise OSError(errno.EXDEV, 'not here')
+
+    for name in unsupported:
+        if hasattr(os, name):
+            monkeypatch.setattr(os, name, _unsupported)
+    monkeypatch.setattr(
+        'datalad_ria.localcopy._KERNEL_COPY_CHUNK_SIZE', 1024 * 1024)
+    reports = []
+    assert copy_file(src, dst, reports.append) == len(content)
+    assert dst.read_bytes() == content
+    assert reports[-1] == len(content)
+    assert reports == sorted(reports)
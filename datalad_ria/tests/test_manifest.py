@@ -0,0 +1,66 @@
+import pytest
+
+import datalad_ria.manifest
+from datalad_ria.manifest import (
+    KeyManifest,
+    MANIFEST_NAME,
+    parse_manifest,
+)
+from datalad_ria.url_operations import RiaUrlOperations
+
+
+def test_parse_manifest():
+    assert parse_manifest('') == (set(), False)
+    assert parse_manifest('+a\n+b\n-a\n') == ({'b'}, False)
+    assert parse_manifest('#ria-keys complete 6\n+a\n+b\n-a\n+c\n') \
+        == ({'b', 'c'}, True)
+
+
+@pytest.mark.parametrize('scheme', ['file', 'ssh'])
+def test_key_manifest(scheme, tmp_path, monkeypatch, request):
+    if scheme == 'ssh':
+        setup = request.getfixturevalue('ria_sshserver_setup')
+        request.getfixturevalue('ria_sshserver')
+        dspath = tmp_path.__class__(setup['LOCALPATH']) / 'manifest' / 'ds'
+        ds_url = 'ssh://{SSH_LOGIN}@{HOST}:{SSH_PORT}{SSH_PATH}' \
+            '/manifest/ds'.format(**setup)
+    else:
+        dspath = tmp_path / 'ds'
+        ds_url = dspath.as_uri()
+    monkeypatch.setattr(datalad_ria.manifest, '_COMPACT_SLACK', 100)
+    objdir = dspath / 'annex' / 'objects' / 'X9' / '6J' / 'KEY1'
+    objdir.mkdir(parents=True)
+    (objdir / 'KEY1').write_text('content')
+    (objdir / '.KEY1.tmp').write_text('partial upload')
+    log = dspath / 'annex' / MANIFEST_NAME
+
+    ops = RiaUrlOperations()
+    try:
+        manifest = KeyManifest(ds_url, ops)
+        # no manifest yet
+        assert manifest.contains('KEY1') is None
+        # created from the object tree on the first update
+        manifest.add('KEY2')
+        assert log.read_text().splitlines() == [
+            '#ria-keys complete 6', '+KEY1', '+KEY2']
+        manifest.remove('KEY1')
+        assert log.read_text().endswith('+KEY2\n-KEY1\n')
+
+        manifest = KeyManifest(ds_url, ops)
+        assert manifest.contains('KEY2') is True
+        assert manifest.contains('KEY1') is False
+
+        # compacted once it grows beyond twice its size, plus the slack
+        for i in range(10):
+            manifest.add(f'KEY{i}')
+            manifest.remove(f'KEY{i}')
+        assert len(log.read_text()) < 150
+        assert parse_manifest(log.read_text()) == (set(), True)
+        manifest.add('KEY3')
+        assert KeyManifest(ds_url, ops).contains('KEY3') is True
+
+        # nothing to record for a dataset without an annex directory
+        KeyManifest(f'{ds_url}-absent', ops).remove('KEY1')
+        assert not (dspath.parent / 'ds-absent').exists()
+    finally:
+        ops.close()
@@ -0,0 +1,48 @@
+from datalad_ria.cache import JsonFileCache
+from datalad_ria.mirrors import (
+    MirrorSelector,
+    get_key_size,
+)
+
+
+def test_get_key_size():
+    assert get_key_size('MD5E-s8--7e55db001d319a94b0b713529a756623.txt') == 8
+    assert get_key_size('URL--http&c%%example.com%file') is None
+
+
+def test_mirror_selector(tmp_path):
+    cache = JsonFileCache(tmp_path / 'mirrors.json')
+    sel = MirrorSelector(['a', 'b', 'c'], cache)
+    # without measurements, the configured order is kept
+    assert sel.unmeasured() == ['a', 'b', 'c']
+    assert sel.ordered() == ['a', 'b', 'c']
+
+    # 'b' has the lowest RTT, but 'c' the higher throughput
+    sel.record('a', 0.5)
+    sel.record('b', 0.01)
+    sel.record('c', 0.1)
+    sel.record('b', 1.01, 1000000)
+    sel.record('c', 0.2, 1000000)
+    assert sel.unmeasured() == []
+    assert sel.ordered() == ['b', 'c', 'a']
+    assert sel.ordered(size=1000) == ['b', 'c', 'a']
+    assert sel.ordered(size=100000000) == ['c', 'b', 'a']
+
+    # a failed mirror goes last, a success makes it healthy again
+    sel.record_failure('b')
+    assert sel.ordered() == ['c', 'a', 'b']
+    sel.record('b', 0.01)
+    assert sel.ordered()[0] == 'b'
+
+    # estimates are persisted, and reloaded
+    sel.save()
+    assert MirrorSelector(['a', 'b', 'c'], cache).ordered(
+        size=100000000) == ['c', 'b', 'a']
+    # new mirrors have no estimate
+    assert MirrorSelector(['a', 'd'], cache).unmeasured() == ['d']
+
+
+def test_mirror_selector_single():
+    sel = MirrorSelector(['a'])
+    sel.record_failure('a')
+    assert sel.ordered() == ['a']
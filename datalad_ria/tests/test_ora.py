@@ -6,6 +6,9 @@ from datalad_next.runners import (
     CommandError,
 )
 
+from datalad_ria.localcopy import reflink_file
+from datalad_ria.tests.utils import get_unreachable_url
+
 # we may witch this to just 'ora', once we have feature parity
 ora_external_type = 'ora2'
 
@@ -68,3 +71,555 @@ def test_ora_localops(ria_store_localaccess, populated_dataset):
         'MD5E-s8--7e55db001d319a94b0b713529a756623.txt'
     assert key_fpath.exists()
     assert key_fpath.read_text() == 'content1'
+
+
+def test_ora_stats(ria_store_localaccess, populated_dataset, tmp_path):
+    import json
+
+    ds = populated_dataset
+    repo = ds.repo
+    _, store_path = ria_store_localaccess
+    remote_name = f'test-{ora_external_type}'
+    stats_file = tmp_path / 'stats.jsonl'
+    ds.config.set('datalad.ria.stats-file', str(stats_file), scope='local')
+
+    repo.call_annex([
+        'initremote', remote_name,
+        'type=external',
+        f'externaltype={ora_external_type}',
+        'encryption=none',
+        f'url=ria+{store_path.as_uri()}',
+    ])
+    repo.call_annex(['copy', '-t', remote_name, 'one.txt', 'three.txt'])
+    repo.call_annex(['drop', 'one.txt', 'three.txt'])
+    repo.call_annex(['get', '--from', remote_name, 'one.txt', 'three.txt'])
+    # a record per special remote process
+    records = [json.loads(line)
+               for line in stats_file.read_text().splitlines()]
+    assert all(r['remote'] == remote_name for r in records)
+    assert all(r['store'] == f'ria+{store_path.as_uri()}' for r in records)
+    stored = records[-3]
+    assert stored['counts']['stored'] == 2
+    assert stored['counts']['stored-bytes'] == 16
+    assert 'transfer' in stored['times']
+    dropped = records[-2]
+    assert dropped['counts']['checked'] == 2
+    retrieved = records[-1]
+    assert retrieved['counts']['retrieved'] == 2
+    assert retrieved['counts']['retrieved-bytes'] == 16
+    assert retrieved['hit_rates']['prepare-cache'] == 1.0
+
+
+def test_ora_prefetch(ria_store_localaccess, populated_dataset, tmp_path):
+    import json
+    import subprocess
+
+    ds = populated_dataset
+    repo = ds.repo
+    _, store_path = ria_store_localaccess
+    remote_name = f'test-{ora_external_type}'
+    stats_file = tmp_path / 'stats.jsonl'
+    ds.config.set('datalad.ria.stats-file', str(stats_file), scope='local')
+
+    repo.call_annex([
+        'initremote', remote_name,
+        'type=external',
+        f'externaltype={ora_external_type}',
+        'encryption=none',
+        f'url=ria+{store_path.as_uri()}',
+    ])
+    repo.call_annex(['copy', '-t', remote_name, '.'])
+    repo.call_annex(['drop', '.'])
+    keys_file = repo.dot_git / 'prefetch-keys'
+    keys_file.write_text(repo.call_annex(
+        ['find', '--not', '--in', 'here', '--format=${key}\\n', '.']))
+    # a single background retrieval at a time suffices
+    subprocess.run(
+        ['git', '-c', 'datalad.ria.prefetch-list=.git/prefetch-keys',
+         '-c', 'datalad.ria.prefetch-jobs=1',
+         'annex', 'get', '--from', remote_name, '.'],
+        cwd=ds.path, check=True, capture_output=True)
+    assert (ds.pathobj / 'subdir' / 'four').read_text() == 'content4'
+    record = json.loads(stats_file.read_text().splitlines()[-1])
+    # all keys but the first one were prefetched
+    assert record['counts']['prefetch-hits'] == 3
+    assert record['counts']['prefetch-misses'] == 1
+    # the staging area is gone
+    assert not list((repo.dot_git / 'annex' / 'tmp').glob('ria-prefetch-*'))
+
+
+def test_ora_content_pool(ria_store_localaccess, populated_dataset,
+                          tmp_path):
+    import json
+
+    from datalad.api import Dataset
+
+    from datalad_ria.dirhash import annex_dirhash_lower
+
+    _, store_path = ria_store_localaccess
+    (store_path / '.pool').mkdir()
+    stats_file = tmp_path / 'stats.jsonl'
+    remote_name = f'test-{ora_external_type}'
+    other = Dataset(tmp_path / 'other').create(result_renderer='disabled')
+    (other.pathobj / 'copy.txt').write_text('content1')
+    other.save(result_renderer='disabled')
+    key = other.repo.get_file_annexinfo('copy.txt')['key']
+    pooled = store_path / '.pool' / annex_dirhash_lower(key) / key
+
+    objs = []
+    for ds in (populated_dataset, other):
+        ds.config.set(
+            'datalad.ria.stats-file', str(stats_file), scope='local')
+        ds.repo.call_annex([
+            'initremote', remote_name,
+            'type=external',
+            f'externaltype={ora_external_type}',
+            'encryption=none',
+            f'url=ria+{store_path.as_uri()}',
+        ])
+        ds.repo.call_annex(['copy', '-t', remote_name, '.'])
+        objs.extend(
+            p for p in (store_path / ds.id[:3] / ds.id[3:]).rglob(key)
+            if p.is_file())
+    # the other dataset's copy was linked from the pool, not uploaded
+    assert len(objs) == 2
+    assert objs[0].stat().st_ino == objs[1].stat().st_ino \
+        == pooled.stat().st_ino
+    record = json.loads(stats_file.read_text().splitlines()[-1])
+    assert record['counts']['pool-hits'] == 1
+    assert 'stored-bytes' not in record['counts']
+
+    # the pool keeps a key, until nothing links it anymore
+    other.repo.call_annex(['drop', '--force', '--from', remote_name, '.'])
+    assert pooled.exists()
+    populated_dataset.repo.call_annex(
+        ['drop', '--force', '--from', remote_name, '.'])
+    assert not pooled.exists()
+    assert not [p for p in (store_path / '.pool').rglob('*') if p.is_file()]
+
+
+def test_ora_prepare_cache(ria_store_localaccess, populated_dataset):
+    import json
+
+    ds = populated_dataset
+    repo = ds.repo
+    _, store_path = ria_store_localaccess
+    cache_path = repo.dot_git / 'datalad' / 'ria' / 'ora2-prepare.json'
+    remote_name = f'test-{ora_external_type}'
+
+    repo.call_annex([
+        'initremote', remote_name,
+        'type=external',
+        f'externaltype={ora_external_type}',
+        'encryption=none',
+        f'url=ria+{store_path.as_uri()}',
+    ])
+    # git-annex records a cost for the remote in .git/config on first use,
+    # which invalidates the cache entry once
+    repo.call_annex(['copy', '-t', remote_name, 'one.txt'])
+    repo.call_annex(['copy', '-t', remote_name, 'three.txt'])
+    cache = json.loads(cache_path.read_text())
+    assert len(cache) == 1
+    entry = list(cache.values())[0]['v']
+    assert entry['dsid'] == ds.id
+
+    # the cached ID is used on subsequent startups, as long as the store
+    # reports the same layout for it
+    altid = '00000000-0000-0000-0000-000000000000'
+    altpath = store_path / altid[:3] / altid[3:]
+    entry['dsid'] = altid
+    cache_path.write_text(json.dumps(cache))
+    repo.call_annex(['copy', '-t', remote_name, str(Path('subdir', 'two'))])
+    assert (altpath / 'annex' / 'objects').exists()
+
+    # a different layout in the store invalidates the entry
+    (altpath / 'ria-layout-version').write_text('1\n')
+    repo.call_annex(['copy', '-t', remote_name, 'subdir'])
+    assert json.loads(cache_path.read_text())[
+        list(cache)[0]]['v']['dsid'] == ds.id
+    assert not list((altpath / 'annex' / 'objects').rglob('four'))
+
+    # re-enabling the remote discards the cache entry
+    repo.call_annex(['enableremote', remote_name])
+    assert json.loads(cache_path.read_text()) == {}
+
+
+@pytest.mark.parametrize('version,dirhash', [
+    ('1', ('297', '61b')),
+    ('2', ('X9', '6J')),
+])
+def test_ora_layout_versions(
+        ria_store_localaccess, populated_dataset, version, dirhash):
+    ds = populated_dataset
+    repo = ds.repo
+    _, store_path = ria_store_localaccess
+    ds_path = store_path / ds.id[:3] / ds.id[3:]
+    ds_path.mkdir(parents=True)
+    (ds_path / 'ria-layout-version').write_text(f'{version}\n')
+
+    repo.call_annex([
+        'initremote', f'test-{ora_external_type}',
+        'type=external',
+        f'externaltype={ora_external_type}',
+        'encryption=none',
+        f'url=ria+{store_path.as_uri()}',
+    ])
+    repo.call_annex(['copy', '-t', f'test-{ora_external_type}', 'one.txt'])
+    key = 'MD5E-s8--7e55db001d319a94b0b713529a756623.txt'
+    assert (ds_path / 'annex' / 'objects' / dirhash[0] / dirhash[1] / key
+            / key).read_text() == 'content1'
+
+
+def test_ora_unknown_layout_version(ria_store_localaccess, populated_dataset):
+    ds = populated_dataset
+    _, store_path = ria_store_localaccess
+    ds_path = store_path / ds.id[:3] / ds.id[3:]
+    ds_path.mkdir(parents=True)
+    (ds_path / 'ria-layout-version').write_text('99\n')
+
+    ds.repo.call_annex([
+        'initremote', f'test-{ora_external_type}',
+        'type=external',
+        f'externaltype={ora_external_type}',
+        'encryption=none',
+        f'url=ria+{store_path.as_uri()}',
+    ])
+    with pytest.raises(CommandError, match='layout version unknown: 99'):
+        ds.repo.call_annex(
+            ['copy', '-t', f'test-{ora_external_type}', 'one.txt'])
+
+
+def test_ora_unreadable_layout_version(
+        ria_store_localaccess, populated_dataset):
+    ds = populated_dataset
+    _, store_path = ria_store_localaccess
+    ds_path = store_path / ds.id[:3] / ds.id[3:]
+    # exists, but cannot be read
+    (ds_path / 'ria-layout-version').mkdir(parents=True)
+
+    ds.repo.call_annex([
+        'initremote', f'test-{ora_external_type}',
+        'type=external',
+        f'externaltype={ora_external_type}',
+        'encryption=none',
+        f'url=ria+{store_path.as_uri()}',
+    ])
+    with pytest.raises(CommandError, match='Cannot read the layout'):
+        ds.repo.call_annex(
+            ['copy', '-t', f'test-{ora_external_type}', 'one.txt'])
+
+
+def test_ora_async(ria_store_localaccess, populated_dataset):
+    import subprocess
+
+    ds = populated_dataset
+    repo = ds.repo
+    _, store_path = ria_store_localaccess
+    remote_name = f'test-{ora_external_type}'
+
+    repo.call_annex([
+        'initremote', remote_name,
+        'type=external',
+        f'externaltype={ora_external_type}',
+        'encryption=none',
+        f'url=ria+{store_path.as_uri()}',
+    ])
+    repo.call_annex(['copy', '-J3', '-t', remote_name, '.'])
+    repo.call_annex(['drop', '.'])
+    res = subprocess.run(
+        ['git', 'annex', '--debug', 'get', '-J3', '--from', remote_name,
+         '.'],
+        cwd=ds.path, capture_output=True, text=True, check=True)
+    # a single special remote process served all jobs
+    assert res.stderr.count(
+        f'git-annex-remote-{ora_external_type} []') == 1
+    assert 'J 2 TRANSFER-SUCCESS RETRIEVE' in res.stderr
+    # key URLs are determined without asking git-annex
+    assert 'DIRHASH' not in res.stderr
+    assert 'GETURLS' not in res.stderr
+    assert (ds.pathobj / 'subdir' / 'four').read_text() == 'content4'
+    # concurrent removals
+    subprocess.run(
+        ['git', 'annex', 'drop', '-J3', '--force', '--from', remote_name,
+         '.'],
+        cwd=ds.path, capture_output=True, text=True, check=True)
+    assert not [
+        p for p in (store_path / ds.id[:3] / ds.id[3:] / 'annex' /
+                    'objects').rglob('*')
+        if p.is_file()
+    ]
+
+
+def test_ora_sshops(ria_sshserver, populated_dataset):
+    import json
+
+    ds = populated_dataset
+    repo = ds.repo
+    ria_baseurl, localpath = ria_sshserver
+    store_name = 'sshopsstore'
+    store_path = Path(localpath) / store_name
+    store_path.mkdir()
+    (store_path / 'ria-layout-version').write_text('1\n')
+    remote_name = f'test-{ora_external_type}'
+
+    repo.call_annex([
+        'initremote', remote_name,
+        'type=external',
+        f'externaltype={ora_external_type}',
+        'encryption=none',
+        f'url={ria_baseurl}/{store_name}',
+    ])
+    repo.call_annex(['copy', '-t', remote_name, 'one.txt', 'three.txt'])
+    key = 'MD5E-s8--7e55db001d319a94b0b713529a756623.txt'
+    key_fpath = store_path / ds.id[:3] / ds.id[3:] / 'annex' / 'objects' / \
+        'X9' / '6J' / key / key
+    assert key_fpath.read_text() == 'content1'
+    # no leftovers of the upload
+    assert [p.name for p in key_fpath.parent.iterdir()] == [key]
+
+    repo.call_annex(['checkpresentkey', key, remote_name])
+    repo.call_annex(['drop', 'one.txt'])
+    stats_file = Path(ds.path) / '.git' / 'ria-stats.jsonl'
+    ds.config.set('datalad.ria.stats-file', str(stats_file), scope='local')
+    repo.call_annex(['get', '--from', remote_name, 'one.txt'])
+    ds.config.unset('datalad.ria.stats-file', scope='local')
+    assert (Path(ds.path) / 'one.txt').read_text() == 'content1'
+    record = json.loads(stats_file.read_text())
+    # a remote shell was opened, and the content was verified
+    assert record['counts']['ssh-shells'] >= 1
+    assert {'connect', 'transfer', 'verify'} <= set(record['times'])
+
+    # corrupt content is rejected, even if git-annex does not verify it
+    key_fpath.chmod(0o644)
+    key_fpath.write_text('CONTENT1')
+    repo.call_annex(['drop', 'one.txt'])
+    with pytest.raises(CommandError):
+        repo.call_annex([
+            '-c', f'remote.{remote_name}.annex-verify=false',
+            'get', '--from', remote_name, 'one.txt'])
+    assert not repo.file_has_content('one.txt')
+    key_fpath.write_text('content1')
+    repo.call_annex(['get', '--from', remote_name, 'one.txt'])
+
+    repo.call_annex(['drop', '--from', remote_name, 'one.txt'])
+    assert not key_fpath.parent.exists()
+    # not present anymore
+    with pytest.raises(CommandError):
+        repo.call_annex(['checkpresentkey', key, remote_name])
+
+
+def test_ora_archive(ria_store_localaccess, populated_dataset):
+    import shutil
+    import zipfile
+
+    ds = populated_dataset
+    repo = ds.repo
+    _, store_path = ria_store_localaccess
+    remote_name = f'test-{ora_external_type}'
+    repo.call_annex([
+        'initremote', remote_name,
+        'type=external',
+        f'externaltype={ora_external_type}',
+        'encryption=none',
+        f'url=ria+{store_path.as_uri()}',
+    ])
+    repo.call_annex(['copy', '-t', remote_name, 'one.txt'])
+    # pack the object tree into an archive, and remove the loose objects
+    ds_path = store_path / ds.id[:3] / ds.id[3:]
+    obj_path = ds_path / 'annex' / 'objects'
+    (ds_path / 'archives').mkdir()
+    with zipfile.ZipFile(ds_path / 'archives' / 'archive.7z', 'w') as zf:
+        for p in obj_path.rglob('*'):
+            if p.is_file():
+                zf.write(p, str(p.relative_to(obj_path)))
+    shutil.rmtree(obj_path)
+
+    key = 'MD5E-s8--7e55db001d319a94b0b713529a756623.txt'
+    repo.call_annex(['checkpresentkey', key, remote_name])
+    repo.call_annex(['drop', 'one.txt'])
+    repo.call_annex(['get', '--from', remote_name, 'one.txt'])
+    assert (Path(ds.path) / 'one.txt').read_text() == 'content1'
+    assert (repo.dot_git / 'datalad' / 'ria' / 'ora2-archives.json').exists()
+    # keys not in the archive are reported as such
+    with pytest.raises(CommandError):
+        repo.call_annex([
+            'checkpresentkey',
+            'MD5E-s8--00000000000000000000000000000000.txt', remote_name])
+
+
+def test_ora_mirrors(ria_store_localaccess, populated_dataset, tmp_path):
+    import shutil
+
+    ds = populated_dataset
+    repo = ds.repo
+    _, store_path = ria_store_localaccess
+    mirror_path = tmp_path / 'mirror'
+    remote_name = f'test-{ora_external_type}'
+    repo.call_annex([
+        'initremote', remote_name,
+        'type=external',
+        f'externaltype={ora_external_type}',
+        'encryption=none',
+        f'url=ria+{store_path.as_uri()}',
+    ])
+    with pytest.raises(CommandError, match='URLs expected for mirrors='):
+        repo.call_annex(
+            ['enableremote', remote_name, f'mirrors={mirror_path.as_uri()}'])
+    repo.call_annex(['copy', '-t', remote_name, 'one.txt'])
+    # replicate the store, and remove the key from the original
+    shutil.copytree(store_path, mirror_path)
+    ds_path = store_path / ds.id[:3] / ds.id[3:]
+    shutil.rmtree(ds_path / 'annex' / 'objects')
+    # a mirror that cannot be reached is skipped
+    unreachable = get_unreachable_url('/store')
+    repo.call_annex([
+        'enableremote', remote_name,
+        f'mirrors=ria+{unreachable} ria+{mirror_path.as_uri()}'])
+
+    # retrieval fails over to the mirror
+    key = 'MD5E-s8--7e55db001d319a94b0b713529a756623.txt'
+    repo.call_annex(['checkpresentkey', key, remote_name])
+    repo.call_annex(['drop', '--force', 'one.txt'])
+    repo.call_annex(['get', '--from', remote_name, 'one.txt'])
+    assert (Path(ds.path) / 'one.txt').read_text() == 'content1'
+    # content is only stored in the primary store
+    repo.call_annex(['copy', '-t', remote_name, 'three.txt'])
+    mirror_ds_path = mirror_path / ds.id[:3] / ds.id[3:]
+    assert len(list((ds_path / 'annex' / 'objects').rglob('*.txt/*'))) == 1
+    assert len(
+        list((mirror_ds_path / 'annex' / 'objects').rglob('*.txt/*'))) == 1
+
+
+def test_ora_local_links(ria_store_localaccess, populated_dataset):
+    ds = populated_dataset
+    repo = ds.repo
+    _, store_path = ria_store_localaccess
+    remote_name = f'test-{ora_external_type}'
+    repo.call_annex([
+        'initremote', remote_name,
+        'type=external',
+        f'externaltype={ora_external_type}',
+        'encryption=none',
+        f'url=ria+{store_path.as_uri()}',
+    ])
+    repo.call_annex(['copy', '-t', remote_name, 'one.txt'])
+    key = 'MD5E-s8--7e55db001d319a94b0b713529a756623.txt'
+    key_fpath = store_path / ds.id[:3] / ds.id[3:] / 'annex' / 'objects' / \
+        'X9' / '6J' / key / key
+    local_fpath = ds.pathobj / 'one.txt'
+    assert key_fpath.read_text() == 'content1'
+    # an upload is never a hardlink of the dataset's annex object
+    assert key_fpath.stat().st_ino != local_fpath.stat().st_ino
+    # a read-only object in the store is linked on retrieval
+    key_fpath.chmod(0o444)
+    repo.call_annex(['drop', 'one.txt'])
+    repo.call_annex(['get', '--from', remote_name, 'one.txt'])
+    assert local_fpath.read_text() == 'content1'
+    probe = store_path / 'probe'
+    probe.write_text('probe')
+    reflinks = reflink_file(probe, repo.dot_git / 'probe')
+    probe.unlink()
+    (repo.dot_git / 'probe').unlink(missing_ok=True)
+    # a hardlink, unless the file system supports reflinks
+    assert (key_fpath.stat().st_ino == local_fpath.stat().st_ino) \
+        is not reflinks
+
+
+def test_ora_legacy_layout(ria_store_localaccess, populated_dataset):
+    ds = populated_dataset
+    repo = ds.repo
+    _, store_path = ria_store_localaccess
+    remote_name = f'test-{ora_external_type}'
+    repo.call_annex([
+        'initremote', remote_name,
+        'type=external',
+        f'externaltype={ora_external_type}',
+        'encryption=none',
+        f'url=ria+{store_path.as_uri()}',
+    ])
+    # a key in the lower-case dirhash variant, like a legacy store could
+    # have it, while the declared layout uses the mixed-case variant
+    key = 'MD5E-s8--7e55db001d319a94b0b713529a756623.txt'
+    obj_path = store_path / ds.id[:3] / ds.id[3:] / 'annex' / 'objects'
+    (obj_path / '297' / '61b' / key).mkdir(parents=True)
+    (obj_path / '297' / '61b' / key / key).write_text('content1')
+
+    repo.call_annex(['checkpresentkey', key, remote_name])
+    # git-annex does not know about the copy in the store yet
+    repo.call_annex(['fsck', '--fast', '--from', remote_name, 'one.txt'])
+    repo.call_annex(['drop', 'one.txt'])
+    repo.call_annex(['get', '--from', remote_name, 'one.txt'])
+    assert (ds.pathobj / 'one.txt').read_text() == 'content1'
+    # new keys go into the declared variant, and are found there
+    repo.call_annex(['copy', '-t', remote_name, 'three.txt'])
+    repo.call_annex(['drop', 'three.txt'])
+    repo.call_annex(['get', '--from', remote_name, 'three.txt'])
+    assert len(list(obj_path.glob('??/??/*'))) == 1
+    # and keys in any variant can be removed
+    repo.call_annex(['drop', '--from', remote_name, 'one.txt', 'three.txt'])
+    assert not list(obj_path.glob('*/*/*/*'))
+
+
+def test_ora_key_manifest(ria_store_localaccess, populated_dataset):
+    ds = populated_dataset
+    repo = ds.repo
+    _, store_path = ria_store_localaccess
+    remote_name = f'test-{ora_external_type}'
+    repo.call_annex([
+        'initremote', remote_name,
+        'type=external',
+        f'externaltype={ora_external_type}',
+        'encryption=none',
+        f'url=ria+{store_path.as_uri()}',
+    ])
+    annex_path = store_path / ds.id[:3] / ds.id[3:] / 'annex'
+    # not maintained by default
+    repo.call_annex(['copy', '-t', remote_name, 'one.txt'])
+    assert not (annex_path / 'ria-keys.log').exists()
+    repo.call_annex(['drop', '--from', remote_name, 'one.txt'])
+    ds.config.set('datalad.ria.key-manifest', 'absent', scope='local')
+    repo.call_annex(['copy', '-t', remote_name, 'one.txt', 'three.txt'])
+    key = 'MD5E-s8--7e55db001d319a94b0b713529a756623.txt'
+    log = (annex_path / 'ria-keys.log').read_text().splitlines()
+    assert log[0].startswith('#ria-keys complete')
+    # created from the object tree when the first key was stored
+    assert f'+{key}' in log[1:]
+    assert len(set(log[1:])) == 2
+
+    # move the key out of sight of the store
+    key_fpath = annex_path / 'objects' / 'X9' / '6J' / key / key
+    hidden = annex_path / 'hidden'
+    key_fpath.rename(hidden)
+    for trust, present in (('no', False), ('absent', False), ('yes', True)):
+        ds.config.set('datalad.ria.key-manifest', trust, scope='local')
+        try:
+            repo.call_annex(['checkpresentkey', key, remote_name])
+            assert present, trust
+        except CommandError:
+            assert not present, trust
+    hidden.rename(key_fpath)
+
+    # a key that is not listed is not looked for
+    repo.call_annex(['drop', '--from', remote_name, 'one.txt'])
+    assert (annex_path / 'ria-keys.log').read_text().endswith(f'-{key}\n')
+    key_fpath.parent.mkdir(parents=True, exist_ok=True)
+    key_fpath.write_text('content1')
+    ds.config.set('datalad.ria.key-manifest', 'absent', scope='local')
+    with pytest.raises(CommandError):
+        repo.call_annex(['checkpresentkey', key, remote_name])
+    ds.config.set('datalad.ria.key-manifest', 'no', scope='local')
+    repo.call_annex(['checkpresentkey', key, remote_name])
+    # and neither maintained
+    before = (annex_path / 'ria-keys.log').read_text()
+    repo.call_annex(['drop', '--from', remote_name, 'three.txt'])
+    assert (annex_path / 'ria-keys.log').read_text() == before
+
+    # a manifest that cannot be updated does not fail a removal
+    ds.config.set('datalad.ria.key-manifest', 'absent', scope='local')
+    repo.call_annex(['copy', '-t', remote_name, 'three.txt'])
+    (annex_path / 'ria-keys.log').unlink()
+    (annex_path / 'ria-keys.log').mkdir()
+    repo.call_annex(['drop', '--from', remote_name, 'three.txt'])
+    key3 = repo.get_file_annexinfo('three.txt')['key']
+    assert not [p for p in (annex_path / 'objects').rglob(key3)
+                if p.is_file()]
@@ -0,0 +1,66 @@
+import pytest
+
+from datalad_ria.dirhash import annex_dirhash_lower
+from datalad_ria.pool import (
+    ContentPool,
+    POOL_DIR,
+)
+from datalad_ria.url_operations import RiaUrlOperations
+
+key = 'MD5E-s7--9a0364b9e99bb480dd25e1f0284c8555'
+
+
+def test_is_poolable():
+    assert ContentPool.is_poolable(key)
+    assert not ContentPool.is_poolable('WORM-s7-m1--one.txt')
+
+
+@pytest.mark.parametrize('scheme', ['file', 'ssh'])
+def test_content_pool(scheme, tmp_path, request):
+    if scheme == 'ssh':
+        setup = request.getfixturevalue('ria_sshserver_setup')
+        request.getfixturevalue('ria_sshserver')
+        storepath = tmp_path.__class__(setup['LOCALPATH']) / 'pool'
+        store_url = 'ssh://{SSH_LOGIN}@{HOST}:{SSH_PORT}{SSH_PATH}' \
+            '/pool'.format(**setup)
+    else:
+        storepath = tmp_path / 'store'
+        store_url = storepath.as_uri()
+    storepath.mkdir()
+    obj1 = storepath / 'ds1' / 'KEY'
+    obj1.parent.mkdir()
+    obj1.write_text('content')
+    obj2 = storepath / 'ds2' / 'KEY'
+    pooled = storepath / POOL_DIR / annex_dirhash_lower(key) / key
+
+    ops = RiaUrlOperations()
+    try:
+        # no pool in the store
+        assert ContentPool(store_url, ops).enabled is False
+
+        (storepath / POOL_DIR).mkdir()
+        pool = ContentPool(store_url, ops)
+        assert pool.enabled is True
+        assert pool.link(key, f'{store_url}/ds2/KEY') is False
+        assert not obj2.exists()
+
+        pool.add(key, f'{store_url}/ds1/KEY')
+        assert pooled.stat().st_ino == obj1.stat().st_ino
+        # adding again is harmless
+        pool.add(key, f'{store_url}/ds1/KEY')
+
+        assert pool.link(key, f'{store_url}/ds2/KEY') is True
+        assert obj2.stat().st_ino == obj1.stat().st_ino
+        assert obj2.read_text() == 'content'
+        # present already
+        assert pool.link(key, f'{store_url}/ds2/KEY') is True
+
+        # kept, as long as any dataset has the key
+        obj1.unlink()
+        pool.prune([key])
+        assert pooled.exists()
+        obj2.unlink()
+        pool.prune([key, 'MD5E-s1--00000000000000000000000000000000'])
+        assert not pooled.exists()
+    finally:
+        ops.close()
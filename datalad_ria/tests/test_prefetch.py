@@ -0,0 +1,86 @@
+import threading
+
+from datalad_ria.prefetch import Prefetcher
+
+
+def _key(i, size=10):
+    return f'MD5E-s{size}--{i:032x}.dat'
+
+
+def test_prefetcher(tmp_path):
+    keys = [_key(i) for i in range(10)]
+    fetched = []
+    release = threading.Event()
+
+    def fetch(key, path):
+        fetched.append(key)
+        if key == keys[3]:
+            raise RuntimeError('broken')
+        if key == keys[5]:
+            # still in progress when it is discarded
+            release.wait()
+        path.write_text(key)
+
+    staging = tmp_path / 'staging'
+    staging.mkdir()
+    pf = Prefetcher(keys, fetch, staging, depth=2,
+                    skip=lambda key: key == keys[2])
+    try:
+        # the first key is never prefetched, but it triggers the next ones
+        assert not pf.take(keys[0], tmp_path / 'dst0')
+        assert pf.take(keys[1], tmp_path / 'dst1')
+        assert (tmp_path / 'dst1').read_text() == keys[1]
+        # skipped
+        assert not pf.take(keys[2], tmp_path / 'dst2')
+        # failed
+        assert not pf.take(keys[3], tmp_path / 'dst3')
+        # unknown keys change nothing
+        assert not pf.take('MD5E-s1--other', tmp_path / 'other')
+        # 4 and 5 are scheduled, 4 is not requested
+        assert pf.take(keys[6], tmp_path / 'dst6') is False
+        release.set()
+        assert pf.take(keys[7], tmp_path / 'dst7')
+    finally:
+        pf.close()
+    assert keys[2] not in fetched
+    assert not staging.exists()
+
+
+def test_prefetcher_max_bytes(tmp_path):
+    keys = [_key(0), _key(1, 60), _key(2, 60), _key(3), 'WORM--nosize']
+    fetched = []
+
+    def fetch(key, path):
+        fetched.append(key)
+        path.write_text(key)
+
+    pf = Prefetcher(keys, fetch, tmp_path, depth=4, max_bytes=100)
+    try:
+        pf.take(keys[0], tmp_path / 'dst0')
+        assert pf.take(keys[1], tmp_path / 'dst1')
+        assert pf.take(keys[2], tmp_path / 'dst2')
+    finally:
+        pf.close()
+    # the second 60 byte key only after the first one was taken, and never
+    # the key without a size
+    assert keys[4] not in fetched
+    assert fetched[:1] == [keys[1]]
+
+
+def test_prefetcher_workers(tmp_path):
+    keys = [_key(i) for i in range(6)]
+    # only passes once three keys are retrieved at the same time
+    barrier = threading.Barrier(3, timeout=10)
+
+    def fetch(key, path):
+        barrier.wait()
+        path.write_text(key)
+
+    pf = Prefetcher(keys, fetch, tmp_path, depth=5, workers=3)
+    try:
+        pf.take(keys[0], tmp_path / 'dst0')
+        assert pf.take(keys[1], tmp_path / 'dst1')
+        assert not barrier.broken
+    finally:
+        barrier.abort()
+        pf.close()
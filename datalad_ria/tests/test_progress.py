@@ -0,0 +1,49 @@
+from datalad_ria.progress import (
+    ThrottledProgress,
+    get_progress_callback,
+    progress_callback,
+)
+
+
+def test_throttled_progress():
+    reports = []
+    # large interval, only size steps trigger reports
+    p = ThrottledProgress(reports.append, 1000, interval=1000)
+    for i in range(1, 1001):
+        p.update(i)
+    # one report per percent
+    assert len(reports) == 100
+    assert reports[-1] == 1000
+    p.finish()
+    # nothing new to report
+    assert len(reports) == 100
+    assert p.throughput > 0
+
+    reports = []
+    # unknown size, no interval: every update is reported
+    p = ThrottledProgress(reports.append, interval=0)
+    p.update(10)
+    p.update(20)
+    assert reports == [10, 20]
+
+    reports = []
+    # unknown size, large interval: only the final count is reported
+    p = ThrottledProgress(reports.append, interval=1000)
+    for i in range(100):
+        p.update(i)
+    p.finish()
+    assert reports == [99]
+    # no callback is fine
+    p = ThrottledProgress(None)
+    p.update(10)
+    p.finish()
+
+
+def test_progress_callback():
+    assert get_progress_callback() is None
+    with progress_callback(print):
+        assert get_progress_callback() is print
+        with progress_callback(None):
+            assert get_progress_callback() is None
+        assert get_progress_callback() is print
+    assert get_progress_callback() is None
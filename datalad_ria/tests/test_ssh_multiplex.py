@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+
+from datalad.support.sshconnector import MultiplexSSHManager
+
+from datalad_ria.patches.sshmultiplex import (
+    _get_refs_dir,
+    _register_ref,
+    _release_ref,
+)
+
+
+def _get_dead_pid():
+    # a PID of a process that has certainly finished
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    return proc.pid
+
+
+def test_ref_counting(tmp_path):
+    ctrl_path = tmp_path / 'someconnection'
+    mypid = os.getpid()
+    # the parent process is alive for sure
+    otherpid = os.getppid()
+    _register_ref(ctrl_path, mypid)
+    _register_ref(ctrl_path, otherpid)
+    assert _release_ref(ctrl_path, mypid) == [otherpid]
+    # releasing twice is harmless
+    assert _release_ref(ctrl_path, mypid) == [otherpid]
+    _register_ref(ctrl_path, mypid)
+    assert sorted(_release_ref(ctrl_path, otherpid)) == [mypid]
+    # last holder leaves, the refs dir is removed
+    assert _release_ref(ctrl_path, mypid) == []
+    assert not _get_refs_dir(ctrl_path).exists()
+
+
+def test_ref_counting_prunes_stale(tmp_path):
+    ctrl_path = tmp_path / 'someconnection'
+    deadpid = _get_dead_pid()
+    _register_ref(ctrl_path, deadpid)
+    _register_ref(ctrl_path, os.getpid())
+    # a process that died without releasing its reference does not
+    # keep a connection alive
+    assert _release_ref(ctrl_path, os.getpid()) == []
+    assert not _get_refs_dir(ctrl_path).exists()
+
+
+def test_shared_controlmaster(ria_sshserver_setup, ria_sshserver):
+    ssh_url = 'ssh://{SSH_LOGIN}@{HOST}:{SSH_PORT}'.format(
+        **ria_sshserver_setup)
+    sm1 = MultiplexSSHManager()
+    con1 = sm1.get_connection(ssh_url)
+    con1('true')
+    assert con1.ctrl_path.exists()
+    # pretend a second process joins the same connection
+    _register_ref(con1.ctrl_path, os.getppid())
+    sm1.close(allow_fail=False)
+    # still in use by someone else, not stopped
+    assert con1.ctrl_path.exists()
+    # a new manager reuses the connection
+    sm2 = MultiplexSSHManager()
+    con2 = sm2.get_connection(ssh_url)
+    assert con2.ctrl_path == con1.ctrl_path
+    out, err = con2('echo reused')
+    assert out == 'reused\n'
+    _release_ref(con1.ctrl_path, os.getppid())
+    # the reference of this process to the reused connection is released
+    sm2.close(allow_fail=False)
+    assert not (_get_refs_dir(con1.ctrl_path) / str(os.getpid())).exists()
+    assert con1.ctrl_path.exists()
+
+
+def test_controlmaster_stopped_without_persistence(
+        ria_sshserver_setup, ria_sshserver, monkeypatch):
+    import datalad_ria.patches.sshmultiplex as sshmultiplex
+
+    ssh_url = 'ssh://{SSH_LOGIN}@{HOST}:{SSH_PORT}'.format(
+        **ria_sshserver_setup)
+    sm1 = MultiplexSSHManager()
+    con1 = sm1.get_connection(ssh_url)
+    con1('true')
+    assert con1.ctrl_path.exists()
+    monkeypatch.setattr(sshmultiplex, '_get_control_persist', lambda: None)
+    # a process that reuses a running ControlMaster stops it, when it is
+    # the last to use it
+    sm2 = MultiplexSSHManager()
+    con2 = sm2.get_connection(ssh_url)
+    con2('true')
+    assert con2.ctrl_path in sm2._prev_connections
+    _release_ref(con1.ctrl_path, os.getpid())
+    sm2.close(allow_fail=False)
+    assert not con2.ctrl_path.exists()
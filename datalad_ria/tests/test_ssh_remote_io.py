@@ -119,9 +119,47 @@ def test_SSHRemoteIO_updownload(ssh_remote_wdir, tmp_path):
     assert (tmp_path / 'mydownload').read_text() \
         == (tmp_path / 'mydownload2').read_text()
 
+    # progress is reported, and ends with the full size
+    reports = []
+    ssh_remoteio.put(probefpath, targetdir / 'progress', reports.append)
+    assert reports and reports[-1] == len(content)
+    reports = []
+    ssh_remoteio.get(
+        targetdir / 'progress', tmp_path / 'progress', reports.append)
+    assert reports and reports[-1] == len(content)
+
     # redo upload, overwriting the renamed file
     probefpath.write_text('allnew')
     ssh_remoteio.put(
         probefpath, renamed_targetfpath, noop_callback)
     assert ssh_remoteio.exists(renamed_targetfpath)
     assert ssh_remoteio.read_file(renamed_targetfpath) == 'allnew'
+
+
+def test_SSHRemoteIO_get_truncated(ssh_remote_wdir, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from datalad.distributed.ora_remote import RIARemoteError
+
+    ssh_remoteio, targetdir = ssh_remote_wdir
+    # the key's size is 10 bytes, but the file only has 3
+    key = 'MD5E-s10--e09c80c42fda55f9d992e59ca6b3307d'
+    ssh_remoteio.ssh(f'printf abc > {targetdir / key}')
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(
+            ssh_remoteio.get, targetdir / key, tmp_path / key, lambda n: n)
+        # must not wait for the missing bytes
+        with pytest.raises(RIARemoteError, match='expected 10'):
+            future.result(timeout=30)
+    # the shell is still usable
+    assert ssh_remoteio.exists(targetdir / key)
+
+
+def test_SSHRemoteIO_get_missing(ssh_remote_wdir, tmp_path):
+    from datalad_ria.sshio import RemoteFileNotFoundError
+
+    ssh_remoteio, targetdir = ssh_remote_wdir
+    key = 'MD5E-s10--e09c80c42fda55f9d992e59ca6b3307d'
+    with pytest.raises(RemoteFileNotFoundError):
+        ssh_remoteio.get(targetdir / key, tmp_path / key, lambda n: n)
+    assert not (tmp_path / key).exists()
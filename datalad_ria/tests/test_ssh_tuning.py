@@ -0,0 +1,92 @@
+import pytest
+
+from datalad.support.sshconnector import (
+    MultiplexSSHConnection,
+    NoMultiplexSSHConnection,
+)
+from datalad.support.network import SSHRI
+
+from datalad_ria.ssh_tuning import (
+    benchmark_ssh_options,
+    get_ssh_options,
+    main,
+    ssh_options_to_args,
+)
+
+
+def test_get_ssh_options(datalad_cfg):
+    assert get_ssh_options('store.example.org') == []
+    datalad_cfg.set(
+        'datalad.ria.ssh-options', 'Compression=no', scope='global')
+    assert get_ssh_options('store.example.org') == ['Compression=no']
+    datalad_cfg.set(
+        'datalad.ria.store.example.org.ssh-options',
+        'Ciphers=aes128-gcm@openssh.com "IPQoS=throughput"',
+        scope='global')
+    # host-specific declaration wins
+    assert get_ssh_options('store.example.org') == [
+        'Ciphers=aes128-gcm@openssh.com', 'IPQoS=throughput']
+    assert get_ssh_options('other.example.org') == ['Compression=no']
+    assert ssh_options_to_args(['A=1', 'B=2']) == ['-o', 'A=1', '-o', 'B=2']
+
+
+def test_ssh_options_in_connections(datalad_cfg, tmp_path):
+    datalad_cfg.set(
+        'datalad.ria.store.example.org.ssh-options',
+        'Ciphers=aes128-gcm@openssh.com',
+        scope='global')
+    sshri = SSHRI(hostname='store.example.org')
+    for con in (
+            NoMultiplexSSHConnection(sshri),
+            MultiplexSSHConnection(tmp_path / 'ctrl', sshri),
+    ):
+        assert '-o' in con._ssh_args
+        assert 'Ciphers=aes128-gcm@openssh.com' in con._ssh_args
+        # also makes it into scp calls
+        assert 'Ciphers=aes128-gcm@openssh.com' in \
+            con._get_scp_command_spec(False, False)
+    # no leakage to other hosts
+    con = NoMultiplexSSHConnection(SSHRI(hostname='other.example.org'))
+    assert 'Ciphers=aes128-gcm@openssh.com' not in con._ssh_args
+
+
+def test_ssh_options_in_control_path(datalad_cfg):
+    from datalad.support.sshconnector import MultiplexSSHManager
+
+    url = 'ssh://store.example.org'
+    plain = MultiplexSSHManager().get_connection(url).ctrl_path
+    datalad_cfg.set(
+        'datalad.ria.store.example.org.ssh-options',
+        'Ciphers=aes128-gcm@openssh.com',
+        scope='global')
+    # a ControlMaster started without the options is not reused
+    tuned = MultiplexSSHManager().get_connection(url).ctrl_path
+    assert tuned != plain
+    assert len(tuned.name) == len(plain.name)
+    datalad_cfg.set(
+        'datalad.ria.store.example.org.ssh-options',
+        'Ciphers=aes256-gcm@openssh.com',
+        scope='global')
+    assert MultiplexSSHManager().get_connection(url).ctrl_path \
+        not in (plain, tuned)
+
+
+def test_benchmark_ssh_options_errors():
+    with pytest.raises(ValueError):
+        benchmark_ssh_options('ria+http://example.org')
+
+
+def test_benchmark_ssh_options(ria_sshserver_setup, ria_sshserver, capsys):
+    url = 'ssh://{SSH_LOGIN}@{HOST}:{SSH_PORT}'.format(**ria_sshserver_setup)
+    res = benchmark_ssh_options(
+        url,
+        candidates=[(), ('Ciphers=bogus-cipher',)],
+        size=1024 * 1024,
+    )
+    assert len(res) == 2
+    # ordered by performance, failures last
+    assert res[0]['options'] == []
+    assert res[0]['throughput'] > 0
+    assert res[1]['error']
+    assert main([url, '--size', '1']) == 0
+    assert 'Recommendation' in capsys.readouterr().out
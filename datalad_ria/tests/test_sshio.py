@@ -0,0 +1,261 @@
+from pathlib import Path
+import threading
+import time
+
+import pytest
+
+from datalad_ria.sshio import (
+    AdaptiveConcurrency,
+    RemoteQueryMemo,
+    SSHChannelPool,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeIO:
+    """Stand-in for ``SSHRemoteIO`` that copies local files"""
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.closed = False
+
+    def get(self, src, dst, progress_cb):
+        with self.tracker['lock']:
+            self.tracker['active'] += 1
+            self.tracker['peak'] = max(
+                self.tracker['peak'], self.tracker['active'])
+        try:
+            if 'missing' in str(src):
+                raise FileNotFoundError(src)
+            time.sleep(0.01)
+            content = Path(src).read_bytes()
+            Path(dst).write_bytes(content)
+            progress_cb(len(content))
+        finally:
+            with self.tracker['lock']:
+                self.tracker['active'] -= 1
+
+    def close(self):
+        self.closed = True
+
+
+def test_adaptive_concurrency():
+    clock = FakeClock()
+    ac = AdaptiveConcurrency(1, 3, window=1.0, clock=clock)
+    assert ac.limit == 1
+    # first completed window, probes upwards
+    ac.record(0)
+    clock.now = 1.0
+    ac.record(100)
+    assert ac.limit == 2
+    # throughput doubles, keep going
+    clock.now = 2.0
+    ac.record(200)
+    assert ac.limit == 3
+    # upper bound is respected
+    clock.now = 3.0
+    ac.record(400)
+    assert ac.limit == 3
+    # plateau, no change
+    clock.now = 4.0
+    ac.record(410)
+    assert ac.limit == 3
+    # throughput drops, back off
+    clock.now = 5.0
+    ac.record(100)
+    assert ac.limit == 2
+    with pytest.raises(ValueError):
+        AdaptiveConcurrency(3, 2)
+
+
+def _transfer_all(pool, items, errors):
+    def _get(src, dst):
+        try:
+            with pool.channel(transfer=True) as io:
+                io.get(src, dst, pool.record)
+        except Exception as e:
+            errors[src] = e
+
+    threads = [
+        threading.Thread(target=_get, args=item) for item in items]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_channel_pool(tmp_path):
+    tracker = dict(lock=threading.Lock(), active=0, peak=0)
+    created = []
+
+    def factory():
+        io = FakeIO(tracker)
+        created.append(io)
+        return io
+
+    pool = SSHChannelPool(
+        factory,
+        concurrency=AdaptiveConcurrency(1, 3, initial=2, window=60),
+    )
+    items = []
+    for i in range(12):
+        src = tmp_path / f'src{i}'
+        src.write_text(f'content{i}')
+        items.append((src, tmp_path / f'dst{i}'))
+    items.append((tmp_path / 'missing', tmp_path / 'dst_missing'))
+    errors = {}
+    _transfer_all(pool, items, errors)
+    assert list(errors) == [tmp_path / 'missing']
+    assert isinstance(errors[tmp_path / 'missing'], FileNotFoundError)
+    for i in range(12):
+        assert (tmp_path / f'dst{i}').read_text() == f'content{i}'
+    # bounded by the concurrency limit, but parallel
+    assert tracker['peak'] == 2
+    assert len(created) <= 2
+
+    # other commands can use the remaining channel while the transfers
+    # are at the limit
+    with pool.channel(transfer=True) as io1, \
+            pool.channel(transfer=True) as io2, \
+            pool.channel() as io3:
+        assert len({id(io1), id(io2), id(io3)}) == 3
+    pool.close()
+    assert all(io.closed for io in created)
+
+
+def test_channel_pool_adapts(tmp_path):
+    clock = FakeClock()
+    tracker = dict(lock=threading.Lock(), active=0, peak=0)
+    pool = SSHChannelPool(
+        lambda: FakeIO(tracker),
+        concurrency=AdaptiveConcurrency(1, 3, window=1.0, clock=clock),
+    )
+    assert pool.concurrency.limit == 1
+    pool.record(0)
+    clock.now = 1.0
+    # throughput reported by transfers raises the limit
+    pool.record(100)
+    assert pool.concurrency.limit == 2
+    with pool.channel(transfer=True), pool.channel(transfer=True):
+        pass
+    pool.close()
+
+
+def test_channel_pool_ssh(ria_sshserver_setup, ria_sshserver, tmp_path):
+    from pathlib import PurePosixPath
+    from datalad.distributed.ora_remote import SSHRemoteIO
+
+    localpath = Path(ria_sshserver_setup['LOCALPATH'])
+    sshpath = PurePosixPath(ria_sshserver_setup['SSH_PATH'])
+    items = []
+    for i in range(5):
+        # the key-like name gives the transfer size
+        name = f'MD5E-s5--{i:032d}'
+        (localpath / name).write_text(f'file{i}')
+        items.append((sshpath / name, tmp_path / name))
+    ssh_url = 'ssh://{SSH_LOGIN}@{HOST}:{SSH_PORT}'.format(
+        **ria_sshserver_setup)
+    pool = SSHChannelPool(lambda: SSHRemoteIO(ssh_url))
+    errors = {}
+    try:
+        _transfer_all(pool, items, errors)
+    finally:
+        pool.close()
+    assert not errors
+    for i, (_, dst) in enumerate(items):
+        assert dst.read_text() == f'file{i}'
+
+
+def test_remote_query_memo():
+    memo = RemoteQueryMemo()
+    calls = []
+
+    def query(res):
+        def _fn():
+            calls.append(res)
+            if res is None:
+                raise FileNotFoundError('gone')
+            return res
+        return _fn
+
+    memo.add_store('h', '/store')
+    memo.add_store('other', '/store')
+    store = '/store/ria-layout-version'
+    assert memo.get('h', 'read_file', store, query('1')) == '1'
+    assert memo.get('h', 'read_file', store, query('2')) == '1'
+    # separate per host and query
+    assert memo.get('other', 'read_file', store, query('3')) == '3'
+    assert memo.get('h', 'exists', store, query(True)) is True
+    # negative results are memoized too
+    dsver = '/store/abc/def/ria-layout-version'
+    for _ in range(2):
+        with pytest.raises(FileNotFoundError):
+            memo.get('h', 'read_file', dsver, query(None))
+    assert memo.get('h', 'exists', '/store/alias/myds', query(True))
+    assert memo.get('h', 'exists', '/store/alias/myds', query(False))
+    # no memoization for anything that is not store metadata
+    for path in ('/store/abc/def/annex/objects/X9/6J/key/key',
+                 '/store/abc/def/config',
+                 '/elsewhere/ria-layout-version'):
+        assert memo.get('h', 'exists', path, query(True))
+        assert memo.get('h', 'exists', path, query(False)) is False
+    # nor for an unknown store
+    assert memo.get('unknown', 'read_file', store, query('7')) == '7'
+    assert memo.get('unknown', 'read_file', store, query('8')) == '8'
+    assert calls == [
+        '1', '3', True, None, True] + [True, False] * 3 + ['7', '8']
+    assert memo.hits == 3
+    # invalidation of a path, or anything below a directory
+    memo.invalidate('h', store)
+    assert memo.get('h', 'read_file', store, query('4')) == '4'
+    assert memo.get('other', 'read_file', store, query('5')) == '3'
+    memo.invalidate('h', '/store/abc')
+    with pytest.raises(FileNotFoundError):
+        memo.get('h', 'read_file', dsver, query(None))
+    assert calls[-2:] == ['4', None]
+    memo.clear()
+    assert memo.get('other', 'read_file', store, query('6')) == '6'
+
+
+def test_sshremoteio_memo(ria_sshserver_setup, ria_sshserver):
+    from pathlib import PurePosixPath
+    from datalad.distributed.ora_remote import SSHRemoteIO
+    from datalad_ria.sshio import query_memo
+
+    sshpath = PurePosixPath(ria_sshserver_setup['SSH_PATH']) / 'memotest'
+    verfile = sshpath / 'ria-layout-version'
+    ssh_url = 'ssh://{SSH_LOGIN}@{HOST}:{SSH_PORT}'.format(
+        **ria_sshserver_setup)
+    query_memo.clear()
+    io = SSHRemoteIO(ssh_url)
+    query_memo.add_store(io.ssh.sshri.as_str(), sshpath)
+    try:
+        io.mkdir(sshpath)
+        io.write_file(verfile, '1')
+        assert io.read_file(verfile).strip() == '1'
+        hits = query_memo.hits
+        # a new instance, as for another start of a special remote
+        io2 = SSHRemoteIO(ssh_url)
+        try:
+            assert io2.read_file(verfile).strip() == '1'
+            assert io2.exists(verfile)
+            assert io2.exists(verfile)
+        finally:
+            io2.close()
+        assert query_memo.hits == hits + 2
+        # writes by the same client invalidate
+        io.write_file(verfile, '2')
+        assert io.read_file(verfile).strip() == '2'
+        io.remove(verfile)
+        assert not io.exists(verfile)
+        with pytest.raises(FileNotFoundError):
+            io.read_file(verfile)
+        io.remove_dir(sshpath)
+    finally:
+        io.close()
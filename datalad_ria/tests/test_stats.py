@@ -0,0 +1,52 @@
+import json
+import threading
+
+from datalad_ria.stats import (
+    TransferStats,
+    emit_stats,
+)
+
+
+def test_transfer_stats():
+    stats = TransferStats()
+
+    def work():
+        for _ in range(100):
+            stats.count('stored')
+            stats.count('stored-bytes', 10)
+            with stats.timer('transfer'):
+                pass
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats.count('cache-hits', 3)
+    stats.count('cache-misses')
+    # no rate without hits
+    stats.count('other-misses')
+    res = stats.as_dict()
+    assert res['counts']['stored'] == 400
+    assert res['counts']['stored-bytes'] == 4000
+    assert res['times']['transfer'] >= 0
+    assert res['hit_rates'] == {'cache': 0.75}
+    assert res['duration'] >= 0
+
+    stats.reset()
+    assert stats.as_dict()['counts'] == {}
+
+
+def test_emit_stats(tmp_path):
+    path = tmp_path / 'sub' / 'stats.jsonl'
+    emit_stats({'pid': 1}, str(path))
+    emit_stats({'pid': 2}, str(path))
+    assert [json.loads(line) for line in path.read_text().splitlines()] \
+        == [{'pid': 1}, {'pid': 2}]
+    # no file, no error
+    emit_stats({'pid': 3})
+    path.parent.chmod(0o500)
+    try:
+        emit_stats({'pid': 4}, str(path.parent / 'new.jsonl'))
+    finally:
+        path.parent.chmod(0o700)
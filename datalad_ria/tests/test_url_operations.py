@@ -0,0 +1,371 @@
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from pathlib import Path
+import threading
+
+import pytest
+
+from datalad_next.url_operations import (
+    UrlOperationsRemoteError,
+    UrlOperationsResourceUnknown,
+)
+
+from datalad_ria.cache import JsonFileCache
+import datalad_ria.url_operations
+from datalad_ria.url_operations import (
+    RiaHttpUrlOperations,
+    RiaSshUrlOperations,
+    RiaUrlOperations,
+)
+
+from datalad_ria.tests.utils import get_unreachable_url
+
+
+def test_ria_url_operations_dispatch():
+    ops = RiaUrlOperations()
+    assert isinstance(ops._get_handler('ssh://host/path'),
+                      RiaSshUrlOperations)
+    # same handler instance for all ssh URLs
+    assert ops._get_handler('ssh://other/path') \
+        is ops._get_handler('ssh://host/path')
+    assert not isinstance(ops._get_handler('file:///path'),
+                          RiaSshUrlOperations)
+    assert isinstance(ops._get_handler('https://host/path'),
+                      RiaHttpUrlOperations)
+    ops.close()
+
+
+def test_ria_ssh_url_operations(ria_sshserver_setup, ria_sshserver,
+                                tmp_path):
+    localpath = Path(ria_sshserver_setup['LOCALPATH']) / 'urlops'
+    base_url = 'ssh://{SSH_LOGIN}@{HOST}:{SSH_PORT}{SSH_PATH}/urlops'.format(
+        **ria_sshserver_setup)
+    src = tmp_path / 'src'
+    src.write_text('some content')
+    url = f'{base_url}/sub/dir/file'
+
+    ops = RiaSshUrlOperations()
+    try:
+        with pytest.raises(UrlOperationsResourceUnknown):
+            ops.stat(url)
+        res = ops.upload(src, url, hash=['md5'])
+        assert res['content-length'] == 12
+        assert res['md5'] == '9893532233caff98cd083a116b013c0b'
+        assert (localpath / 'sub' / 'dir' / 'file').read_text() \
+            == 'some content'
+        assert ops.stat(url) == {'content-length': 12}
+        dst = tmp_path / 'dst'
+        res = ops.download(url, dst, hash=['md5'])
+        assert res['md5'] == '9893532233caff98cd083a116b013c0b'
+        assert dst.read_text() == 'some content'
+        ops.delete(url)
+        # the empty directory is gone too
+        assert not (localpath / 'sub' / 'dir').exists()
+        with pytest.raises(UrlOperationsResourceUnknown):
+            ops.delete(url)
+        with pytest.raises(UrlOperationsResourceUnknown):
+            ops.download(url, dst)
+        # many files with a single command
+        urls = [f'{base_url}/sub/{d}/file' for d in ('a', 'b', 'c')]
+        for u in urls[:2]:
+            ops.upload(src, u)
+        res = ops.delete_many(urls)
+        assert res[:2] == [{}, {}]
+        assert isinstance(res[2], UrlOperationsResourceUnknown)
+        assert not any((localpath / 'sub' / d).exists() for d in 'abc')
+    finally:
+        ops.close()
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    # serves `server.content` with an ETag, honors `Range` and `If-Range`,
+    # and closes the connection after `server.drop_after` bytes, if set
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        srv = self.server
+        srv.clients.add(self.client_address)
+        if self.path != '/file':
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('ETag', srv.etag)
+        self.send_header('Content-Length', str(len(srv.content)))
+        self.end_headers()
+
+    def do_GET(self):
+        srv = self.server
+        content = srv.content
+        srv.clients.add(self.client_address)
+        srv.requests.append({k.lower(): v for k, v in self.headers.items()})
+        if self.path != '/file':
+            self.send_error(404)
+            return
+        if self.headers.get('If-Match', srv.etag) != srv.etag:
+            self.send_error(412)
+            return
+        start, end = 0, len(content)
+        rng = self.headers.get('Range')
+        if rng and self.headers.get('If-Range', srv.etag) == srv.etag:
+            first, last = rng[len('bytes='):].split('-')
+            start = int(first)
+            if last:
+                end = int(last) + 1
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(content)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                'Content-Range',
+                f'bytes {start}-{end - 1}/{len(content)}')
+        else:
+            self.send_response(200)
+        if srv.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', srv.etag)
+        self.send_header('Content-Length', str(end - start))
+        self.end_headers()
+        body = content[start:end]
+        if srv.drop_after is not None:
+            body = body[:srv.drop_after]
+            srv.drop_after = None
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def range_server():
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), _RangeHandler)
+    srv.content = bytes(range(256)) * 8192
+    srv.etag = '"v1"'
+    srv.drop_after = None
+    srv.accept_ranges = False
+    srv.requests = []
+    srv.clients = set()
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield srv
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_ria_http_url_operations_resume(range_server, datalad_cfg, tmp_path,
+                                        monkeypatch):
+    monkeypatch.setattr(datalad_ria.url_operations, '_RETRY_DELAY', 0)
+    url = 'http://127.0.0.1:{}/file'.format(range_server.server_port)
+    content = range_server.content
+    cache = JsonFileCache(tmp_path / 'resume.json')
+    ops = RiaHttpUrlOperations(resume_cache=cache)
+    dst = tmp_path / 'dst'
+
+    with pytest.raises(UrlOperationsResourceUnknown):
+        ops.download(url + 'absent', dst)
+
+    # interrupted, no immediate retry: the partial content is kept
+    datalad_cfg.set('datalad.ria.http-retries', '0', scope='global')
+    range_server.drop_after = 100000
+    with pytest.raises(UrlOperationsRemoteError):
+        ops.download(url, dst)
+    assert dst.read_bytes() == content[:100000]
+    assert cache.get(str(dst.absolute()))['validator'] == '"v1"'
+
+    # the next download only fetches the missing tail
+    range_server.requests.clear()
+    res = ops.download(url, dst, hash=['md5'])
+    assert dst.read_bytes() == content
+    assert res['content-length'] == len(content)
+    assert res['md5'] == 'db1f7d786f6e0317456fac1628349973'
+    assert range_server.requests[0]['range'] == 'bytes=100000-'
+    assert cache.get(str(dst.absolute())) is None
+
+    # interrupted, with an immediate retry
+    datalad_cfg.set('datalad.ria.http-retries', '1', scope='global')
+    range_server.drop_after = 200000
+    range_server.requests.clear()
+    ops.download(url, dst)
+    assert dst.read_bytes() == content
+    assert [r.get('range') for r in range_server.requests] \
+        == [None, 'bytes=200000-']
+
+    # the content changed after the interruption: start over
+    datalad_cfg.set('datalad.ria.http-retries', '0', scope='global')
+    range_server.drop_after = 1000
+    with pytest.raises(UrlOperationsRemoteError):
+        ops.download(url, dst)
+    range_server.etag = '"v2"'
+    range_server.content = content = content[::-1]
+    range_server.requests.clear()
+    ops.download(url, dst)
+    assert dst.read_bytes() == content
+    assert range_server.requests[0]['if-range'] == '"v1"'
+
+    # a complete partial download is recognized
+    cache.set(str(dst.absolute()), dict(url=url, validator='"v2"'))
+    range_server.requests.clear()
+    assert ops.download(url, dst)['content-length'] == len(content)
+    assert dst.read_bytes() == content
+    assert len(range_server.requests) == 1
+
+
+def test_ria_http_url_operations_pool(range_server, datalad_cfg):
+    datalad_cfg.set('datalad.ria.http-connections', '2', scope='global')
+    url = 'http://127.0.0.1:{}/file'.format(range_server.server_port)
+    ops = RiaUrlOperations()
+    try:
+        for i in range(5):
+            assert ops.stat(url)['content-length'] \
+                == len(range_server.content)
+        # all sequential requests use a single connection
+        assert len(range_server.clients) == 1
+
+        # concurrent requests use no more than the configured connections
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(ops.stat(url)))
+            for i in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(results) == 8
+        assert len(range_server.clients) <= 2
+
+        with pytest.raises(UrlOperationsResourceUnknown):
+            ops.stat(url + 'absent')
+    finally:
+        ops.close()
+
+
+def test_ria_http_url_operations_unreachable(datalad_cfg, tmp_path,
+                                             monkeypatch):
+    monkeypatch.setattr(datalad_ria.url_operations, '_RETRY_DELAY', 0)
+    datalad_cfg.set('datalad.ria.http-retries', '1', scope='global')
+    url = get_unreachable_url('/file')
+    ops = RiaUrlOperations()
+    try:
+        with pytest.raises(UrlOperationsRemoteError):
+            ops.stat(url)
+        with pytest.raises(UrlOperationsRemoteError):
+            ops.download(url, tmp_path / 'file')
+    finally:
+        ops.close()
+
+
+def test_ria_http_url_operations_ranges(range_server, datalad_cfg, tmp_path,
+                                        monkeypatch):
+    monkeypatch.setattr(datalad_ria.url_operations, '_RETRY_DELAY', 0)
+    datalad_cfg.set('datalad.ria.http-ranges', '4', scope='global')
+    datalad_cfg.set('datalad.ria.http-ranges-min-size', '1000',
+                    scope='global')
+    url = 'http://127.0.0.1:{}/file'.format(range_server.server_port)
+    content = range_server.content
+    ops = RiaHttpUrlOperations(resume_cache=JsonFileCache(
+        tmp_path / 'resume.json'))
+    dst = tmp_path / 'dst'
+    try:
+        # no declared support for ranges, a single request
+        ops.download(url, dst)
+        assert dst.read_bytes() == content
+        assert len(range_server.requests) == 1
+
+        range_server.accept_ranges = True
+        range_server.requests.clear()
+
+        def no_second_pass(*args):
+            raise AssertionError('content read again')
+
+        with monkeypatch.context() as m:
+            m.setattr(ops, '_get_file_props', no_second_pass)
+            res = ops.download(url, dst, hash=['md5'])
+        assert dst.read_bytes() == content
+        assert res['md5'] == 'db1f7d786f6e0317456fac1628349973'
+        assert res['content-length'] == len(content)
+        assert len(range_server.requests) == 4
+        assert sorted(r.get('range', '') for r in range_server.requests) \
+            == ['', 'bytes=1048576-1572863', 'bytes=1572864-2097151',
+                'bytes=524288-1048575']
+        assert all(r['if-match'] == '"v1"'
+                   for r in range_server.requests if 'range' in r)
+
+        # an interruption of any range is resumed from the complete prefix
+        datalad_cfg.set('datalad.ria.http-retries', '0', scope='global')
+        range_server.drop_after = 100000
+        with pytest.raises(UrlOperationsRemoteError):
+            ops.download(url, dst)
+        assert content.startswith(dst.read_bytes())
+        datalad_cfg.set('datalad.ria.http-retries', '1', scope='global')
+        range_server.drop_after = 100000
+        ops.download(url, dst)
+        assert dst.read_bytes() == content
+
+        # content that changes during the download fails
+        range_server.etag = '"v2"'
+        range_server.requests.clear()
+        orig_get = ops._download_part
+
+        def changing_part(*args, **kwargs):
+            range_server.etag = '"v3"'
+            return orig_get(*args, **kwargs)
+
+        monkeypatch.setattr(ops, '_download_part', changing_part)
+        datalad_cfg.set('datalad.ria.http-retries', '0', scope='global')
+        with pytest.raises(UrlOperationsRemoteError):
+            ops.download(url, dst)
+    finally:
+        ops.close()
+
+
+def test_prefix_hasher(tmp_path):
+    import hashlib
+    import os
+    import threading
+
+    from datalad_ria.url_operations import (
+        _PrefixHasher,
+        _RangeCancelled,
+        _write_part,
+    )
+
+    content = bytes(range(256)) * 40
+    bounds = [0, 3000, 6000, 10240]
+    received = [0, 0, 0]
+    reads = []
+    fd = os.open(tmp_path / 'dst', os.O_RDWR | os.O_CREAT)
+    orig_pread = os.pread
+
+    def pread(*args):
+        reads.append(args[1])
+        return orig_pread(*args)
+
+    try:
+        hasher = hashlib.md5()
+        prefix_hasher = _PrefixHasher(hasher, fd, bounds, received)
+        os.pread = pread
+        cancel = threading.Event()
+        # the last ranges arrive before the first one
+        for idx in (2, 1, 0):
+            chunks = [content[o:o + 1000]
+                      for o in range(bounds[idx], bounds[idx + 1], 1000)]
+            _write_part(iter(chunks), fd, bounds, idx, received, cancel,
+                        prefix_hasher=prefix_hasher)
+        prefix_hasher.finish()
+        cancel.set()
+        with pytest.raises(_RangeCancelled):
+            _write_part(iter([b'x']), fd, bounds, 0, received, cancel)
+    finally:
+        os.pread = orig_pread
+        os.close(fd)
+    assert hasher.hexdigest() == hashlib.md5(content).hexdigest()
+    # only what arrived ahead of the hashed prefix was read back
+    assert sum(reads) <= bounds[3] - bounds[1]
@@ -0,0 +1,16 @@
+from datalad_ria.verify import get_key_digest
+
+
+def test_get_key_digest():
+    assert get_key_digest(
+        'MD5E-s8--7e55db001d319a94b0b713529a756623.txt') \
+        == ('md5', '7e55db001d319a94b0b713529a756623')
+    sha256 = 'a' * 64
+    assert get_key_digest(f'SHA256-s3--{sha256}') == ('sha256', sha256)
+    assert get_key_digest(f'SHA256E-s3-m12--{sha256}.tar.gz') \
+        == ('sha256', sha256)
+    # no checksum of the content
+    assert get_key_digest(f'SHA256E-s10-S5-C1--{sha256}.dat') is None
+    assert get_key_digest('WORM-s3-m12--file.txt') is None
+    assert get_key_digest('URL--http&c%%example.com%file') is None
+    assert get_key_digest('BLAKE2B160E-s3--' + 'b' * 40) is None
@@ -51,3 +51,13 @@ def assert_ssh_access(
     )
     if localpath:
         assert not (Path(localpath) / 'datalad-tests-probe').exists()
+
+
+def get_unreachable_url(path: str = '') -> str:
+    """Return an HTTP URL of a local port that nobody listens on"""
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}{path}'
@@ -0,0 +1,1143 @@
+"""URL operations on RIA stores
+
+The generic URL handlers of DataLad-next operate on individual URLs, and
+set up a new connection for each operation. For RIA stores accessed via
+SSH, the connection setup dominates the cost of operations on small
+files. The handler in this module keeps persistent remote shells to a
+store host, and reuses them for all operations.
+
+For RIA stores accessed via ``file://`` URLs, content is linked rather
+than copied whenever possible (see :mod:`datalad_ria.localcopy`).
+
+For RIA stores accessed via ``http(s)://`` URLs, interrupted downloads
+are resumed with range requests, instead of starting over, and large
+files are downloaded in several ranges concurrently.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import (
+    FIRST_EXCEPTION,
+    ThreadPoolExecutor,
+    wait as futures_wait,
+)
+from contextlib import contextmanager
+import logging
+import os
+from pathlib import (
+    Path,
+    PurePosixPath,
+)
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlparse
+import uuid
+
+import requests
+import urllib3
+
+from datalad.distributed.ora_remote import (
+    SSHRemoteIO,
+    sh_quote,
+)
+
+from datalad_next.url_operations import (
+    UrlOperations,
+    UrlOperationsRemoteError,
+    UrlOperationsResourceUnknown,
+)
+from datalad_next.url_operations.any import AnyUrlOperations
+from datalad_next.url_operations.file import FileUrlOperations
+from datalad_next.url_operations.http import HttpUrlOperations
+from datalad_next.utils.consts import COPY_BUFSIZE
+from datalad_next.utils.multihash import (
+    MultiHash,
+    NoOpHash,
+)
+from datalad_next.utils.requests_auth import DataladAuth
+
+from datalad_ria.cache import JsonFileCache
+from datalad_ria.localcopy import (
+    copy_file,
+    link_file,
+)
+from datalad_ria.progress import get_progress_callback
+from datalad_ria.sshio import (
+    RemoteFileNotFoundError,
+    SSHChannelPool,
+)
+from datalad_ria.stats import stats
+
+lgr = logging.getLogger('datalad.ria.url_operations')
+
+__all__ = [
+    'RiaFileUrlOperations',
+    'RiaHttpUrlOperations',
+    'RiaSshUrlOperations',
+    'RiaUrlOperations',
+]
+
+# downloads of at least this size record their resume state before any
+# content is received, such that even a killed process can be resumed
+_RESUME_MIN_SIZE = 1024 * 1024
+# resume state older than this (in seconds) is not used
+_RESUME_TTL = 7 * 86400.0
+# seconds to wait before the first retry of an interrupted download,
+# multiplied by the number of the retry
+_RETRY_DELAY = 1.0
+# seconds between progress reports while waiting for concurrent ranges
+_RANGES_PROGRESS_INTERVAL = 0.5
+# errors of an established download, after which it can be resumed
+_RESUMABLE_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+    urllib3.exceptions.ProtocolError,
+    urllib3.exceptions.ReadTimeoutError,
+)
+
+
+class RiaSshUrlOperations(UrlOperations):
+    """Handler for operations on ``ssh://`` URLs via persistent shells
+
+    All operations on a host are performed via a pool of
+    ``SSHRemoteIO`` instances (see :class:`datalad_ria.sshio.SSHChannelPool`),
+    i.e. remote shells that stay open until :meth:`close` is called. All
+    shells share a single (multiplexed) SSH connection. The number of
+    concurrent downloads and uploads per host adapts to their aggregate
+    throughput (up to ``datalad.ria.ssh-channels``).
+
+    Uploads are written to a temporary file next to the target, and moved
+    into place when complete. An interrupted upload never leaves a
+    partial file at the target location.
+    """
+    def __init__(self, cfg=None):
+        super().__init__(cfg=cfg)
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self, url: str) -> tuple[SSHChannelPool, PurePosixPath]:
+        parsed = urlparse(url)
+        if not parsed.hostname or not parsed.path:
+            raise ValueError(f'unsupported URL {url!r}')
+        host = parsed._replace(
+            path='', params='', query='', fragment='').geturl()
+        with self._lock:
+            pool = self._pools.get(host)
+            if pool is None:
+                pool = SSHChannelPool(lambda: _open_shell(host))
+                self._pools[host] = pool
+        return pool, PurePosixPath(parsed.path)
+
+    @contextmanager
+    def channel(self, url: str):
+        """Context manager yielding a remote shell and the path of a URL
+
+        The ``SSHRemoteIO`` instance is used exclusively until the context
+        is left. This gives access to any operation beyond the
+        ``UrlOperations`` API.
+        """
+        pool, path = self._get_pool(url)
+        with pool.channel() as io:
+            yield io, path
+
+    def stat(self,
+             url: str,
+             *,
+             credential: str | None = None,
+             timeout: float | None = None) -> Dict:
+        """Gather information on a URL target, without downloading it
+
+        See :meth:`datalad_next.url_operations.UrlOperations.stat`
+        for parameter documentation and exception behavior.
+        """
+        pool, path = self._get_pool(url)
+        try:
+            with pool.channel() as io:
+                # a single command, '-' for anything we cannot read
+                out = io._run(
+                    'wc -c < {} 2>/dev/null || echo -'.format(
+                        _quote(path)),
+                    no_output=False,
+                ).strip()
+        except Exception as e:
+            raise UrlOperationsRemoteError(url, message=str(e)) from e
+        if out == '-':
+            raise UrlOperationsResourceUnknown(url)
+        return {'content-length': int(out)}
+
+    def download(self,
+                 from_url: str,
+                 to_path: Path | None,
+                 *,
+                 credential: str | None = None,
+                 hash: list[str] | None = None,
+                 timeout: float | None = None) -> Dict:
+        """Download a file via a persistent remote shell
+
+        Downloading to stdout (``to_path=None``) is not supported.
+
+        See :meth:`datalad_next.url_operations.UrlOperations.download`
+        for parameter documentation and exception behavior.
+        """
+        if to_path is None:
+            raise NotImplementedError(
+                'download to stdout is not supported')
+        pool, path = self._get_pool(from_url)
+        progress_id = self._get_progress_id(from_url, to_path)
+        progress_cb = get_progress_callback()
+        received = [0]
+
+        def _progress_cb(nbytes):
+            self._progress_report_update(
+                progress_id, ('Downloaded chunk',), nbytes - received[0])
+            pool.record(nbytes - received[0])
+            received[0] = nbytes
+            if progress_cb:
+                progress_cb(nbytes)
+
+        # the checksum is computed while the content is written
+        hasher = self._get_hasher(hash)
+        self._progress_report_start(
+            progress_id,
+            ('Download %s to %s', from_url, to_path),
+            'downloading',
+            None,
+        )
+        try:
+            with pool.channel(transfer=True) as io:
+                try:
+                    io.get(path, to_path, _progress_cb, hasher.update)
+                except RemoteFileNotFoundError as e:
+                    raise UrlOperationsResourceUnknown(from_url) from e
+                except Exception as e:
+                    raise UrlOperationsRemoteError(
+                        from_url, message=str(e)) from e
+        finally:
+            self._progress_report_stop(progress_id, ('Finished download',))
+        props = hasher.get_hexdigest()
+        props['content-length'] = Path(to_path).stat().st_size
+        return props
+
+    def upload(self,
+               from_path: Path | None,
+               to_url: str,
+               *,
+               credential: str | None = None,
+               hash: list[str] | None = None,
+               timeout: float | None = None) -> Dict:
+        """Upload a file via a persistent remote shell
+
+        Uploading from stdin (``from_path=None``) is not supported.
+
+        See :meth:`datalad_next.url_operations.UrlOperations.upload`
+        for parameter documentation and exception behavior.
+        """
+        if from_path is None:
+            raise NotImplementedError(
+                'upload from stdin is not supported')
+        pool, path = self._get_pool(to_url)
+        from_path = Path(from_path)
+        expected_size = from_path.stat().st_size
+        progress_id = self._get_progress_id(from_path, to_url)
+        progress_cb = get_progress_callback()
+        sent = [0]
+
+        def _progress_cb(nbytes):
+            self._progress_report_update(
+                progress_id, ('Uploaded chunk',), nbytes - sent[0])
+            pool.record(nbytes - sent[0])
+            sent[0] = nbytes
+            if progress_cb:
+                progress_cb(nbytes)
+
+        tmp_path = path.parent / f'.{path.name}.{uuid.uuid4().hex[:8]}.tmp'
+        self._progress_report_start(
+            progress_id,
+            ('Upload %s to %s', from_path, to_url),
+            'uploading',
+            expected_size,
+        )
+        try:
+            with pool.channel(transfer=True) as io:
+                try:
+                    io.mkdir(path.parent)
+                    io.put(from_path, tmp_path, _progress_cb)
+                    io.rename(tmp_path, path)
+                except Exception as e:
+                    io._run('rm -f {}'.format(_quote(tmp_path)))
+                    raise UrlOperationsRemoteError(
+                        to_url, message=str(e)) from e
+        finally:
+            self._progress_report_stop(progress_id, ('Finished upload',))
+        props = self._hash_file(from_path, hash)
+        props['content-length'] = expected_size
+        return props
+
+    def delete(self,
+               url: str,
+               *,
+               credential: str | None = None,
+               timeout: float | None = None) -> Dict:
+        """Delete a file via a persistent remote shell
+
+        A directory containing the file is removed too, if it is empty
+        afterwards, as git-annex does for the key directories of its
+        object tree.
+
+        See :meth:`datalad_next.url_operations.UrlOperations.delete`
+        for parameter documentation and exception behavior.
+        """
+        pool, path = self._get_pool(url)
+        with pool.channel() as io:
+            try:
+                io.remove(path)
+            except Exception as e:
+                if not io.exists(path):
+                    raise UrlOperationsResourceUnknown(url) from e
+                raise UrlOperationsRemoteError(url, message=str(e)) from e
+            # just try, fails (silently) for a non-empty directory
+            io._run('rmdir {} 2>/dev/null || true'.format(
+                _quote(path.parent)))
+        return {}
+
+    def delete_many(self, urls: list[str]) -> list:
+        """Delete many files, with a single remote command per host
+
+        Like :meth:`delete`, but a directory containing a file is made
+        writable for the deletion, if needed, like ``SSHRemoteIO.remove()``
+        does.
+
+        Returns
+        -------
+        list
+          With an item per URL: ``{}`` for a deleted file, or the exception
+          :meth:`delete` would have raised.
+        """
+        by_pool = {}
+        for url in urls:
+            pool, path = self._get_pool(url)
+            by_pool.setdefault(id(pool), (pool, []))[1].append((url, path))
+        results = {}
+        for pool, items in by_pool.values():
+            try:
+                with pool.channel() as io:
+                    # in a subshell, to keep the persistent shell alive
+                    out = io._run(
+                        '(\n{})'.format(_DELETE_SCRIPT.format(
+                            paths=' '.join(_quote(p) for _, p in items))),
+                        no_output=False,
+                        check=True,
+                    ).split()
+                if len(out) != len(items):
+                    raise RuntimeError(f'unexpected response {out!r}')
+            except Exception as e:
+                for url, _ in items:
+                    results[url] = UrlOperationsRemoteError(
+                        url, message=str(e))
+                continue
+            for (url, _), status in zip(items, out):
+                if status == 'D':
+                    results[url] = {}
+                elif status == 'A':
+                    results[url] = UrlOperationsResourceUnknown(url)
+                else:
+                    results[url] = UrlOperationsRemoteError(
+                        url, message='cannot delete')
+        return [results[url] for url in urls]
+
+    def _get_hasher(self, hash: list[str] | None) -> NoOpHash | MultiHash:
+        return _get_timed_hasher(hash)
+
+    def close(self) -> None:
+        """Close all remote shells"""
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools = {}
+        for pool in pools:
+            pool.close()
+
+    def _hash_file(self, path: Path, hash: list[str] | None) -> Dict:
+        if hash is None:
+            return {}
+        hasher = self._get_hasher(hash)
+        with Path(path).open('rb') as f:
+            while True:
+                chunk = f.read(COPY_BUFSIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+        return hasher.get_hexdigest()
+
+
+class RiaFileUrlOperations(FileUrlOperations):
+    """Handler for operations on ``file://`` URLs that avoids copies
+
+    Downloads create the target as a reflink or hardlink of the source,
+    whenever possible and safe (see :func:`datalad_ria.localcopy.link_file`).
+    Uploads are only reflinked, such that a file in a store is never the
+    annex object of a dataset. Otherwise, the content is
+    copied by the kernel, if possible (see
+    :func:`datalad_ria.localcopy.copy_file`). Only when a hash of the
+    content is requested, it is copied like by ``FileUrlOperations``.
+    """
+    def download(self,
+                 from_url: str,
+                 to_path: Path | None,
+                 *,
+                 credential: str | None = None,
+                 hash: list[str] | None = None,
+                 timeout: float | None = None) -> Dict:
+        """Link or copy a file:// URL target to a local path
+
+        See :meth:`datalad_next.url_operations.UrlOperations.download`
+        for parameter documentation and exception behavior.
+        """
+        if to_path is None or hash is not None:
+            return super().download(
+                from_url, to_path, credential=credential, hash=hash,
+                timeout=timeout)
+        props = self._stat(from_url, credential=credential)
+        from_path = props.pop('_path')
+        try:
+            props.update(self._link_or_copy(
+                from_path,
+                Path(to_path),
+                props['content-length'],
+                start_log=('Download %s to %s', from_url, to_path),
+                update_log=('Downloaded chunk',),
+                finish_log=('Finished download',),
+                progress_label='downloading',
+            ))
+        except PermissionError:
+            # would be a local issue, pass-through
+            raise
+        except Exception as e:
+            raise UrlOperationsRemoteError(from_url, message=str(e)) from e
+        return props
+
+    def upload(self,
+               from_path: Path | None,
+               to_url: str,
+               *,
+               credential: str | None = None,
+               hash: list[str] | None = None,
+               timeout: float | None = None) -> Dict:
+        """Link or copy a local file to a file:// URL target
+
+        See :meth:`datalad_next.url_operations.UrlOperations.upload`
+        for parameter documentation and exception behavior.
+        """
+        if from_path is None or hash is not None:
+            return super().upload(
+                from_path, to_url, credential=credential, hash=hash,
+                timeout=timeout)
+        from_path = Path(from_path)
+        expected_size = from_path.stat().st_size
+        to_path = self._file_url_to_path(to_url)
+        to_path.parent.mkdir(exist_ok=True, parents=True)
+        try:
+            return self._link_or_copy(
+                from_path,
+                to_path,
+                expected_size,
+                start_log=('Upload %s to %s', from_path, to_url),
+                update_log=('Uploaded chunk',),
+                finish_log=('Finished upload',),
+                progress_label='uploading',
+                hardlink=False,
+            )
+        except Exception as e:
+            raise UrlOperationsRemoteError(to_url, message=str(e)) from e
+
+    def _link_or_copy(self,
+                      src: Path,
+                      dst: Path,
+                      expected_size: int,
+                      start_log: tuple,
+                      update_log: tuple,
+                      finish_log: tuple,
+                      progress_label: str,
+                      hardlink: bool = True,
+    ) -> Dict:
+        progress_cb = get_progress_callback()
+        try:
+            method = link_file(
+                src, dst, thin=self.cfg.getbool('annex', 'thin', False),
+                hardlink=hardlink)
+        except OSError as e:
+            lgr.debug('Cannot link %s to %s: %s', src, dst, e)
+            method = None
+        if method:
+            lgr.debug('Created %s as a %s of %s', dst, method, src)
+            if progress_cb:
+                progress_cb(expected_size)
+            return {'content-length': expected_size}
+
+        progress_id = self._get_progress_id(src, dst)
+        reported = [0]
+
+        def _progress_cb(nbytes):
+            self._progress_report_update(
+                progress_id, update_log, nbytes - reported[0])
+            reported[0] = nbytes
+            if progress_cb:
+                progress_cb(nbytes)
+
+        self._progress_report_start(
+            progress_id, start_log, progress_label, expected_size)
+        try:
+            return {'content-length': copy_file(src, dst, _progress_cb)}
+        finally:
+            self._progress_report_stop(progress_id, finish_log)
+
+
+class RiaHttpUrlOperations(HttpUrlOperations):
+    """Handler for operations on ``http(s)://`` URLs that resumes downloads
+
+    A download that is interrupted after the server started to send
+    content leaves the partial content at the target path. It is resumed
+    with a ``Range`` request for the missing tail: right away, up to
+    ``datalad.ria.http-retries`` times, and otherwise by the next download
+    to the same path (git-annex keeps the partial content of a failed
+    retrieval in its temporary location). The ``If-Range`` header carries
+    the ``ETag`` (or ``Last-Modified`` date) of the original response, such
+    that the server sends the complete content instead, if it has changed
+    since.
+
+    The validators of partial downloads are kept in a user-level cache,
+    keyed by the target path. Without a validator, or for content with a
+    ``Content-Encoding``, a download starts over.
+
+    All requests to an origin (scheme, host, and port) go through a
+    single ``requests.Session`` with a pool of keep-alive connections,
+    such that only the first requests pay for the TCP and TLS
+    handshakes. Concurrent requests (e.g., of the jobs of an ``ASYNC``
+    special remote) use up to ``datalad.ria.http-connections``
+    connections, and wait for a free one beyond that. The sessions are
+    closed by :meth:`close`.
+
+    A single connection is often limited far below the capacity of the
+    network (e.g., by the server or a proxy). If the server declares
+    support for range requests (``Accept-Ranges: bytes``), content of at
+    least ``datalad.ria.http-ranges-min-size`` bytes is downloaded in
+    ``datalad.ria.http-ranges`` ranges concurrently. Each range is
+    written at its offset into the preallocated target file. A range
+    request fails if the content changed since the first request
+    (``If-Match``), and every range must be delivered completely, before
+    a download is reported as a success.
+    """
+    def __init__(self,
+                 cfg=None,
+                 headers: Dict | None = None,
+                 resume_cache: JsonFileCache | None = None):
+        super().__init__(cfg=cfg, headers=headers)
+        self._resume_cache = resume_cache
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def stat(self,
+             url: str,
+             *,
+             credential: str | None = None,
+             timeout: float | None = None) -> Dict:
+        """Gather information on a URL target via a pooled HEAD request
+
+        See :meth:`datalad_next.url_operations.UrlOperations.stat`
+        for parameter documentation and exception behavior.
+        """
+        auth = DataladAuth(self.cfg, credential=credential)
+        try:
+            with self._get_session(url).head(
+                    url,
+                    headers=self.get_headers(),
+                    auth=auth,
+                    allow_redirects=True,
+                    timeout=timeout,
+            ) as r:
+                _raise_for_status(r, url)
+                props = {
+                    k.lower() if k.lower() == 'content-length'
+                    else f'http-{k.lower()}': v
+                    for k, v in r.headers.items()
+                }
+                props['url'] = r.url
+        except requests.exceptions.RequestException as e:
+            # e.g., the server cannot be reached
+            raise UrlOperationsRemoteError(url, message=str(e)) from e
+        auth.save_entered_credential(
+            context=f"for accessing {url}"
+        )
+        if 'content-length' in props:
+            try:
+                props['content-length'] = int(props['content-length'])
+            except (TypeError, ValueError):
+                pass
+        return props
+
+    def download(self,
+                 from_url: str,
+                 to_path: Path | None,
+                 *,
+                 credential: str | None = None,
+                 hash: list[str] | None = None,
+                 timeout: float | None = None) -> Dict:
+        """Download via HTTP GET request, resuming a partial download
+
+        See :meth:`datalad_next.url_operations.UrlOperations.download`
+        for parameter documentation and exception behavior.
+        """
+        if to_path is None:
+            try:
+                return super().download(
+                    from_url, to_path, credential=credential, hash=hash,
+                    timeout=timeout)
+            except requests.exceptions.RequestException as e:
+                raise UrlOperationsRemoteError(
+                    from_url, message=str(e)) from e
+        to_path = Path(to_path)
+        retries = int(self.cfg.obtain('datalad.ria.http-retries'))
+        cache = self._get_resume_cache()
+        state_key = str(to_path.absolute())
+        state = cache.get(state_key)
+        validator = None
+        if state and state.get('url') == from_url and to_path.exists():
+            validator = state.get('validator')
+        auth = DataladAuth(self.cfg, credential=credential)
+        progress_id = self._get_progress_id(from_url, to_path)
+        self._progress_report_start(
+            progress_id,
+            ('Download %s to %s', from_url, to_path),
+            'downloading',
+            None,
+        )
+        state_saved = [False]
+
+        def save_state(validator):
+            cache.set(state_key, dict(url=from_url, validator=validator))
+            state_saved[0] = True
+
+        attempt = 0
+        try:
+            while True:
+                offset = to_path.stat().st_size if validator else 0
+                if offset:
+                    lgr.debug('Resume download of %s at byte %i',
+                              from_url, offset)
+                try:
+                    props, validator = self._download_range(
+                        from_url, to_path, offset, validator, auth,
+                        hash, timeout, progress_id, save_state)
+                    break
+                except _RESUMABLE_ERRORS as e:
+                    validator = getattr(e, 'ria_validator', validator)
+                    if attempt >= retries:
+                        if validator and to_path.exists():
+                            save_state(validator)
+                        raise UrlOperationsRemoteError(
+                            from_url, message=str(e)) from e
+                    attempt += 1
+                    stats.count('http-retries')
+                    lgr.debug('Download of %s interrupted (%s), retry %i/%i',
+                              from_url, e, attempt, retries)
+                    time.sleep(_RETRY_DELAY * attempt)
+                except requests.exceptions.RequestException as e:
+                    # not worth a retry (e.g., too many redirects)
+                    raise UrlOperationsRemoteError(
+                        from_url, message=str(e)) from e
+        finally:
+            self._progress_report_stop(progress_id, ('Finished download',))
+        if state or state_saved[0]:
+            cache.remove(state_key)
+        auth.save_entered_credential(
+            context=f'download from {from_url}'
+        )
+        return props
+
+    def _download_range(self, from_url, to_path, offset, validator, auth,
+                        hash, timeout, progress_id, save_state):
+        # a single GET request, for the content from `offset` on.
+        # returns the download properties, and the validator of the
+        # content. a resumable error is annotated with the validator.
+        headers = {'accept-encoding': 'identity'}
+        if offset:
+            headers['range'] = f'bytes={offset}-'
+            headers['if-range'] = validator
+        with self._get_session(from_url).get(
+                from_url,
+                stream=True,
+                headers=self.get_headers(headers),
+                auth=auth,
+                timeout=timeout,
+        ) as r:
+            if r.status_code == 416 and offset:
+                if _get_range_total(r) == offset:
+                    lgr.debug('Download of %s to %s was complete',
+                              from_url, to_path)
+                    return self._get_file_props(
+                        to_path, offset, hash), validator
+                # whatever is there, it is not a prefix of the content
+                return self._download_range(
+                    from_url, to_path, 0, None, auth, hash, timeout,
+                    progress_id, save_state)
+            _raise_for_status(r, from_url)
+
+            if r.status_code != 206 or _get_range_start(r) != offset:
+                # the server sends the complete content
+                offset = 0
+            validator = _get_validator(r)
+            encoded = r.headers.get(
+                'content-encoding', 'identity') != 'identity'
+            try:
+                length = int(r.headers.get('content-length'))
+            except (ValueError, TypeError):
+                length = None
+            nranges = self._get_nranges(r, offset, length, validator)
+            if nranges > 1:
+                return self._download_ranges(
+                    r, from_url, to_path, length, validator, nranges,
+                    auth, hash, timeout, progress_id), validator
+            if validator and (length is None or length >= _RESUME_MIN_SIZE):
+                save_state(validator)
+            hasher = self._get_hasher(hash)
+            progress_cb = get_progress_callback()
+            received = offset
+            try:
+                with to_path.open('r+b' if offset else 'wb') as fp:
+                    if offset and hash is not None:
+                        _hash_prefix(fp, offset, hasher)
+                    fp.seek(offset)
+                    fp.truncate()
+                    for chunk in r.raw.stream(
+                            amt=COPY_BUFSIZE, decode_content=encoded):
+                        fp.write(chunk)
+                        hasher.update(chunk)
+                        received += len(chunk)
+                        self._progress_report_update(
+                            progress_id, ('Downloaded chunk',), len(chunk))
+                        if progress_cb:
+                            progress_cb(received)
+            except _RESUMABLE_ERRORS as e:
+                e.ria_validator = validator
+                raise
+            if not encoded and length is not None \
+                    and received - offset < length:
+                e = urllib3.exceptions.ProtocolError(
+                    f'connection closed after {received} bytes')
+                e.ria_validator = validator
+                raise e
+        props = hasher.get_hexdigest()
+        props['content-length'] = received
+        return props, validator
+
+    def _get_nranges(self, r, offset, length, validator) -> int:
+        # number of ranges to download concurrently, for a response `r`
+        # to a request of the complete content
+        if offset or not validator or length is None \
+                or r.headers.get('accept-ranges', '').lower() != 'bytes':
+            return 1
+        nranges = int(self.cfg.obtain('datalad.ria.http-ranges'))
+        min_size = int(self.cfg.obtain('datalad.ria.http-ranges-min-size'))
+        if length < max(min_size, nranges):
+            return 1
+        return nranges
+
+    def _download_ranges(self, r, from_url, to_path, length, validator,
+                         nranges, auth, hash, timeout, progress_id):
+        # the first range is read from the response `r` to the request of
+        # the complete content, all others are requested concurrently, and
+        # written at their offset into the preallocated file. on failure,
+        # only the complete prefix of the content is kept, for resuming.
+        bounds = [length * i // nranges for i in range(nranges + 1)]
+        received = [0] * nranges
+        hasher = self._get_hasher(hash) if hash is not None else None
+        cancel = threading.Event()
+        progress_cb = get_progress_callback()
+        reported = [0]
+
+        def report():
+            # only called in this thread, which may report to git-annex
+            total = sum(received)
+            self._progress_report_update(
+                progress_id, ('Downloaded chunk',), total - reported[0])
+            reported[0] = total
+            if progress_cb:
+                progress_cb(total)
+
+        lgr.debug('Download %s in %i ranges', from_url, nranges)
+        fd = os.open(to_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o666)
+        prefix_hasher = _PrefixHasher(hasher, fd, bounds, received) \
+            if hasher is not None else None
+        try:
+            _preallocate(fd, length)
+            with ThreadPoolExecutor(
+                    max_workers=nranges - 1,
+                    thread_name_prefix='ria-http-range') as executor:
+                futures = [
+                    executor.submit(
+                        self._download_part, from_url, fd, bounds, i,
+                        validator, auth, timeout, received, cancel,
+                        prefix_hasher)
+                    for i in range(1, nranges)
+                ]
+                try:
+                    try:
+                        _write_part(
+                            r.raw.stream(COPY_BUFSIZE, decode_content=False),
+                            fd, bounds, 0, received, cancel, report,
+                            prefix_hasher)
+                    finally:
+                        # the rest of the complete content is left unread,
+                        # closing discards the connection, rather than
+                        # returning it to the pool
+                        r.close()
+                    pending = futures
+                    while pending:
+                        done, pending = futures_wait(
+                            pending, timeout=_RANGES_PROGRESS_INTERVAL,
+                            return_when=FIRST_EXCEPTION)
+                        report()
+                        for f in done:
+                            f.result()
+                    if prefix_hasher is not None:
+                        prefix_hasher.finish()
+                except BaseException:
+                    cancel.set()
+                    raise
+        except (UrlOperationsRemoteError, *_RESUMABLE_ERRORS) as e:
+            os.ftruncate(fd, _get_prefix_size(bounds, received))
+            err = urllib3.exceptions.ProtocolError(
+                f'range download failed: {e}')
+            err.ria_validator = validator
+            raise err from e
+        except BaseException:
+            os.ftruncate(fd, _get_prefix_size(bounds, received))
+            raise
+        finally:
+            os.close(fd)
+        props = hasher.get_hexdigest() if hasher is not None else {}
+        props['content-length'] = length
+        return props
+
+    def _download_part(self, url, fd, bounds, idx, validator, auth, timeout,
+                       received, cancel, prefix_hasher=None):
+        start, end = bounds[idx], bounds[idx + 1]
+        headers = {
+            'accept-encoding': 'identity',
+            'range': f'bytes={start}-{end - 1}',
+        }
+        # any change of the content must fail the request
+        if validator.startswith('"'):
+            headers['if-match'] = validator
+        else:
+            headers['if-unmodified-since'] = validator
+        with self._get_session(url).get(
+                url,
+                stream=True,
+                headers=self.get_headers(headers),
+                auth=auth,
+                timeout=timeout,
+        ) as r:
+            _raise_for_status(r, url)
+            if r.status_code != 206 or _get_range_start(r) != start:
+                raise UrlOperationsRemoteError(
+                    url, message=f'range {start}-{end - 1} not served',
+                    status_code=r.status_code)
+            _write_part(r.raw.stream(COPY_BUFSIZE, decode_content=False),
+                        fd, bounds, idx, received, cancel,
+                        prefix_hasher=prefix_hasher)
+
+    def _get_file_props(self, to_path, size, hash):
+        props = {}
+        if hash is not None:
+            hasher = self._get_hasher(hash)
+            with to_path.open('rb') as fp:
+                _hash_prefix(fp, size, hasher)
+            props = hasher.get_hexdigest()
+        props['content-length'] = size
+        return props
+
+    def _get_hasher(self, hash: list[str] | None) -> NoOpHash | MultiHash:
+        return _get_timed_hasher(hash)
+
+    def close(self) -> None:
+        """Close all sessions, and their connections"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+        for session in sessions:
+            session.close()
+
+    def _get_session(self, url: str) -> requests.Session:
+        parsed = urlparse(url)
+        origin = (parsed.scheme, parsed.netloc)
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                nconnections = int(
+                    self.cfg.obtain('datalad.ria.http-connections'))
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=nconnections,
+                    pool_block=True,
+                )
+                session = requests.Session()
+                session.mount(f'{parsed.scheme}://', adapter)
+                self._sessions[origin] = session
+        return session
+
+    def _get_resume_cache(self) -> JsonFileCache:
+        if self._resume_cache is None:
+            self._resume_cache = JsonFileCache(
+                Path(self.cfg.obtain('datalad.locations.cache'))
+                / 'ria' / 'http-resume.json',
+                ttl=_RESUME_TTL,
+            )
+        return self._resume_cache
+
+
+class RiaUrlOperations(AnyUrlOperations):
+    """Like ``AnyUrlOperations``, but with RIA-specific handlers
+
+    ``ssh://`` URLs are handled by :class:`RiaSshUrlOperations`,
+    ``file://`` URLs by :class:`RiaFileUrlOperations`, ``http(s)://``
+    URLs by :class:`RiaHttpUrlOperations`, and all other URLs by the
+    handlers of ``AnyUrlOperations``.
+    """
+    def __init__(self, cfg=None):
+        super().__init__(cfg=cfg)
+        self._ssh_handler = None
+        self._file_handler = None
+        self._http_handler = None
+
+    def _get_handler(self, url: str) -> UrlOperations:
+        if url.startswith('ssh://'):
+            if self._ssh_handler is None:
+                self._ssh_handler = RiaSshUrlOperations(cfg=self.cfg)
+            return self._ssh_handler
+        if url.startswith('file://'):
+            if self._file_handler is None:
+                self._file_handler = RiaFileUrlOperations(cfg=self.cfg)
+            return self._file_handler
+        if url.startswith(('http://', 'https://')):
+            if self._http_handler is None:
+                self._http_handler = RiaHttpUrlOperations(cfg=self.cfg)
+            return self._http_handler
+        return super()._get_handler(url)
+
+    def delete_many(self, urls: list[str]) -> list:
+        """Delete many URL targets, in batches where a handler supports it
+
+        Returns
+        -------
+        list
+          With an item per URL: the return value of ``delete()``, or the
+          exception it raised.
+        """
+        by_handler = {}
+        for url in urls:
+            handler = self._get_handler(url)
+            by_handler.setdefault(id(handler), (handler, []))[1].append(url)
+        results = {}
+        for handler, handler_urls in by_handler.values():
+            if hasattr(handler, 'delete_many'):
+                results.update(
+                    zip(handler_urls, handler.delete_many(handler_urls)))
+                continue
+            for url in handler_urls:
+                try:
+                    results[url] = handler.delete(url)
+                except Exception as e:
+                    results[url] = e
+        return [results[url] for url in urls]
+
+    def close(self) -> None:
+        """Close any persistent connections of the handlers"""
+        if self._ssh_handler is not None:
+            self._ssh_handler.close()
+        if self._http_handler is not None:
+            self._http_handler.close()
+
+
+# deletes files, and reports a status per file: D(eleted), A(bsent), or
+# F(ailed). the directory of a file is made writable for the deletion,
+# and removed, if it is empty afterwards (or made read-only again).
+_DELETE_SCRIPT = """\
+for f in {paths}; do
+  if [ ! -e "$f" ]; then echo A; continue; fi
+  d="${{f%/*}}"
+  w=1
+  [ -w "$d" ] || {{ w=; chmod u+w "$d" 2>/dev/null; }}
+  if rm -f "$f" 2>/dev/null && [ ! -e "$f" ]; then
+    rmdir "$d" 2>/dev/null || {{ [ -n "$w" ] || chmod u-w "$d"; }}
+    echo D
+  else
+    [ -n "$w" ] || chmod u-w "$d" 2>/dev/null
+    echo F
+  fi
+done
+"""
+
+
+def _open_shell(host: str) -> SSHRemoteIO:
+    with stats.timer('connect'):
+        io = SSHRemoteIO(host)
+    stats.count('ssh-shells')
+    return io
+
+
+class _TimedHash(MultiHash):
+    # the ORA2 special remote only requests checksums to verify retrieved
+    # content, the time spent on them is accounted for as such
+    def update(self, data) -> None:
+        with stats.timer('verify'):
+            super().update(data)
+
+
+def _get_timed_hasher(hash: list[str] | None) -> NoOpHash | MultiHash:
+    return _TimedHash(hash) if hash is not None else NoOpHash()
+
+
+def _quote(path: PurePosixPath) -> str:
+    return sh_quote(str(path))
+
+
+def _raise_for_status(r, url: str) -> None:
+    # fail visible for any non-OK outcome, in terms of UrlOperations
+    try:
+        r.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        if e.response.status_code == 404:
+            raise UrlOperationsResourceUnknown(
+                url, status_code=e.response.status_code) from e
+        raise UrlOperationsRemoteError(
+            url, message=str(e), status_code=e.response.status_code) from e
+
+
+def _get_validator(r) -> str | None:
+    # a validator for If-Range. a weak ETag does not qualify, and the
+    # byte offsets of encoded content are not those of the content
+    if r.headers.get('content-encoding', 'identity') != 'identity':
+        return None
+    etag = r.headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return r.headers.get('last-modified')
+
+
+def _get_range_start(r) -> int | None:
+    # 'Content-Range: bytes <start>-<end>/<total>'
+    try:
+        return int(r.headers['content-range'].split()[1].split('-')[0])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def _get_range_total(r) -> int | None:
+    # 'Content-Range: bytes */<total>'
+    try:
+        return int(r.headers['content-range'].rsplit('/', 1)[1])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def _preallocate(fd: int, size: int) -> None:
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        # not supported on this platform or filesystem
+        os.ftruncate(fd, size)
+
+
+def _write_part(chunks, fd, bounds, idx, received, cancel, report=None,
+                prefix_hasher=None):
+    # write the content of range `idx` at its offset, and count it
+    start, end = bounds[idx], bounds[idx + 1]
+    pos = start
+    for chunk in chunks:
+        if cancel.is_set():
+            raise _RangeCancelled()
+        data = memoryview(chunk)[:end - pos]
+        offset = pos
+        view = data
+        while view:
+            n = os.pwrite(fd, view, pos)
+            pos += n
+            view = view[n:]
+        # only counted once it is in the file
+        received[idx] = pos - start
+        if prefix_hasher is not None:
+            prefix_hasher.written(offset, data)
+        if report:
+            report()
+        if pos >= end:
+            return
+    raise urllib3.exceptions.ProtocolError(
+        f'range {start}-{end - 1} ended after {pos - start} bytes')
+
+
+def _get_prefix_size(bounds, received) -> int:
+    # size of the content that is complete from the start
+    size = 0
+    for idx, n in enumerate(received):
+        size += n
+        if n < bounds[idx + 1] - bounds[idx]:
+            break
+    return size
+
+
+class _RangeCancelled(Exception):
+    pass
+
+
+class _PrefixHasher:
+    """Hash the content of concurrently written ranges, in order
+
+    A chunk that is written right at the end of the hashed prefix is
+    hashed as it is. Content of later ranges that was written before the
+    prefix reached it is read back from the file, once it does.
+    """
+    def __init__(self, hasher, fd, bounds, received):
+        self.hasher = hasher
+        self._fd = fd
+        self._bounds = bounds
+        self._received = received
+        self._lock = threading.Lock()
+        # size of the hashed prefix
+        self._pos = 0
+
+    def written(self, offset: int, data) -> None:
+        with self._lock:
+            if offset == self._pos:
+                self.hasher.update(data)
+                self._pos += len(data)
+            self._catch_up()
+
+    def finish(self) -> None:
+        with self._lock:
+            self._catch_up()
+            if self._pos != self._bounds[-1]:
+                raise urllib3.exceptions.ProtocolError(
+                    f'hashed {self._pos} of {self._bounds[-1]} bytes')
+
+    def _catch_up(self) -> None:
+        end = _get_prefix_size(self._bounds, self._received)
+        while self._pos < end:
+            chunk = os.pread(
+                self._fd, min(COPY_BUFSIZE, end - self._pos), self._pos)
+            if not chunk:
+                raise OSError(f'unexpected end of file at {self._pos}')
+            self.hasher.update(chunk)
+            self._pos += len(chunk)
+
+
+def _hash_prefix(fp, size: int, hasher) -> None:
+    fp.seek(0)
+    remaining = size
+    while remaining:
+        chunk = fp.read(min(COPY_BUFSIZE, remaining))
+        if not chunk:
+            break
+        hasher.update(chunk)
+        remaining -= len(chunk)
@@ -0,0 +1,57 @@
+"""Verification of annex key content during retrieval
+
+Keys of hashing backends (e.g. ``MD5E``, ``SHA256E``) contain the checksum
+of their content. A special remote can compute it while the content is
+written, and reject corrupt content before git-annex sees it. This costs
+no additional disk I/O, whereas git-annex reads the file again after a
+retrieval to verify it (unless ``remote.<name>.annex-verify`` is
+disabled).
+"""
+
+from __future__ import annotations
+
+import re
+
+# git-annex backend names (without the 'E' suffix of the variants that
+# keep the file extension) and the names of the respective algorithms in
+# `hashlib`. BLAKE2 variants with a truncated digest are not supported by
+# `hashlib` constructors without arguments.
+_BACKEND_ALGORITHMS = {
+    'MD5': 'md5',
+    'SHA1': 'sha1',
+    'SHA224': 'sha224',
+    'SHA256': 'sha256',
+    'SHA384': 'sha384',
+    'SHA512': 'sha512',
+    'SHA3_224': 'sha3_224',
+    'SHA3_256': 'sha3_256',
+    'SHA3_384': 'sha3_384',
+    'SHA3_512': 'sha3_512',
+    'BLAKE2B512': 'blake2b',
+    'BLAKE2S256': 'blake2s',
+}
+
+_hexdigest_regex = re.compile(r'^[0-9a-f]+$')
+
+
+def get_key_digest(key: str) -> tuple[str, str] | None:
+    """Return the hash algorithm and the hex digest of a key's content
+
+    Returns ``None``, if the key does not contain a checksum of its
+    content, i.e. for keys of non-hashing backends (e.g. ``WORM``,
+    ``URL``), unsupported hashing backends, and chunks of a key.
+    """
+    fields, sep, name = key.partition('--')
+    if not sep:
+        return None
+    backend, *rest = fields.split('-')
+    if any(f[:1] in ('S', 'C') for f in rest):
+        # a chunk, the checksum is that of the whole content
+        return None
+    if backend.endswith('E'):
+        backend = backend[:-1]
+        name = name.split('.', 1)[0]
+    algorithm = _BACKEND_ALGORITHMS.get(backend)
+    if algorithm is None or not _hexdigest_regex.match(name):
+        return None
+    return algorithm, name
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""Benchmark the ``ora2`` special remote against the legacy ``ora`` remote
+
+Both remotes are driven through git-annex with identical synthetic
+datasets, and the same sequence of operations::
+
+  store     git annex copy --to <remote>
+  retrieve  git annex get --from <remote>     (after dropping local copies)
+  check     git annex fsck --fast --from <remote>
+  remove    git annex drop --from <remote>
+
+Every operation is reported with its throughput, the latency of the keys
+(the time between the completion of consecutive keys), the peak RSS of
+the special remote process(es), and the number of special remote and SSH
+processes that were started. Resource usage is sampled from ``/proc``, and
+is therefore only reported on Linux. Processes that live shorter than the
+sampling interval can be missed.
+
+Datasets are generated for a number of profiles (``--profile``): ``small``
+(many small keys), ``large`` (few huge keys), and ``mixed``. ``--scale``
+multiplies the number of keys of all profiles.
+
+By default, the stores are accessed via ``ria+file://``. With ``--ssh``,
+the benchmark also runs with ``ria+ssh://`` stores. The SSH server is
+configured with the same environment variables as the test suite
+(``DATALAD_TESTS_RIA_SERVER_SSH_HOST``, ``..._SSH_PORT``, ``..._SSH_LOGIN``,
+``..._SSH_PATH``, ``..._LOCALPATH``), e.g., for the SSH server container
+that is used on CI (see ``tools/ci/setup-sshd``). ``..._LOCALPATH`` must be
+a local path of the same directory as ``..._SSH_PATH`` on the server.
+
+Results can be written to a JSON file (``--output``), and compared to those
+of an earlier run (``--baseline``). With ``--max-slowdown``, the exit code
+is non-zero if any ``ora2`` operation took longer than in the baseline by
+more than the given fraction. Example::
+
+  python tools/benchmark_ora_remotes.py --profile small --output new.json \\
+      --baseline release.json --max-slowdown 0.2
+"""
+
+import argparse
+import getpass
+import json
+import os
+from pathlib import Path
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+# name: list of (number of keys, size of each key in bytes)
+PROFILES = {
+    'small': [(2000, 4 * 1024)],
+    'large': [(2, 256 * 1024 ** 2)],
+    'mixed': [(500, 4 * 1024), (50, 1024 ** 2), (2, 64 * 1024 ** 2)],
+}
+# name: git-annex externaltype
+REMOTES = {
+    'ora': 'ora',
+    'ora2': 'ora2',
+}
+OPERATIONS = {
+    'store': ['copy', '--to', '{remote}'],
+    'retrieve': ['get', '--from', '{remote}'],
+    'check': ['fsck', '--fast', '--from', '{remote}'],
+    'remove': ['drop', '--from', '{remote}'],
+}
+# seconds between two samples of the process tree
+_SAMPLE_INTERVAL = 0.05
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n', 1)[0])
+    parser.add_argument(
+        '--profile', choices=sorted(PROFILES), action='append',
+        help='dataset profile(s) to run, default: all')
+    parser.add_argument(
+        '--remote', choices=sorted(REMOTES), action='append',
+        help='special remote(s) to run, default: all')
+    parser.add_argument(
+        '--scale', type=float, default=1.0,
+        help='factor for the number of keys of all profiles')
+    parser.add_argument(
+        '-J', '--jobs', type=int, default=1,
+        help='number of concurrent git-annex jobs')
+    parser.add_argument(
+        '--ssh', action='store_true',
+        help='also run with ria+ssh:// stores')
+    parser.add_argument(
+        '--workdir', type=Path,
+        help='directory for datasets and file:// stores, default: a '
+             'temporary directory')
+    parser.add_argument(
+        '--output', type=Path, help='write results to a JSON file')
+    parser.add_argument(
+        '--baseline', type=Path,
+        help='JSON file with results of an earlier run to compare to')
+    parser.add_argument(
+        '--max-slowdown', type=float,
+        help='fail, if an ora2 operation took longer than in --baseline by '
+             'more than this fraction')
+    args = parser.parse_args(argv)
+
+    transports = ['file'] + (['ssh'] if args.ssh else [])
+    results = []
+    with tempfile.TemporaryDirectory(
+            prefix='ria-bench-', dir=args.workdir) as workdir:
+        workdir = Path(workdir)
+        for profile in args.profile or sorted(PROFILES):
+            source = workdir / f'source-{profile}'
+            make_source_dataset(source, PROFILES[profile], args.scale)
+            for transport in transports:
+                for remote in args.remote or sorted(REMOTES):
+                    print(f'# {profile} {transport} {remote}',
+                          file=sys.stderr)
+                    results.extend(
+                        run_case(workdir, source, profile, transport, remote,
+                                 args.jobs))
+
+    print_results(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare_results(baseline, results, args.max_slowdown)
+        if regressions:
+            print('\nRegressions:', file=sys.stderr)
+            for r in regressions:
+                print(f'  {r}', file=sys.stderr)
+            return 1
+    return 0
+
+
+def run(cmd, cwd, **kwargs):
+    return subprocess.run(
+        cmd, cwd=cwd, check=True, stdout=subprocess.DEVNULL, **kwargs)
+
+
+def make_source_dataset(path, profile, scale):
+    """Create a dataset with random content"""
+    path.mkdir()
+    run(['git', 'init', '-q'], path)
+    run(['git', 'annex', 'init', '-q'], path)
+    # the legacy remote locates a dataset in a store by its ID
+    (path / '.datalad').mkdir()
+    run(['git', 'config', '-f', '.datalad/config', 'datalad.dataset.id',
+         str(uuid.uuid4())], path)
+    run(['git', 'add', '.datalad/config'], path)
+    for nkeys, size in profile:
+        subdir = path / f'{size}'
+        subdir.mkdir()
+        for i in range(max(1, int(nkeys * scale))):
+            with (subdir / f'{i}.dat').open('wb') as f:
+                remaining = size
+                while remaining:
+                    chunk = min(remaining, 1024 ** 2)
+                    f.write(os.urandom(chunk))
+                    remaining -= chunk
+    run(['git', 'annex', 'add', '-q', '.'], path)
+    run(['git', 'commit', '-q', '-m', 'Synthetic content'], path)
+
+
+def get_store(workdir, transport, name, dsid):
+    """Create a store with an empty dataset tree, return its URL"""
+    if transport == 'file':
+        path = workdir / name
+        path.mkdir()
+        url = f'ria+{path.as_uri()}'
+    else:
+        env = os.environ
+        localpath = Path(env['DATALAD_TESTS_RIA_SERVER_LOCALPATH'])
+        sshpath = env.get('DATALAD_TESTS_RIA_SERVER_SSH_PATH', localpath)
+        host = env.get('DATALAD_TESTS_RIA_SERVER_SSH_HOST', 'localhost')
+        port = env.get('DATALAD_TESTS_RIA_SERVER_SSH_PORT', '22')
+        login = env.get(
+            'DATALAD_TESTS_RIA_SERVER_SSH_LOGIN', getpass.getuser())
+        path = localpath / name
+        path.mkdir()
+        port = '' if port == '22' else f':{port}'
+        url = f'ria+ssh://{login}@{host}{port}{sshpath}/{name}'
+    (path / 'ria-layout-version').write_text('1\n')
+    (path / 'error_logs').touch()
+    # like `create-sibling-ria`, the legacy remote does not create it
+    ds_path = path / dsid[:3] / dsid[3:]
+    ds_path.mkdir(parents=True)
+    (ds_path / 'ria-layout-version').write_text('2\n')
+    return url, path
+
+
+def run_case(workdir, source, profile, transport, remote, jobs):
+    name = f'{profile}-{transport}-{remote}'
+    ds = workdir / f'ds-{name}'
+    run(['git', 'clone', '-q', str(source), str(ds)], workdir)
+    run(['git', 'annex', 'init', '-q'], ds)
+    run(['git', 'annex', 'get', '-q', f'-J{max(jobs, 4)}', '.'], ds)
+    # only the benchmarked remote is to be used
+    run(['git', 'annex', 'dead', '-q', 'origin'], ds)
+    run(['git', 'remote', 'remove', 'origin'], ds)
+    files = subprocess.run(
+        ['git', 'annex', 'find', '--format=${bytesize}\\n'],
+        cwd=ds, check=True, capture_output=True, text=True).stdout.split()
+    nkeys = len(files)
+    size = sum(int(f) for f in files)
+    dsid = subprocess.run(
+        ['git', 'config', '-f', '.datalad/config', 'datalad.dataset.id'],
+        cwd=ds, check=True, capture_output=True, text=True).stdout.strip()
+    url, store_path = get_store(workdir, transport, f'store-{name}', dsid)
+    run(['git', 'annex', 'initremote', '-q', 'bench', 'type=external',
+         f'externaltype={REMOTES[remote]}', 'encryption=none',
+         f'url={url}'], ds)
+
+    results = []
+    for op, cmd in OPERATIONS.items():
+        if op == 'retrieve':
+            run(['git', 'annex', 'drop', '-q', '.'], ds)
+        res = measure(
+            ['git', 'annex'] + [c.format(remote='bench') for c in cmd]
+            + [f'-J{jobs}', '--json', '.'],
+            ds)
+        res.update(
+            profile=profile,
+            transport=transport,
+            remote=remote,
+            operation=op,
+            keys=nkeys,
+            bytes=size,
+            throughput=size / res['duration'] if op in (
+                'store', 'retrieve') else None,
+        )
+        results.append(res)
+    shutil.rmtree(store_path, ignore_errors=True)
+    return results
+
+
+def measure(cmd, cwd):
+    """Run a git-annex command, return duration, latencies and resources"""
+    start = time.monotonic()
+    proc = subprocess.Popen(
+        cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        text=True)
+    monitor = ProcessMonitor(proc.pid)
+    monitor.start()
+    completions = []
+    failed = 0
+    for line in proc.stdout:
+        completions.append(time.monotonic())
+        if not json.loads(line).get('success', True):
+            failed += 1
+    stderr = proc.stderr.read()
+    proc.wait()
+    duration = time.monotonic() - start
+    monitor.stop()
+    if proc.returncode or failed:
+        raise RuntimeError(
+            f'{" ".join(cmd)} failed ({failed} keys): {stderr}')
+    latencies = [
+        b - a for a, b in zip([start] + completions[:-1], completions)]
+    return dict(
+        duration=duration,
+        latency_median=statistics.median(latencies) if latencies else None,
+        latency_p95=_percentile(latencies, 0.95),
+        **monitor.summary(),
+    )
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class ProcessMonitor(threading.Thread):
+    """Sample the descendants of a process for their names and peak RSS"""
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        # pid: (name, peak RSS in bytes)
+        self.procs = {}
+        self.supported = Path('/proc/self/status').exists()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while self.supported and not self._stop_event.is_set():
+            self.sample()
+            self._stop_event.wait(_SAMPLE_INTERVAL)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def sample(self):
+        children = {}
+        for p in Path('/proc').iterdir():
+            if not p.name.isdigit():
+                continue
+            try:
+                stat = (p / 'stat').read_text()
+            except OSError:
+                continue
+            # the command name in parentheses can contain spaces
+            ppid = int(stat.rsplit(')', 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(p.name))
+        todo = list(children.get(self.pid, []))
+        while todo:
+            pid = todo.pop()
+            todo.extend(children.get(pid, []))
+            info = _get_proc_info(pid)
+            if info is None:
+                continue
+            name, rss = info
+            prev = self.procs.get(pid, (name, 0))
+            self.procs[pid] = (name, max(prev[1], rss))
+
+    def summary(self):
+        if not self.supported:
+            return dict(remote_procs=None, ssh_procs=None, peak_rss=None)
+        remotes = [rss for name, rss in self.procs.values()
+                   if name.startswith('git-annex-remote-')]
+        return dict(
+            remote_procs=len(remotes),
+            ssh_procs=sum(
+                1 for name, _ in self.procs.values() if name == 'ssh'),
+            peak_rss=max(remotes, default=None),
+        )
+
+
+def _get_proc_info(pid):
+    try:
+        argv = Path(f'/proc/{pid}/cmdline').read_bytes().split(b'\0')
+        status = Path(f'/proc/{pid}/status').read_text()
+    except OSError:
+        return None
+    names = [os.path.basename(a.decode(errors='replace')) for a in argv if a]
+    if not names:
+        return None
+    # special remotes implemented in Python run as `python <script>`
+    name = next(
+        (n for n in names[:2] if n.startswith('git-annex-remote-')),
+        names[0])
+    rss = 0
+    for line in status.splitlines():
+        if line.startswith('VmHWM:'):
+            rss = int(line.split()[1]) * 1024
+    return name, rss
+
+
+def _fmt(value, unit=''):
+    if value is None:
+        return '-'
+    for prefix in ('', 'K', 'M', 'G'):
+        if abs(value) < 1024 or prefix == 'G':
+            return f'{value:.1f}{prefix}{unit}'
+        value /= 1024
+
+
+def print_results(results):
+    header = ('profile', 'transport', 'remote', 'operation', 'keys',
+              'time[s]', 'throughput', 'lat-med[ms]', 'lat-p95[ms]',
+              'peak-rss', 'remotes', 'ssh')
+    rows = [header]
+    for r in results:
+        rows.append((
+            r['profile'], r['transport'], r['remote'], r['operation'],
+            str(r['keys']),
+            f'{r["duration"]:.2f}',
+            _fmt(r['throughput'], 'B/s'),
+            '-' if r['latency_median'] is None
+            else f'{1000 * r["latency_median"]:.1f}',
+            '-' if r['latency_p95'] is None
+            else f'{1000 * r["latency_p95"]:.1f}',
+            _fmt(r['peak_rss'], 'B'),
+            '-' if r['remote_procs'] is None else str(r['remote_procs']),
+            '-' if r['ssh_procs'] is None else str(r['ssh_procs']),
+        ))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for row in rows:
+        print('  '.join(c.ljust(w) for c, w in zip(row, widths)).rstrip())
+
+
+def compare_results(baseline, results, max_slowdown):
+    """Return descriptions of ora2 operations that became slower"""
+    if max_slowdown is None:
+        return []
+
+    def case(r):
+        return r['profile'], r['transport'], r['remote'], r['operation']
+
+    before = {case(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = before.get(case(r))
+        if r['remote'] != 'ora2' or b is None:
+            continue
+        # compare durations, the amount of data can differ with --scale
+        if r['keys'] != b['keys']:
+            continue
+        if r['duration'] > b['duration'] * (1 + max_slowdown):
+            regressions.append(
+                '{} {} {}: {:.2f}s -> {:.2f}s'.format(
+                    r['profile'], r['transport'], r['operation'],
+                    b['duration'], r['duration']))
+    return regressions
+
+
+if __name__ == '__main__':
+    sys.exit(main())